@@ -1,24 +1,62 @@
 """Creates and configures an application"""
 
+import sqlite3
 from flask import Flask
 from flask_restful import Api
+from flask_restful.representations.json import output_json
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from instance.config import app_config
 
-db = SQLAlchemy()
+# committing does not expire the instances, the responses are built from
+# them without reading the rows back
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 
+
+# pysqlite only begins a transaction before a write, the SAVEPOINTs of
+# begin_nested would run outside of it and commit the writes they hold:
+# it is left to SQLAlchemy to begin them
+@event.listens_for(Engine, 'connect')
+def _sqlite_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+@event.listens_for(Engine, 'begin')
+def _sqlite_begin(connection):
+    if connection.dialect.name == 'sqlite':
+        # on the driver's connection, not a query of the request
+        connection.connection.connection.execute('BEGIN')
+
+from app import cache, inventory
 from app.mail import mail
 from app.blueprints.auth import auth
 from app.exceptions import handler
-from app.resources.meals import MealResource, MealListResource
-from app.resources.menu import MenuResource, MenuListResource
-from app.resources.menu_items import MenuItemResource, MenuItemListResource
-from app.resources.orders import OrderResource, OrderListResource
+from app.middlewares import capture
+from app.profiling import memory, queries, sampling, slow_queries, tracing
+from app.resources.meals import (MealResource, MealListResource,
+                                 MealExportResource, MealBatchResource)
+from app.resources.menu import (MenuResource, MenuListResource,
+                                MenuExportResource)
+from app.resources.menu_items import (MenuItemResource, MenuItemListResource,
+                                      MenuItemExportResource,
+                                      MenuItemBatchResource)
+from app.resources.orders import (OrderResource, OrderListResource,
+                                  OrderExportResource, OrderBatchResource,
+                                  CheckoutResource, OrderIntakeResource)
 from app.resources.notifications import (NotificationResource,
-                                         NotificationListResource)
-from app.resources.users import UserResource, UserListResource
+                                         NotificationListResource,
+                                         NotificationExportResource)
+from app.resources.reservations import (ReservationResource,
+                                        ReservationListResource)
+from app.resources.users import (UserResource, UserListResource,
+                                 UserExportResource)
+from app.resources.slow_queries import SlowQueryListResource
+from app.resources.memory import MemoryResource
+from app.resources.cache import CacheResource
 
 
 def create_app(config_name):
@@ -33,23 +71,43 @@ def create_app(config_name):
 
     cors = CORS(app)
     jwt = JWTManager(app)
-    api = Api(app, prefix='/api/v1')
+    api = Api(
+        app, prefix='/api/v1', decorators=[tracing.traced('resource')])
+    api.representations['application/json'] = tracing.traced('json.encode')(
+        output_json)
 
     # register endpoints
     app.register_blueprint(auth)
     api.add_resource(MealResource, '/meals/<int:meal_id>')
     api.add_resource(MealListResource, '/meals')
+    api.add_resource(MealExportResource, '/meals/export')
+    api.add_resource(MealBatchResource, '/meals/batch')
     api.add_resource(MenuResource, '/menus/<int:menu_id>')
     api.add_resource(MenuListResource, '/menus')
+    api.add_resource(MenuExportResource, '/menus/export')
     api.add_resource(MenuItemResource, '/menu-items/<int:menu_item_id>')
     api.add_resource(MenuItemListResource, '/menu-items')
+    api.add_resource(MenuItemExportResource, '/menu-items/export')
+    api.add_resource(MenuItemBatchResource, '/menu-items/batch')
     api.add_resource(OrderResource, '/orders/<int:order_id>')
     api.add_resource(OrderListResource, '/orders')
+    api.add_resource(OrderExportResource, '/orders/export')
+    api.add_resource(OrderBatchResource, '/orders/batch')
+    api.add_resource(CheckoutResource, '/orders/checkout')
+    api.add_resource(OrderIntakeResource, '/orders/intake/<int:intake_id>')
+    api.add_resource(ReservationResource,
+                     '/reservations/<int:reservation_id>')
+    api.add_resource(ReservationListResource, '/reservations')
     api.add_resource(UserResource, '/users/<int:user_id>')
     api.add_resource(UserListResource, '/users')
+    api.add_resource(UserExportResource, '/users/export')
     api.add_resource(NotificationResource,
                      '/notifications/<int:notification_id>')
     api.add_resource(NotificationListResource, '/notifications')
+    api.add_resource(NotificationExportResource, '/notifications/export')
+    api.add_resource(SlowQueryListResource, '/slow-queries')
+    api.add_resource(MemoryResource, '/memory')
+    api.add_resource(CacheResource, '/cache')
 
     # initialize the database
     db.init_app(app)
@@ -59,4 +117,19 @@ def create_app(config_name):
     handler.init_jwt(jwt)
     # mail service
     mail.init_app(app)
+    # cache shared by the workers
+    cache.init_app(app)
+    # write behind of the inventory allotments
+    inventory.init_app(app)
+    # query counts and N+1 detection
+    queries.init_app(app)
+    # request spans and on demand sampling profiles
+    tracing.init_app(app)
+    sampling.init_app(app)
+    # slow queries with their plans
+    slow_queries.init_app(app)
+    # allocations and RSS growth per endpoint
+    memory.init_app(app)
+    # sanitized traffic log, wraps the whole wsgi app
+    capture.init_app(app)
     return app
@@ -22,7 +22,15 @@ def register():
     """Register a user using their username, email and
     password"""
 
-    user = User.create(request.json)
+    user = User.create_unique(request.json)
+    if user is None:
+        return jsonify({
+            'success': False,
+            'message': 'Validation error.',
+            'errors': {
+                'email': ['The email is already taken.']
+            }
+        }), 400
     user.token = str(user.id) + rand_string(size=60)
     user.save()
 
@@ -78,7 +86,7 @@ def verify():
 def make_password_reset():
     """Creates a password reset token"""
     email = request.json['email']
-    user = User.query.filter_by(email=email).first()
+    user = User.find_by_email(email)
 
     token = rand_string(size=60)
     data = {'token': token, 'user_id': user.id}
@@ -112,7 +120,7 @@ def make_password_reset():
 def password_reset():
     """Makes a password reset"""
     reset = PasswordReset.query.filter_by(token=request.json['token']).first()
-    user = User.query.get(reset.user_id)
+    user = User.find(reset.user_id)
     if not user:
         return jsonify({
             'success': False,
@@ -134,7 +142,7 @@ def password_reset():
 def login():
     """Logs in a user using JwT and responds with an access token"""
 
-    user = User.query.filter_by(email=request.json['email']).first()
+    user = User.find_by_email(request.json['email'])
     if not user or not user.validate_password(request.json['password']):
         return jsonify({
             'success': False,
@@ -164,7 +172,7 @@ def login():
 def get_user():
     """Returns the authencicated users details"""
 
-    user = User.query.filter_by(email=get_jwt_identity()).first()
+    user = User.find_by_email(get_jwt_identity())
     return jsonify({
         'success': True,
         'message': 'Successfully retrieved user',
@@ -0,0 +1,61 @@
+"""Caches shared by the workers.
+
+Every gunicorn worker has its own memory, CACHE_BACKEND picks where the
+cached values live:
+
+- `memory`: an LRU of CACHE_MAX_ENTRIES keys in this worker only,
+- `sqlite`: a SQLite file at CACHE_SQLITE_PATH shared by the workers of
+  a host,
+- `redis`: a Redis server at CACHE_REDIS_URL shared by every node,
+- `fake`: an in-process stand-in for the Redis server, for the tests.
+
+Keys are prefixed with CACHE_KEY_PREFIX and expire after
+CACHE_DEFAULT_TTL seconds unless told otherwise. Every worker counts the
+hits, misses and evictions of its lookups, served to admins on
+/api/v1/cache. The changed rows are evicted from the caches of every
+worker through the invalidation bus, see app.cache.bus. The meals and
+menus nested in the responses are kept serialized by every worker, see
+app.cache.catalog.
+"""
+
+from flask import current_app
+from .base import Cache, CacheStats
+from .memory import MemoryCache
+from .sqlite import SQLiteCache
+from .redis import RedisCache, RedisConnection, FakeRedis
+from . import bus, catalog
+
+
+def create(config):
+    """The cache backend configured by `config`"""
+    options = {
+        'default_ttl': config.get('CACHE_DEFAULT_TTL'),
+        'prefix': config.get('CACHE_KEY_PREFIX', ''),
+    }
+    backend = config.get('CACHE_BACKEND', 'memory')
+    if backend == 'memory':
+        return MemoryCache(
+            max_entries=config.get('CACHE_MAX_ENTRIES', 10000), **options)
+    if backend == 'sqlite':
+        return SQLiteCache(
+            config['CACHE_SQLITE_PATH'],
+            max_entries=config.get('CACHE_MAX_ENTRIES', 10000), **options)
+    if backend == 'redis':
+        return RedisCache(
+            RedisConnection(config['CACHE_REDIS_URL'],
+                            timeout=config.get('CACHE_REDIS_TIMEOUT', 1)),
+            **options)
+    if backend == 'fake':
+        return RedisCache(FakeRedis(), **options)
+    raise ValueError('Unknown cache backend: {}'.format(backend))
+
+
+def cache():
+    """The cache of the current application"""
+    return current_app.extensions['cache']
+
+
+def init_app(app):
+    app.extensions['cache'] = create(app.config)
+    bus.init_app(app)
+    catalog.init_app(app)
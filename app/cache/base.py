@@ -0,0 +1,130 @@
+import time
+import pickle
+import threading
+
+
+class CacheStats:
+    """Hits, misses and evictions counted by this worker"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.deletes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, count=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + count)
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'sets': self.sets,
+            'deletes': self.deletes,
+            'evictions': self.evictions,
+        }
+
+
+class Cache:
+    """Interface of the cache backends.
+
+    Keys are strings, values anything that pickles, `ttl` is in seconds
+    and falls back to the backend's `default_ttl`, None never expires.
+    The backends implement the underscored methods on prefixed keys.
+    """
+
+    name = None
+
+    def __init__(self, default_ttl=None, prefix='', clock=time.time):
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self.clock = clock
+        self.stats = CacheStats()
+
+    def get(self, key, default=None):
+        found, value = self._get(self.prefix + key)
+        self.stats.add('hits' if found else 'misses')
+        return value if found else default
+
+    def get_or_set(self, key, fn, ttl=None):
+        """The cached value, computed with `fn()` and cached on a miss"""
+        found, value = self._get(self.prefix + key)
+        self.stats.add('hits' if found else 'misses')
+        if not found:
+            value = fn()
+            self.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.stats.add('sets')
+        self._set(self.prefix + key, value, self._expires_at(ttl))
+
+    def add(self, key, value, ttl=None):
+        """Sets the key unless it is already set, returns whether it did"""
+        added = self._add(self.prefix + key, value, self._expires_at(ttl))
+        if added:
+            self.stats.add('sets')
+        return added
+
+    def delete(self, key):
+        self.stats.add('deletes')
+        self._delete(self.prefix + key)
+
+    def incr(self, key, delta=1):
+        """Adds `delta` to the integer at the key, starting from 0, and
+        returns the result, None when the backend failed. Counters never
+        expire"""
+        return self._incr(self.prefix + key, delta)
+
+    def clear(self):
+        self._clear()
+
+    def size(self):
+        return self._size()
+
+    def info(self):
+        info = self.stats.to_dict()
+        info.update({'backend': self.name, 'size': self.size()})
+        return info
+
+    def _expires_at(self, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        return self.clock() + ttl if ttl else None
+
+    def _expired(self, expires_at):
+        return expires_at is not None and expires_at <= self.clock()
+
+    @staticmethod
+    def dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        return pickle.loads(data)
+
+    def _get(self, key):
+        """(found, value) of the key"""
+        raise NotImplementedError
+
+    def _set(self, key, value, expires_at):
+        raise NotImplementedError
+
+    def _add(self, key, value, expires_at):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _incr(self, key, delta):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _size(self):
+        raise NotImplementedError
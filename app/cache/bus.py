@@ -0,0 +1,289 @@
+"""Invalidation bus between the workers.
+
+Models with `_invalidates` set have their cache keys, `<table>:<id>`,
+evicted once a transaction changing them commits, and the version of
+their table bumped. The worker that
+commits evicts its own cache right away, the others hear of it through
+the bus when CACHE_BUS is set: on PostgreSQL the keys are sent with
+NOTIFY in the transaction itself, so that they are delivered once it
+commits and never when it rolls back, on SQLite they are written to the
+cache_invalidations table that the workers poll every
+CACHE_BUS_POLL_INTERVAL seconds.
+
+Every worker runs a listener thread that evicts the keys from its cache
+when that cache is its own, the shared ones were already evicted by the
+sender, and hands them to the subscribers. The delay between sending a
+message and its eviction is measured per message.
+"""
+
+import os
+import json
+import time
+import select
+import socket
+import logging
+import threading
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# the payload of a NOTIFY must stay under 8000 bytes
+MAX_PAYLOAD = 7500
+
+_subscribers = []
+
+
+def key(table, id):
+    return '{}:{}'.format(table, id)
+
+
+def subscribe(fn):
+    """Calls `fn(table, ids)` with the rows invalidated by any worker"""
+    if fn not in _subscribers:
+        _subscribers.append(fn)
+
+
+def unsubscribe(fn):
+    if fn in _subscribers:
+        _subscribers.remove(fn)
+
+
+def version_key(table):
+    return key(table, 'version')
+
+
+def versions(cache, tables):
+    """Versions of the tables, bumped whenever one of their rows changes,
+    for the keys of what is computed from them"""
+    return [cache.get(version_key(table), 0) for table in tables]
+
+
+def evict(cache, table, ids):
+    """Evicts the rows and bumps the version of their table"""
+    for id in ids:
+        cache.delete(key(table, id))
+    cache.incr(version_key(table))
+
+
+def _notify(table, ids):
+    for fn in _subscribers:
+        fn(table, ids)
+
+
+def invalidate(session, table, ids):
+    """Evicts the rows from the caches once the session commits, no
+    `ids` for rows written without knowing them"""
+    ids = [str(id) for id in ids]
+    pending = session.info.setdefault('cache_invalidations', {})
+    pending.setdefault(table, set()).update(ids)
+    bus = current_app.extensions.get('cache_bus') \
+        if has_app_context() else None
+    if bus is not None:
+        bus.publish(session.connection(), table, ids)
+
+
+def _after_flush(session, flush_context):
+    changed = {}
+    for instance in list(session.new) + list(session.dirty) + \
+            list(session.deleted):
+        if getattr(instance, '_invalidates', False):
+            changed.setdefault(instance.__tablename__, set()).add(
+                instance.cache_id())
+    for table, ids in changed.items():
+        invalidate(session, table, ids)
+
+
+def _after_commit(session):
+    pending = session.info.pop('cache_invalidations', None)
+    if not pending or not has_app_context():
+        return
+    cache = current_app.extensions.get('cache')
+    # the transaction committed, a failing cache must not fail the request
+    for table, ids in pending.items():
+        try:
+            evict(cache, table, ids)
+            _notify(table, ids)
+        except Exception:
+            logger.exception('Evicting %s from the cache failed', table)
+
+
+def _after_rollback(session):
+    session.info.pop('cache_invalidations', None)
+
+
+def listen():
+    """Hooks the invalidations into the sessions, only once"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+
+
+class InvalidationBus:
+    """Sends the invalidations of this worker and applies those of the
+    others"""
+
+    def __init__(self, app, channel='cache_invalidation', poll_interval=0.5,
+                 retention=60, window=1000):
+        self.app = app
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.published = 0
+        self.received = 0
+        self.lags = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @staticmethod
+    def worker():
+        return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    def _messages(self, table, ids):
+        """Compact payloads of the invalidated ids, split to fit NOTIFY"""
+        messages = []
+        chunk = []
+        size = 0
+        for id in ids:
+            if chunk and size + len(id) + 3 > MAX_PAYLOAD - 200:
+                messages.append(chunk)
+                chunk = []
+                size = 0
+            chunk.append(id)
+            size += len(id) + 3
+        if chunk or not messages:
+            messages.append(chunk)
+        return [json.dumps({'w': self.worker(), 't': table, 'k': chunk,
+                            's': time.time()}, separators=(',', ':'))
+                for chunk in messages]
+
+    def publish(self, connection, table, ids):
+        """Sends the invalidation in the transaction of `connection`"""
+        postgres = connection.dialect.name == 'postgresql'
+        for payload in self._messages(table, ids):
+            if postgres:
+                connection.execute(
+                    text('SELECT pg_notify(:channel, :payload)'),
+                    channel=self.channel, payload=payload)
+            else:
+                connection.execute(
+                    text('INSERT INTO cache_invalidations (payload, sent_at) '
+                         'VALUES (:payload, :sent_at)'),
+                    payload=payload, sent_at=time.time())
+            with self._lock:
+                self.published += 1
+
+    def receive(self, payload):
+        message = json.loads(payload)
+        if message['w'] == self.worker():
+            return
+        cache = self.app.extensions['cache']
+        # shared caches were evicted by the sender
+        if cache.name == 'memory':
+            evict(cache, message['t'], message['k'])
+        with self.app.app_context():
+            _notify(message['t'], message['k'])
+        with self._lock:
+            self.received += 1
+            self.lags.append(time.time() - message['s'])
+
+    def start(self):
+        """Starts the listener of this worker, once per process"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='cache-invalidation', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            engine = db.engine
+        while True:
+            try:
+                if engine.dialect.name == 'postgresql':
+                    self._listen(engine)
+                else:
+                    self._poll(engine)
+            except Exception:
+                logger.exception('Cache invalidation listener failed')
+                time.sleep(1)
+
+    def _listen(self, engine):
+        """Waits for the NOTIFY of the other workers"""
+        fairy = engine.raw_connection()
+        fairy.detach()
+        connection = fairy.connection
+        try:
+            connection.autocommit = True
+            connection.cursor().execute('LISTEN ' + self.channel)
+            while True:
+                if select.select([connection], [], [], 5) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    self.receive(connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+    def _poll(self, engine):
+        """Reads the invalidations written by the other workers"""
+        with engine.connect() as connection:
+            last = connection.execute(text(
+                'SELECT MAX(id) FROM cache_invalidations')).scalar() or 0
+        purged_at = time.time()
+        while True:
+            time.sleep(self.poll_interval)
+            with engine.connect() as connection:
+                rows = connection.execute(text(
+                    'SELECT id, payload FROM cache_invalidations '
+                    'WHERE id > :last ORDER BY id'), last=last).fetchall()
+                # every worker read them by now
+                if time.time() - purged_at >= self.retention:
+                    purged_at = time.time()
+                    connection.execute(text(
+                        'DELETE FROM cache_invalidations '
+                        'WHERE sent_at < :before'),
+                        before=purged_at - self.retention)
+            for id, payload in rows:
+                last = id
+                self.receive(payload)
+
+    def stats(self):
+        """Messages sent and received by this worker, with the delivery
+        lag in milliseconds"""
+        with self._lock:
+            lags = sorted(self.lags)
+        stats = {'published': self.published, 'received': self.received}
+        if lags:
+            stats.update({
+                'lag_p50': round(lags[len(lags) // 2] * 1000, 2),
+                'lag_p95': round(lags[int(len(lags) * 0.95)] * 1000, 2),
+                'lag_max': round(lags[-1] * 1000, 2),
+            })
+        return stats
+
+
+def init_app(app):
+    """Evicts the changed rows on commit, and from the other workers
+    through the bus when CACHE_BUS is set"""
+    listen()
+    if not app.config.get('CACHE_BUS'):
+        return
+
+    bus = InvalidationBus(
+        app,
+        channel=app.config.get('CACHE_BUS_CHANNEL', 'cache_invalidation'),
+        poll_interval=app.config.get('CACHE_BUS_POLL_INTERVAL', 0.5))
+    app.extensions['cache_bus'] = bus
+
+    @app.before_request
+    def start_cache_bus():
+        bus.start()
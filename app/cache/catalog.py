@@ -0,0 +1,171 @@
+"""Serialized meals and menus, kept in the memory of every worker.
+
+They change a few times a day and are nested in every menu item and
+order, `lookup(Meal, id)` returns the `to_dict` of the row without a
+query once its table is loaded. The first lookup of a table loads all of
+its rows, later ones read the rows missing through. The rows invalidated
+by app.cache.bus are dropped and read again, a table invalidated without
+ids, or not refreshed for CATALOG_CACHE_REFRESH_INTERVAL seconds, reads
+the rows updated since the latest it holds. Every change bumps the
+version of the table.
+
+The rows are read in a session of their own, the cache only holds what
+was committed.
+"""
+
+import time
+import threading
+from datetime import timedelta
+from flask import current_app, has_app_context
+from sqlalchemy.orm import Session
+from app import db
+from . import bus
+
+# updated_at is the start of the writing transaction, the rows committed
+# after a refresh may be older than the latest it read
+OVERLAP = timedelta(seconds=60)
+
+
+class CatalogTable:
+    """The serialized rows of a model, by id"""
+
+    def __init__(self, model):
+        self.model = model
+        self.rows = {}
+        self.version = 0
+        self.loaded = False
+        # the latest updated_at read, and when
+        self.watermark = None
+        self.refreshed_at = 0
+        self.stale = False
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def _read(self, criterion=None):
+        session = Session(bind=db.engine)
+        try:
+            query = session.query(self.model)
+            if criterion is not None:
+                query = query.filter(criterion)
+            return [(row.id, row.updated_at, row.to_dict()) for row in query]
+        finally:
+            session.close()
+
+    def _store(self, rows):
+        for id, updated_at, row in rows:
+            self.rows[id] = row
+            if updated_at is not None and (
+                    self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+        self.version += 1
+
+    def load(self):
+        """Reads every row"""
+        rows = self._read()
+        with self._lock:
+            self.rows = {}
+            self.watermark = None
+            self._store(rows)
+            self.loaded = True
+            self.stale = False
+            self.refreshed_at = time.time()
+
+    def refresh(self):
+        """Reads the rows updated since the latest one held"""
+        criterion = None
+        if self.watermark is not None:
+            criterion = self.model.updated_at >= self.watermark - OVERLAP
+        rows = self._read(criterion)
+        with self._lock:
+            self._store(rows)
+            self.stale = False
+            self.refreshed_at = time.time()
+            self.refreshes += 1
+
+    def get(self, id, refresh_interval):
+        if not self.loaded:
+            self.load()
+        elif self.stale or \
+                time.time() - self.refreshed_at >= refresh_interval:
+            self.refresh()
+        row = self.rows.get(id)
+        if row is not None:
+            self.hits += 1
+            return row
+        self.misses += 1
+        rows = self._read(self.model.id == id)
+        with self._lock:
+            if rows:
+                self._store(rows)
+        return self.rows.get(id)
+
+    def invalidate(self, ids):
+        with self._lock:
+            if ids:
+                for id in ids:
+                    self.rows.pop(int(id), None)
+            else:
+                self.stale = True
+            self.version += 1
+
+    def info(self):
+        return {
+            'rows': len(self.rows),
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
+
+
+class CatalogCache:
+    """The tables of the catalog, loaded on their first lookup"""
+
+    def __init__(self, refresh_interval=60):
+        self.refresh_interval = refresh_interval
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, model):
+        name = model.__tablename__
+        if name not in self.tables:
+            with self._lock:
+                self.tables.setdefault(name, CatalogTable(model))
+        return self.tables[name]
+
+    def lookup(self, model, id):
+        row = self.table(model).get(id, self.refresh_interval)
+        return dict(row) if row is not None else None
+
+    def invalidate(self, table, ids):
+        if table in self.tables:
+            self.tables[table].invalidate(ids)
+
+    def info(self):
+        return {name: table.info() for name, table in self.tables.items()}
+
+
+def lookup(model, id):
+    """The serialized row of `model` with `id`, None when missing, or
+    when CATALOG_CACHE is not set"""
+    catalog = current_app.extensions.get('catalog_cache')
+    if catalog is None or id is None:
+        return None
+    return catalog.lookup(model, id)
+
+
+def _invalidated(table, ids):
+    catalog = current_app.extensions.get('catalog_cache') \
+        if has_app_context() else None
+    if catalog is not None:
+        catalog.invalidate(table, ids)
+
+
+def init_app(app):
+    if not app.config.get('CATALOG_CACHE'):
+        return
+    app.extensions['catalog_cache'] = CatalogCache(
+        refresh_interval=app.config.get('CATALOG_CACHE_REFRESH_INTERVAL', 60))
+    bus.subscribe(_invalidated)
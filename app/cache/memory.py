@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from .base import Cache
+
+
+class MemoryCache(Cache):
+    """LRU cache in the memory of this worker, holding at most
+    `max_entries` keys. Values are kept as they are, not copied"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=10000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        # {key: (expires_at, value)}, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if self._expired(entry[0]):
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        if evicted:
+            self.stats.add('evictions', evicted)
+
+    def _set(self, key, value, expires_at):
+        with self._lock:
+            self._store(key, value, expires_at)
+
+    def _add(self, key, value, expires_at):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                return False
+            self._store(key, value, expires_at)
+            return True
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _incr(self, key, delta):
+        with self._lock:
+            entry = self._entries.get(key)
+            value = delta
+            if entry is not None and not self._expired(entry[0]):
+                value += entry[1]
+            self._store(key, value, None)
+            return value
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _size(self):
+        with self._lock:
+            return len(self._entries)
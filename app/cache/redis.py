@@ -0,0 +1,251 @@
+import os
+import time
+import socket
+import fnmatch
+import logging
+import threading
+from urllib.parse import urlparse
+from .base import Cache
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    """Error reply of the server"""
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+def encode(*args):
+    """The RESP request of a command"""
+    parts = [b'*' + _to_bytes(len(args)) + b'\r\n']
+    for arg in args:
+        arg = _to_bytes(arg)
+        parts.append(b'$' + _to_bytes(len(arg)) + b'\r\n' + arg + b'\r\n')
+    return b''.join(parts)
+
+
+def read_reply(stream):
+    """Reads one RESP reply from the file-like `stream`"""
+    line = stream.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('Connection closed by the server')
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+':
+        return body.decode('utf-8')
+    if kind == b'-':
+        raise RedisError(body.decode('utf-8'))
+    if kind == b':':
+        return int(body)
+    if kind == b'$':
+        length = int(body)
+        if length < 0:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        length = int(body)
+        if length < 0:
+            return None
+        return [read_reply(stream) for _ in range(length)]
+    raise RedisError('Unknown reply: {!r}'.format(line))
+
+
+class RedisConnection:
+    """Speaks the Redis protocol to the server at `url`,
+    redis://[:password@]host[:port][/db], over one socket per thread"""
+
+    def __init__(self, url='redis://localhost:6379/0', timeout=1):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection(
+            (self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.stream = sock.makefile('rb')
+        self._local.pid = os.getpid()
+        if self.password:
+            self._send('AUTH', self.password)
+        if self.db:
+            self._send('SELECT', self.db)
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            self._local.stream.close()
+            sock.close()
+        self._local.sock = None
+
+    def _send(self, *args):
+        self._local.sock.sendall(encode(*args))
+        return read_reply(self._local.stream)
+
+    def execute(self, *args):
+        # sockets do not survive the fork of the gunicorn workers
+        if getattr(self._local, 'sock', None) is None or \
+                self._local.pid != os.getpid():
+            self._connect()
+        try:
+            return self._send(*args)
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+
+class FakeRedis:
+    """In-process stand-in for a Redis server, for the tests. Knows the
+    commands RedisCache sends"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        # {key: (value, expires_at)}
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and \
+                entry[1] <= self.clock():
+            del self._data[key]
+            entry = None
+        return entry
+
+    def execute(self, command, *args):
+        args = [_to_bytes(arg) for arg in args]
+        with self._lock:
+            return getattr(self, '_' + command.lower())(*args)
+
+    def _ping(self):
+        return 'PONG'
+
+    def _get(self, key):
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    def _set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        expires_at = None
+        if b'PX' in options:
+            expires_at = self.clock() + int(
+                options[options.index(b'PX') + 1]) / 1000
+        if b'NX' in options and self._live(key):
+            return None
+        self._data[key] = (value, expires_at)
+        return 'OK'
+
+    def _del(self, *keys):
+        return sum(1 for key in keys if self._data.pop(key, None))
+
+    def _incrby(self, key, delta):
+        entry = self._live(key)
+        value = int(entry[0] if entry else 0) + int(delta)
+        self._data[key] = (_to_bytes(value), entry[1] if entry else None)
+        return value
+
+    def _scan(self, cursor, *options):
+        match = b'*'
+        if b'MATCH' in options:
+            match = options[options.index(b'MATCH') + 1]
+        keys = [key for key in list(self._data)
+                if self._live(key) and fnmatch.fnmatchcase(
+                    key.decode('utf-8'), match.decode('utf-8'))]
+        return [b'0', keys]
+
+    def _dbsize(self):
+        return sum(1 for key in list(self._data) if self._live(key))
+
+    def _info(self, *sections):
+        return b'# Stats\r\nevicted_keys:0\r\n'
+
+
+class RedisCache(Cache):
+    """Cache on a Redis server shared by every node. The values are
+    pickled, the counters of `incr` are plain Redis integers. Commands
+    failing on the connection are logged: lookups miss, writes and
+    increments are skipped and adds do not add"""
+
+    name = 'redis'
+
+    def __init__(self, connection, **kwargs):
+        super().__init__(**kwargs)
+        self.connection = connection
+
+    def _px(self, expires_at):
+        return ['PX', max(int((expires_at - self.clock()) * 1000), 1)] \
+            if expires_at else []
+
+    def _get(self, key):
+        try:
+            data = self.connection.execute('GET', key)
+        except (OSError, ConnectionError) as ex:
+            logger.warning('Cache lookup failed: %s', ex)
+            return False, None
+        if data is None:
+            return False, None
+        # pickles start with the protocol opcode, counters with a digit
+        if data[:1] != b'\x80':
+            return True, int(data)
+        return True, self.loads(data)
+
+    def _set(self, key, value, expires_at):
+        try:
+            self.connection.execute(
+                'SET', key, self.dumps(value), *self._px(expires_at))
+        except (OSError, ConnectionError) as ex:
+            logger.warning('Cache write failed: %s', ex)
+
+    def _add(self, key, value, expires_at):
+        try:
+            return self.connection.execute(
+                'SET', key, self.dumps(value),
+                *(self._px(expires_at) + ['NX'])) == 'OK'
+        except (OSError, ConnectionError) as ex:
+            logger.warning('Cache add failed: %s', ex)
+            return False
+
+    def _delete(self, key):
+        try:
+            self.connection.execute('DEL', key)
+        except (OSError, ConnectionError) as ex:
+            logger.warning('Cache delete failed: %s', ex)
+
+    def _incr(self, key, delta):
+        try:
+            return self.connection.execute('INCRBY', key, delta)
+        except (OSError, ConnectionError) as ex:
+            logger.warning('Cache increment failed: %s', ex)
+            return None
+
+    def _clear(self):
+        cursor = b'0'
+        while True:
+            cursor, keys = self.connection.execute(
+                'SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 1000)
+            if keys:
+                self.connection.execute('DEL', *keys)
+            if cursor in (b'0', 0, '0'):
+                return
+
+    def _size(self):
+        """Keys of the whole database, other prefixes included"""
+        return self.connection.execute('DBSIZE')
+
+    def info(self):
+        info = super().info()
+        # keys evicted by the server itself, under maxmemory
+        stats = self.connection.execute('INFO', 'stats') or b''
+        for line in stats.decode('utf-8').splitlines():
+            if line.startswith('evicted_keys:'):
+                info['server_evictions'] = int(line.split(':', 1)[1])
+        return info
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import threading
+from .base import Cache
+
+
+class SQLiteCache(Cache):
+    """Cache in a SQLite file shared by the workers of a host.
+
+    Every process and thread opens its own connection, writers take the
+    database lock with BEGIN IMMEDIATE. Past `max_entries` keys the
+    expired ones then the oldest stored are evicted, checked every
+    `prune_every` sets of a worker.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, max_entries=100000, prune_every=100,
+                 timeout=5, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sets = 0
+        with self._write() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB, expires_at REAL, '
+                'stored_at REAL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_stored_at '
+                'ON cache (stored_at)')
+
+    def _connection(self):
+        # connections do not survive the fork of the gunicorn workers
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _write(self):
+        return _Transaction(self._connection())
+
+    def _get(self, key):
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None or self._expired(row[1]):
+            return False, None
+        return True, self.loads(row[0])
+
+    def _set(self, key, value, expires_at):
+        with self._write() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                (key, self.dumps(value), expires_at, self.clock()))
+        self._sets += 1
+        if self._sets % self.prune_every == 0:
+            self.prune()
+
+    def _add(self, key, value, expires_at):
+        with self._write() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires_at <= ?',
+                (key, self.clock()))
+            return connection.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (key, self.dumps(value), expires_at,
+                 self.clock())).rowcount == 1
+
+    def _delete(self, key):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def _incr(self, key, delta):
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value, expires_at FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            value = delta
+            if row is not None and not self._expired(row[1]):
+                value += self.loads(row[0])
+            connection.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, NULL, ?)',
+                (key, self.dumps(value), self.clock()))
+            return value
+
+    def prune(self):
+        """Evicts the expired keys, then the oldest stored past
+        `max_entries`"""
+        with self._write() as connection:
+            evicted = connection.execute(
+                'DELETE FROM cache WHERE expires_at <= ?',
+                (self.clock(),)).rowcount
+            surplus = connection.execute(
+                'SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+            if surplus > 0:
+                evicted += connection.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                    'ORDER BY stored_at LIMIT ?)', (surplus,)).rowcount
+        if evicted:
+            self.stats.add('evictions', evicted)
+
+    def _clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def _size(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on errors"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, type, value, traceback):
+        self.connection.execute('ROLLBACK' if type else 'COMMIT')
@@ -0,0 +1,222 @@
+"""Bulk import and export of the catalog: meals, menus and menu items.
+
+Rows are read from CSV or NDJSON files, cleaned the way JSON requests are
+and validated in batches with the rules of the matching POST request.
+The valid rows of a batch are written with one multi-row INSERT which
+skips the rows conflicting with existing ones, and the invalid rows are
+reported with their line number without stopping the import.
+
+Menu items may name their meal and menu instead of giving their ids, and
+like the API they are created for today.
+"""
+
+import re
+import csv
+import json
+from datetime import datetime
+from sqlalchemy import func
+from app import db
+from app.cache import bus
+from app.models import Meal, Menu, MenuItem
+from app.requests import meals, menu, menu_items
+from app.utils.export import csv_lines, ndjson_lines
+from app.validation.batch import BatchValidator
+from app.validation.translator import trans
+
+KINDS = {
+    'meals': (Meal, meals.BatchPostRequest, ['name', 'cost', 'img_url']),
+    'menus': (Menu, menu.BatchPostRequest, ['name']),
+    'menu-items': (MenuItem, menu_items.PostRequest,
+                   ['menu', 'meal', 'quantity']),
+}
+FORMATS = ['csv', 'ndjson']
+
+
+def guess_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def read_rows(source, fmt):
+    """Yields (line, row) pairs, row is None when the line is not JSON"""
+    if fmt == 'csv':
+        reader = csv.DictReader(source)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, text in enumerate(source, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = None
+        yield line, row if isinstance(row, dict) else None
+
+
+def clean(row, fields):
+    """Trims strings like clean_json_request and drops unknown and empty
+    fields like JsonRequest"""
+    cleaned = {}
+    for field, value in row.items():
+        if field not in fields:
+            continue
+        if isinstance(value, str):
+            value = re.sub(r'\s+', ' ', value).strip()
+            if value == '':
+                continue
+        cleaned[field] = value
+    return cleaned
+
+
+def coerce(model, row):
+    """Converts the CSV strings of numeric columns, leaving the values
+    that do not convert to fail validation"""
+    for field, value in row.items():
+        column = model.__table__.columns.get(field)
+        if column is None or not isinstance(value, str):
+            continue
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            continue
+        if python_type in (int, float):
+            try:
+                row[field] = python_type(value)
+            except ValueError:
+                pass
+    return row
+
+
+class Importer:
+    """Imports rows of one kind in batches, one commit per batch"""
+
+    def __init__(self, kind, batch_size=1000):
+        self.model, self.request, self.columns = KINDS[kind]
+        self.rules = self.request.rules()
+        self.fields = set(self.rules) | set(self.columns)
+        self.batch_size = batch_size
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def run(self, rows):
+        """Imports the (line, row) pairs, must run in an app context"""
+        batch = []
+        for line, row in rows:
+            if row is None:
+                self.errors.append(
+                    (line, {'row': ['Row must be valid JSON.']}))
+                continue
+            batch.append((line, coerce(self.model, clean(row, self.fields))))
+            if len(batch) == self.batch_size:
+                self._import(batch)
+                batch = []
+        self._import(batch)
+        return self
+
+    def _import(self, batch):
+        if not batch:
+            return
+        if self.model is MenuItem:
+            batch = self._resolve_names(batch)
+
+        rows = [row for _, row in batch]
+        validator = BatchValidator(rows=rows, rules=self.rules)
+        valid = validator.validate()
+        for index, errors in sorted(validator.errors().items()):
+            self.errors.append((batch[index][0], errors))
+
+        if self.model is MenuItem:
+            valid = self._unique_today(batch, valid)
+
+        inserted = self._insert([rows[index] for index in valid])
+        db.session.commit()
+        self.imported += inserted
+        self.skipped += len(valid) - inserted
+
+    def _resolve_names(self, batch):
+        """Replaces meal and menu names with their ids, one query each"""
+        for name, model in [('meal', Meal), ('menu', Menu)]:
+            names = {row[name].lower() for _, row in batch
+                     if isinstance(row.get(name), str)}
+            ids = {}
+            if names:
+                ids = {value.lower(): id for id, value in
+                       model.query.with_entities(model.id, model.name).filter(
+                           func.lower(model.name).in_(names))}
+
+            resolved = []
+            for line, row in batch:
+                if name in row and name + '_id' not in row:
+                    model_id = ids.get(str(row[name]).lower())
+                    if model_id is None:
+                        self.errors.append((line, {
+                            name: [trans('exists', {':field:': name})]}))
+                        continue
+                    row[name + '_id'] = model_id
+                resolved.append((line, row))
+            batch = resolved
+        return batch
+
+    def _unique_today(self, batch, valid):
+        """Keeps a single menu item per meal and menu today"""
+        taken = set(MenuItem.served_today(
+            {batch[index][1]['menu_id'] for index in valid}))
+
+        unique = []
+        for index in valid:
+            line, row = batch[index]
+            pair = (row['menu_id'], row['meal_id'])
+            if pair in taken:
+                self.errors.append(
+                    (line, {'ids': ['Menu item must be unique.']}))
+            else:
+                taken.add(pair)
+                unique.append(index)
+        return unique
+
+    def _insert(self, rows):
+        """One multi-row INSERT skipping conflicting rows, returns the
+        number of rows written"""
+        if not rows:
+            return 0
+        table = self.model.__table__
+        now = datetime.now()
+        columns = [column for column in self.model._fields
+                   if column in table.columns]
+        values = [dict({column: row.get(column) for column in columns},
+                       created_at=now, updated_at=now) for row in rows]
+        if self.model._invalidates:
+            bus.invalidate(db.session, table.name, [])
+        return db.session.execute(
+            self.model.insert_or_ignore(values)).rowcount
+
+
+def export_rows(kind, filters=None, batch_size=1000):
+    """Yields the rows of a kind in the columns the importer reads"""
+    if kind == 'meals':
+        query = db.session.query(Meal.name, Meal.cost, Meal.img_url).order_by(
+            Meal.id)
+    elif kind == 'menus':
+        query = db.session.query(Menu.name).order_by(Menu.id)
+    else:
+        query = MenuItem._apply_db_filters(
+            MenuItem.query, filters).join(MenuItem.menu).join(
+                MenuItem.meal).with_entities(
+                    Menu.name, Meal.name, MenuItem.quantity).order_by(
+                        MenuItem.id)
+    columns = KINDS[kind][2]
+    for row in query.yield_per(batch_size):
+        yield dict(zip(columns, row))
+
+
+def export(kind, out, fmt='csv', filters=None, batch_size=1000):
+    """Writes the rows of a kind to the `out` file, returns their count"""
+    count = 0
+    rows = export_rows(kind, filters, batch_size)
+    # both writers yield one chunk per row, the header comes with the first
+    lines = csv_lines(rows) if fmt == 'csv' else ndjson_lines(rows)
+    for line in lines:
+        out.write(line)
+        count += 1
+    return count
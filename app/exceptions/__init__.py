@@ -4,3 +4,9 @@ class ValidationException(Exception):
         self.errors = errors
 
 
+class ConflictException(Exception):
+    def __init__(self, version):
+        Exception.__init__(self)
+        self.version = version
+
+
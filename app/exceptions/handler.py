@@ -3,9 +3,11 @@
 
 import json
 from flask import jsonify
+from sqlalchemy.orm.exc import StaleDataError
+from app import db
 from app.models import Blacklist
 from werkzeug.exceptions import default_exceptions
-from . import ValidationException
+from . import ValidationException, ConflictException
 
 
 def init_app(app):
@@ -28,11 +30,29 @@ def init_app(app):
                 'errors': ex.errors,
             }), 400
 
+        @app.errorhandler(ConflictException)
+        def conflict_exceptions(ex):
+            """The If-Match header does not match the current version"""
+            resp = jsonify({
+                'success': False,
+                'message': 'The resource was changed by another request.',
+            })
+            resp.headers['ETag'] = '"{}"'.format(ex.version)
+            return resp, 409
+
+        @app.errorhandler(StaleDataError)
+        def stale_data_exceptions(ex):
+            """The row was changed by another request while updating"""
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': 'The resource was changed by another request.',
+            }), 409
+
 
 def init_jwt(jwt):
     """Handles the JWT blacklists for logged out users."""
     @jwt.token_in_blacklist_loader
     def check_token_in_blacklist(decrypted_token):
-        return Blacklist.query.filter_by(
-                    token=decrypted_token['jti']).first() is not None
+        return Blacklist.is_revoked(decrypted_token['jti'])
 
@@ -0,0 +1,271 @@
+"""Generates large synthetic datasets for scale testing.
+
+Rows are produced in batches from a seeded random generator, so the same
+arguments always give the same data, and are bulk loaded with COPY on
+PostgreSQL or executemany everywhere else. Primary keys are assigned here
+so that related rows can be written without reading anything back.
+
+Meal popularity follows a Zipf distribution: a few meals get most of the
+orders, the way a handful of dishes sell out at lunch.
+"""
+
+import io
+import csv
+import random
+from itertools import accumulate
+from datetime import datetime, date, time, timedelta
+from passlib.hash import bcrypt
+from sqlalchemy import func
+from app import db
+from app.models import (User, UserType, Meal, Menu, MenuItem, Order,
+                        OrderStatus, Notification)
+
+DISHES = ['ugali', 'beef', 'rice', 'chapati', 'pilau', 'githeri', 'sukuma',
+          'chicken', 'fish', 'beans', 'matoke', 'mukimo', 'samosa', 'chips',
+          'kachumbari', 'mandazi', 'tea', 'coffee', 'juice', 'soda']
+MENUS = ['Breakfast', 'Lunch', 'Dinner', 'Snacks', 'Drinks', 'Vegetarian',
+         'Specials', 'Kids']
+
+
+def unique_name(index, names):
+    """A unique alphabetic name, the validator only accepts letters"""
+    name = names[index % len(names)]
+    index //= len(names)
+    suffix = ''
+    while index:
+        index -= 1
+        suffix = chr(ord('a') + index % 26) + suffix
+        index //= 26
+    return '{} {}'.format(name, suffix).strip()
+
+
+class BulkWriter:
+    """Writes batches of rows to a table in the current transaction"""
+
+    def __init__(self, model):
+        self.table = model.__table__
+        self.connection = db.session.connection()
+        self.dialect = self.connection.dialect.name
+
+    def next_id(self):
+        """The first id free after the existing rows"""
+        return (db.session.query(func.max(self.table.c.id)).scalar() or 0) + 1
+
+    def write(self, columns, rows):
+        if not rows:
+            return
+        if self.dialect == 'postgresql':
+            self._copy(columns, rows)
+        else:
+            self.connection.execute(
+                self.table.insert(),
+                [dict(zip(columns, row)) for row in rows])
+
+    def _copy(self, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if value is None else value for value in row])
+        buffer.seek(0)
+        cursor = self.connection.connection.cursor()
+        cursor.copy_expert(
+            'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                self.table.name, ', '.join(columns)), buffer)
+
+    def reset_sequence(self):
+        """Moves the id sequence past the ids written by hand"""
+        if self.dialect == 'postgresql':
+            self.connection.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "(SELECT COALESCE(MAX(id), 1) FROM {0}))".format(
+                    self.table.name))
+
+
+class Generator:
+    """Builds users, meals, a daily menu for every day in `days` and the
+    orders placed on them"""
+
+    def __init__(self, users=1000, admins=10, meals=200, menus=8,
+                 items_per_menu=10, days=365, orders=1000000, stock=100,
+                 rand_seed=42, batch_size=10000, domain='example.com',
+                 password='secret', skew=1.2, progress=print):
+        self.users = users
+        self.admins = min(admins, users)
+        self.meals = meals
+        self.menus = menus
+        self.items_per_menu = min(items_per_menu, meals)
+        self.days = max(days, 1)
+        self.orders = orders
+        self.stock = stock
+        self.batch_size = batch_size
+        self.domain = domain
+        self.password = password
+        self.skew = skew
+        self.progress = progress or (lambda message: None)
+        self.rand = random.Random(rand_seed)
+
+    def email(self, index):
+        return 'user{}@{}'.format(index, self.domain)
+
+    def run(self):
+        """Generates everything in one transaction, must run in an app
+        context"""
+        user_ids = self._users()
+        meal_ids, popularity = self._meals()
+        menu_ids = self._menus()
+        items = self._menu_items(meal_ids, menu_ids, popularity)
+        self._orders(items, user_ids[self.admins:] or user_ids)
+        db.session.commit()
+
+        today = [item for item in items if item[1] == date.today()]
+        today.sort(key=lambda item: item[3], reverse=True)
+        # numbered after the existing users, like their ids
+        emails = [self.email(user_id - 1) for user_id in user_ids]
+        return {
+            'admins': emails[:self.admins],
+            'users': emails[self.admins:],
+            'today_items': [item[0] for item in today],
+        }
+
+    def _batches(self, model, columns, rows, total):
+        """Writes the rows as they are generated, reporting progress"""
+        writer = BulkWriter(model)
+        batch = []
+        written = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                writer.write(columns, batch)
+                written += len(batch)
+                batch = []
+                self.progress('{}: {}/{}'.format(
+                    model.__tablename__, written, total))
+        writer.write(columns, batch)
+        writer.reset_sequence()
+        self.progress('{}: {}/{} done'.format(
+            model.__tablename__, written + len(batch), total))
+
+    def _users(self):
+        first = BulkWriter(User).next_id()
+        password = bcrypt.encrypt(self.password)
+        now = datetime.now()
+        columns = ['id', 'username', 'email', 'password', 'token', 'role',
+                   'created_at', 'updated_at']
+        rows = ((first + index, 'user', self.email(first - 1 + index),
+                 password, '',
+                 UserType.ADMIN if index < self.admins else UserType.USER,
+                 now, now) for index in range(self.users))
+        self._batches(User, columns, rows, self.users)
+        return list(range(first, first + self.users))
+
+    def _meals(self):
+        first = BulkWriter(Meal).next_id()
+        now = datetime.now()
+        columns = ['id', 'name', 'cost', 'img_url', 'created_at',
+                   'updated_at']
+        rows = [(first + index, unique_name(first - 1 + index, DISHES),
+                 self.rand.randint(50, 500), '#', now, now)
+                for index in range(self.meals)]
+        self._batches(Meal, columns, rows, self.meals)
+
+        # zipf weights over a shuffled ranking of the meals
+        ids = [row[0] for row in rows]
+        ranking = list(ids)
+        self.rand.shuffle(ranking)
+        popularity = {meal_id: 1.0 / (rank + 1) ** self.skew
+                      for rank, meal_id in enumerate(ranking)}
+        return ids, popularity
+
+    def _menus(self):
+        first = BulkWriter(Menu).next_id()
+        now = datetime.now()
+        columns = ['id', 'name', 'created_at', 'updated_at']
+        rows = [(first + index, unique_name(first - 1 + index, MENUS),
+                 now, now) for index in range(self.menus)]
+        self._batches(Menu, columns, rows, self.menus)
+        return [row[0] for row in rows]
+
+    def _menu_items(self, meal_ids, menu_ids, popularity):
+        """Every menu gets `items_per_menu` distinct meals every day,
+        returned as (id, day, created_at, popularity) tuples"""
+        first = BulkWriter(MenuItem).next_id()
+        items = []
+        rows = []
+        for offset in range(self.days - 1, -1, -1):
+            day = date.today() - timedelta(days=offset)
+            created = datetime.combine(day, time(6, 0))
+            for menu_id in menu_ids:
+                for meal_id in self.rand.sample(meal_ids,
+                                                self.items_per_menu):
+                    item_id = first + len(rows)
+                    rows.append((item_id, menu_id, meal_id, self.stock, day,
+                                 created, created))
+                    items.append(
+                        (item_id, day, created, popularity[meal_id]))
+        columns = ['id', 'menu_id', 'meal_id', 'quantity', 'served_on',
+                   'created_at', 'updated_at']
+        self._batches(MenuItem, columns, rows, len(rows))
+        return items
+
+    def _orders(self, items, user_ids):
+        """Spreads the orders over the days, mostly around lunch time,
+        with a notification for each"""
+        by_day = {}
+        for item in items:
+            by_day.setdefault(item[1], []).append(item)
+        days = sorted(by_day)
+        cum_weights = {
+            day: list(accumulate(item[3] for item in day_items))
+            for day, day_items in by_day.items()
+        }
+
+        def orders():
+            for index in range(self.orders):
+                day = days[index * len(days) // self.orders]
+                item = self.rand.choices(
+                    by_day[day], cum_weights=cum_weights[day])[0]
+                minutes = int(self.rand.gauss(13 * 60, 60))
+                created = datetime.combine(day, time(0, 0)) + timedelta(
+                    minutes=min(max(minutes, 7 * 60), 21 * 60))
+                if day == date.today():
+                    status = OrderStatus.PENDING
+                else:
+                    status = self.rand.choice(
+                        [OrderStatus.ACCEPTED] * 9 + [OrderStatus.REVOKED])
+                yield (item[0], self.rand.choice(user_ids),
+                       self.rand.randint(1, 3), status, created)
+
+        first_order = BulkWriter(Order).next_id()
+        first_notification = BulkWriter(Notification).next_id()
+        order_columns = ['id', 'menu_item_id', 'user_id', 'quantity',
+                         'status', 'created_at', 'updated_at']
+        notification_columns = ['id', 'user_id', 'title', 'message',
+                                 'created_at', 'updated_at']
+        order_writer = BulkWriter(Order)
+        notification_writer = BulkWriter(Notification)
+
+        order_rows = []
+        notification_rows = []
+        for index, (item_id, user_id, quantity, status, created) in \
+                enumerate(orders()):
+            order_id = first_order + index
+            order_rows.append((order_id, item_id, user_id, quantity, status,
+                               created, created))
+            notification_rows.append((
+                first_notification + index, user_id,
+                'Order(#{}) recieved'.format(order_id),
+                'Your order (#{}) with {} items was successfully '
+                'received.'.format(order_id, quantity), created, created))
+            if len(order_rows) == self.batch_size:
+                order_writer.write(order_columns, order_rows)
+                notification_writer.write(
+                    notification_columns, notification_rows)
+                order_rows = []
+                notification_rows = []
+                self.progress('orders: {}/{}'.format(index + 1, self.orders))
+
+        order_writer.write(order_columns, order_rows)
+        notification_writer.write(notification_columns, notification_rows)
+        order_writer.reset_sequence()
+        notification_writer.reset_sequence()
+        self.progress('orders: {}/{} done'.format(self.orders, self.orders))
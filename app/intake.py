@@ -0,0 +1,174 @@
+"""Asynchronous order intake.
+
+With ORDER_INTAKE on, POST /orders only validates the request and queues
+it as an OrderIntake, answering 202 with the intake to poll. Settlement
+(`manage.py settle_orders`) takes the queued intakes in batches, groups
+them per menu item and allocates the available quantity first come,
+first served: every menu item of a batch is locked and updated once, the
+orders of the batch are inserted with one INSERT and the whole batch is
+committed at once. The users' stock holds on the menu items they
+ordered are taken by the settlement, see app.reservations.
+
+Settled intakes point to their order, rejected ones keep the reason and
+both notify their user, clients either poll GET /orders/intake/<id>,
+every Retry-After seconds while queued, or watch their notifications.
+Nothing waits for the settlement inside a request.
+"""
+
+import time
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import make_transient_to_detached
+from app import db, reservations
+from app.models import (IntakeStatus, OrderIntake, Order, OrderStatus,
+                        MenuItem, Notification)
+
+
+def unavailable(available):
+    """The quantity error of a menu item left with `available` meals"""
+    if available > 0:
+        return 'Only {} meal(s) are available.'.format(available)
+    return 'No more orders can be made on this meal.'
+
+
+def rejected_notification(intake):
+    meal = intake.menu_item.meal.name if intake.menu_item else 'a meal'
+    message = """Your order for {} with {} items could not be
+        placed. {}""".format(meal, intake.quantity, intake.error)
+    return Notification.make({
+        'user_id': intake.user_id,
+        'title': 'Order rejected',
+        'message': message
+    })
+
+
+def _claim(batch_size):
+    """The oldest queued intakes, locked so that concurrent workers claim
+    different ones"""
+    return OrderIntake.query.filter_by(
+        status=IntakeStatus.QUEUED).order_by(OrderIntake.id).limit(
+            batch_size).with_for_update(
+                skip_locked=True).populate_existing().all()
+
+
+def _attach(intake, row):
+    """Sets the order inserted for the intake, as if loaded"""
+    order = Order()
+    for column in Order.__table__.columns:
+        setattr(order, column.name, row[column.name])
+    make_transient_to_detached(order)
+    db.session.add(order)
+    intake.order = order
+
+
+def _insert_orders(settled):
+    """Inserts the orders of the settled intakes in one statement, a
+    multi-row INSERT returning their rows on PostgreSQL, an executemany
+    of rows numbered here elsewhere"""
+    if not settled:
+        return
+    table = Order.__table__
+    if db.session.connection().dialect.name != 'postgresql':
+        # flushing the settled intakes takes SQLite's write lock, no
+        # other transaction inserts orders until the batch commits
+        db.session.flush()
+        next_id = (db.session.query(func.max(table.c.id)).scalar() or 0) + 1
+        now = datetime.now()
+        rows = [{
+            'id': next_id + index,
+            'quantity': intake.quantity,
+            'status': OrderStatus.PENDING,
+            'menu_item_id': intake.menu_item_id,
+            'user_id': intake.user_id,
+            'version': 1,
+            'created_at': now,
+            'updated_at': now,
+        } for index, intake in enumerate(settled)]
+        db.session.execute(table.insert(), rows)
+        for intake, row in zip(settled, rows):
+            _attach(intake, row)
+        return
+
+    rows = db.session.execute(table.insert().values([{
+        'menu_item_id': intake.menu_item_id,
+        'user_id': intake.user_id,
+        'quantity': intake.quantity,
+    } for intake in settled]).returning(*table.columns)).fetchall()
+
+    # the orders of the same user, menu item and quantity are alike, any
+    # of their rows does
+    returned = {}
+    for row in rows:
+        returned.setdefault(
+            (row.user_id, row.menu_item_id, row.quantity), []).append(row)
+    for intake in settled:
+        _attach(intake, returned[
+            (intake.user_id, intake.menu_item_id, intake.quantity)].pop())
+
+
+def settle(batch_size=500):
+    """Settles a batch of queued intakes in one transaction, returns the
+    number of (settled, rejected) intakes"""
+    from app.resources.orders import received_notification
+
+    intakes = _claim(batch_size)
+    if not intakes:
+        db.session.rollback()
+        return 0, 0
+
+    # lock the menu items in id order like the checkout does...
+    menu_items = {menu_item.id: menu_item for menu_item in
+                  MenuItem.query.filter(MenuItem.id.in_(
+                      {intake.menu_item_id for intake in intakes})).order_by(
+                          MenuItem.id).with_for_update().populate_existing()}
+
+    # the users' holds are theirs to order, what is still held for the
+    # intakes coming later in the batch is not available to the others...
+    held = reservations.take(
+        (intake.user_id, intake.menu_item_id) for intake in intakes)
+    pending = {}
+    for (_, menu_item_id), quantity in held.items():
+        pending[menu_item_id] = pending.get(menu_item_id, 0) + quantity
+
+    # first come, first served per menu item...
+    now = datetime.now()
+    settled = []
+    rejected = []
+    for intake in intakes:
+        intake.settled_at = now
+        menu_item = menu_items.get(intake.menu_item_id)
+        own = held.pop((intake.user_id, intake.menu_item_id), 0)
+        available = 0
+        if menu_item is not None:
+            pending[menu_item.id] = pending.get(menu_item.id, 0) - own
+            available = menu_item.available() - pending[menu_item.id]
+        if available < intake.quantity:
+            intake.status = IntakeStatus.REJECTED
+            intake.error = unavailable(available)
+            rejected.append(intake)
+            continue
+        menu_item.quantity -= intake.quantity
+        intake.status = IntakeStatus.SETTLED
+        settled.append(intake)
+
+    # the orders get their ids, needed by the notifications...
+    _insert_orders(settled)
+    notifications = [received_notification(intake.order, intake.user_id)
+                     for intake in settled]
+    notifications += [rejected_notification(intake) for intake in rejected]
+    Notification.save_all(notifications)
+    return len(settled), len(rejected)
+
+
+def work(batch_size=500, interval=0.2, once=False, report=None):
+    """Settles batches until the queue is empty when `once`, otherwise
+    forever, sleeping `interval` seconds whenever the queue is empty"""
+    while True:
+        settled, rejected = settle(batch_size)
+        if report and (settled or rejected):
+            report(settled, rejected)
+        if settled or rejected:
+            continue
+        if once:
+            return
+        time.sleep(interval)
@@ -0,0 +1,248 @@
+"""Sharded inventory for hot menu items.
+
+With INVENTORY_ENGINE on, POST /orders does not update the menu item row
+of every order. Each worker leases a sub-allotment of INVENTORY_ALLOTMENT
+meals (or what it needs, if more) from the menu item, moving it to the
+menu item's `allotted` quantity, and sells from it. Its remaining
+quantity is kept in the worker's memory, the sale itself only bumps
+`consumed` on the worker's own InventoryLease row in the order's
+transaction, so workers never wait for each other on a menu item.
+
+A timer thread of every worker writes behind what it sold to
+`menu_items.quantity` every INVENTORY_FLUSH_INTERVAL seconds, one update
+per menu item, heartbeats its leases and reconciles the abandoned ones,
+whether or not the worker is serving orders. A worker that cannot lease
+enough takes back what the leases of the other workers did not sell,
+right away in its own transaction, and nothing in the request waits.
+
+The leases are the ledger: leases not heartbeated for
+INVENTORY_LEASE_TIMEOUT seconds, left by crashed workers, are reconciled
+by the other workers or by `manage.py reconcile_inventory`, writing back
+what they sold and giving back what they did not. Sales go through the
+lease row, capped by its quantity: nothing is sold from a lease taken
+back or reconciled, the worker leases again instead.
+"""
+
+import os
+import time
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from flask import current_app
+from app import db
+from app.models import InventoryLease, MenuItem
+
+logger = logging.getLogger(__name__)
+
+# {menu_item_id: [lease_id, remaining]} of this worker
+_leases = {}
+_lock = threading.Lock()
+# the timer of this worker, per process
+_timer = {'pid': None, 'thread': None}
+
+
+def worker():
+    """Identifies this worker process"""
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def _remaining(menu_item_id):
+    with _lock:
+        local = _leases.get(menu_item_id)
+        return (local[0], local[1]) if local else (None, 0)
+
+
+def _lease(menu_item_id):
+    """This worker's lease on the menu item, created in a savepoint of
+    the current transaction"""
+    lease = InventoryLease.query.filter_by(
+        menu_item_id=menu_item_id, worker=worker()).populate_existing(
+        ).first()
+    if lease is not None:
+        return lease
+    lease = InventoryLease.make({
+        'menu_item_id': menu_item_id,
+        'worker': worker(),
+        'heartbeat_at': datetime.now(),
+    })
+    try:
+        with db.session.begin_nested():
+            db.session.add(lease)
+    except IntegrityError:
+        lease = InventoryLease.query.filter_by(
+            menu_item_id=menu_item_id, worker=worker()).first()
+    return lease
+
+
+def _take_back(menu_item_id):
+    """Gives the quantity the other workers' leases on the menu item did
+    not sell back to it, skipping those selling right now, returns how
+    many leases gave some back"""
+    leases = InventoryLease.query.filter(
+        InventoryLease.menu_item_id == menu_item_id,
+        InventoryLease.worker != worker(),
+        InventoryLease.quantity > InventoryLease.consumed).order_by(
+            InventoryLease.id).with_for_update(
+                skip_locked=True).populate_existing().all()
+    for lease in leases:
+        _write_back(lease, lease.remaining())
+    return len(leases)
+
+
+def _allot(menu_item_id, quantity):
+    """Leases at least `quantity` more meals of the menu item to this
+    worker in the current transaction, taking back the other workers'
+    unsold quantity when the menu item cannot cover it"""
+    chunk = max(quantity, current_app.config['INVENTORY_ALLOTMENT'])
+    lease = _lease(menu_item_id)
+    for take_back in [False, True]:
+        if take_back and not _take_back(menu_item_id):
+            break
+        # a full allotment, or whatever is left of the quantity...
+        for size in [chunk, quantity]:
+            leased = MenuItem.query.filter(
+                MenuItem.id == menu_item_id,
+                MenuItem.quantity - MenuItem.reserved - MenuItem.allotted >=
+                size).update({'allotted': MenuItem.allotted + size,
+                              'version': MenuItem.version + 1},
+                             synchronize_session=False)
+            if leased:
+                MenuItem.expire_loaded([menu_item_id])
+                lease.quantity += size
+                lease.heartbeat_at = datetime.now()
+                db.session.flush()
+                with _lock:
+                    _leases[menu_item_id] = [lease.id, lease.remaining()]
+                return True
+    return False
+
+
+def consume(menu_item_id, quantity):
+    """Sells `quantity` meals of the menu item from this worker's
+    allotment in the current transaction, returns False when the
+    allotments cannot cover it"""
+    # leasing again once when the lease was taken back meanwhile...
+    for _ in range(2):
+        lease_id, remaining = _remaining(menu_item_id)
+        if remaining < quantity:
+            if not _allot(menu_item_id, quantity):
+                return False
+            lease_id, remaining = _remaining(menu_item_id)
+
+        # the lease row caps what this worker can sell...
+        sold = InventoryLease.query.filter(
+            InventoryLease.id == lease_id,
+            InventoryLease.worker == worker(),
+            InventoryLease.consumed + quantity <=
+            InventoryLease.quantity).update(
+                {'consumed': InventoryLease.consumed + quantity},
+                synchronize_session=False)
+        with _lock:
+            if not sold:
+                _leases.pop(menu_item_id, None)
+                continue
+            if menu_item_id in _leases:
+                _leases[menu_item_id][1] -= quantity
+        return True
+    return False
+
+
+def _write_back(lease, give_back=0):
+    """Writes what the lease sold since the last flush to the menu item
+    and gives `give_back` of its remaining quantity back"""
+    sold = lease.consumed - lease.flushed
+    if sold or give_back:
+        MenuItem.query.filter_by(id=lease.menu_item_id).update({
+            'quantity': MenuItem.quantity - sold,
+            'allotted': MenuItem.allotted - sold - give_back,
+            'version': MenuItem.version + 1,
+        }, synchronize_session=False)
+        MenuItem.expire_loaded([lease.menu_item_id])
+    lease.flushed = lease.consumed
+    lease.quantity -= give_back
+
+
+def flush():
+    """Writes this worker's sales back and heartbeats its leases"""
+    leases = InventoryLease.query.filter_by(worker=worker()).order_by(
+        InventoryLease.menu_item_id).with_for_update().populate_existing(
+        ).all()
+    now = datetime.now()
+    for lease in leases:
+        _write_back(lease)
+        lease.heartbeat_at = now
+    db.session.commit()
+
+    # what this worker has left to sell...
+    with _lock:
+        _leases.clear()
+        for lease in leases:
+            _leases[lease.menu_item_id] = [lease.id, lease.remaining()]
+    return len(leases)
+
+
+def _run(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                flush()
+                reconcile()
+            except Exception:
+                logger.exception('Inventory flush failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+
+def start(app):
+    """Starts the flush timer of this worker, once per process"""
+    with _lock:
+        if _timer['pid'] == os.getpid() and _timer['thread'].is_alive():
+            return
+        _timer['pid'] = os.getpid()
+        _timer['thread'] = threading.Thread(
+            target=_run, args=(app, app.config['INVENTORY_FLUSH_INTERVAL']),
+            name='inventory-flush', daemon=True)
+        _timer['thread'].start()
+
+
+def reconcile(timeout=None, batch_size=100):
+    """Writes back and deletes the leases not heartbeated for `timeout`
+    seconds, INVENTORY_LEASE_TIMEOUT by default, returns how many"""
+    if timeout is None:
+        timeout = current_app.config['INVENTORY_LEASE_TIMEOUT']
+    count = 0
+    while True:
+        leases = InventoryLease.query.filter(
+            InventoryLease.heartbeat_at <
+            datetime.now() - timedelta(seconds=timeout)).order_by(
+                InventoryLease.menu_item_id).limit(batch_size).with_for_update(
+                    skip_locked=True).populate_existing().all()
+        if not leases:
+            db.session.rollback()
+            return count
+        for lease in leases:
+            _write_back(lease, lease.remaining())
+            db.session.delete(lease)
+        db.session.commit()
+        # this worker's own leases included, it leases again
+        with _lock:
+            for lease in leases:
+                local = _leases.get(lease.menu_item_id)
+                if local and local[0] == lease.id:
+                    del _leases[lease.menu_item_id]
+        count += len(leases)
+
+
+def init_app(app):
+    """Flushes every worker's sales on a timer when INVENTORY_ENGINE is
+    set"""
+    if not app.config.get('INVENTORY_ENGINE'):
+        return
+
+    @app.before_request
+    def start_inventory_flush():
+        start(app)
@@ -1,13 +1,15 @@
 from functools import wraps
 from app.utils import current_user
+from app.profiling.tracing import span
 from flask import jsonify, make_response, abort
-from flask_jwt_extended import jwt_required
+from flask_jwt_extended import verify_jwt_in_request
 
 
 def user_auth(fn):
     @wraps(fn)
-    @jwt_required
     def wrapper(*args, **kwargs):
+        with span('auth.user'):
+            verify_jwt_in_request()
         return fn(*args, **kwargs)
     return wrapper
 
@@ -15,7 +17,9 @@ def admin_auth(fn):
     @wraps(fn)
     @user_auth
     def wrapper(*args, **kwargs):
-        if not current_user().is_admin():
+        with span('auth.admin'):
+            is_admin = current_user().is_admin()
+        if not is_admin:
             abort(
                 make_response(
                     jsonify({'message': 'Unauthorized access to a non-admin'}),
@@ -0,0 +1,155 @@
+"""WSGI middleware recording the shape of the traffic the API serves.
+
+Every captured request becomes one compact NDJSON line with its method,
+path, route, query string, body schema, status and timing. No value sent
+by the users is kept: the schema maps the fields of the JSON body to
+their types and its arrays to one schema per item, the query string only
+keeps the values of the parameters shaping the response (fields, related,
+time, page...) and masks the others, searches included, and the
+Authorization header is only recorded as present or not.
+
+With TRAFFIC_CAPTURE_BODIES the bodies are recorded too, with passwords,
+tokens and other secrets scrubbed, for captures that may hold personal
+data. The log is what benchmarks/replay.py plays back, synthesizing the
+bodies from their schema when they were not recorded.
+"""
+
+import io
+import re
+import json
+import time
+import random
+import threading
+from urllib import parse
+
+SCRUBBED = '***'
+SECRET_FIELDS = re.compile(r'password|token|secret|jwt', re.IGNORECASE)
+# query parameters shaping the response, their values are kept
+SHAPE_PARAMS = {'fields', 'related', 'time', 'page', 'per_page', 'mode',
+                'format'}
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+MAX_BODY = 65536
+
+
+def route(path):
+    """The path with its numeric ids replaced, /orders/5 -> /orders/<id>"""
+    return ID_SEGMENT.sub('/<id>', path)
+
+
+def scrub(value):
+    """Replaces the values of secret fields, recursively"""
+    if isinstance(value, dict):
+        return {
+            key: SCRUBBED if SECRET_FIELDS.search(key) else scrub(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [scrub(item) for item in value]
+    return value
+
+
+def schema(value):
+    """The JSON type of every field of the body, arrays keep their
+    length"""
+    if isinstance(value, dict):
+        return {key: schema(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [schema(item) for item in value]
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if value is None:
+        return 'null'
+    return 'string'
+
+
+def scrub_query(query_string):
+    """Masks the values of the parameters not shaping the response"""
+    query = parse.parse_qsl(query_string, keep_blank_values=True)
+    return parse.urlencode([
+        (key, value if key in SHAPE_PARAMS else SCRUBBED)
+        for key, value in query
+    ])
+
+
+class TrafficCapture:
+    """Wraps a WSGI application and appends its requests to `path`"""
+
+    def __init__(self, app, path, sample=1.0, prefix='/api/', bodies=False):
+        self.app = app
+        self.path = path
+        self.sample = sample
+        self.prefix = prefix
+        self.bodies = bodies
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix) or \
+                random.random() >= self.sample:
+            return self.app(environ, start_response)
+
+        return self._record(environ, start_response, path)
+
+    def _record(self, environ, start_response, path):
+        body = self._read_body(environ)
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        started = time.perf_counter()
+        response = self.app(environ, capture_start_response)
+        try:
+            for chunk in response:
+                yield chunk
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+            self._write(environ, path, body, captured.get('status'),
+                        time.perf_counter() - started)
+
+    def _read_body(self, environ):
+        """Reads the JSON body, leaving a fresh stream for the app"""
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not length or length > MAX_BODY:
+            return None
+        raw = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = io.BytesIO(raw)
+        try:
+            return json.loads(raw.decode('utf-8'))
+        except ValueError:
+            return None
+
+    def _write(self, environ, path, body, status, duration):
+        record = {
+            't': round(time.time(), 3),
+            'm': environ.get('REQUEST_METHOD'),
+            'p': path,
+            'r': route(path),
+            'q': scrub_query(environ.get('QUERY_STRING', '')),
+            'a': 'HTTP_AUTHORIZATION' in environ,
+            's': schema(body) if body is not None else None,
+            'c': status,
+            'd': round(duration * 1000, 3),
+        }
+        if self.bodies:
+            record['b'] = scrub(body)
+        line = json.dumps(record, separators=(',', ':'))
+        with self._lock, open(self.path, 'a') as log:
+            log.write(line + '\n')
+
+
+def init_app(app):
+    """Captures the traffic to TRAFFIC_CAPTURE_FILE when it is set"""
+    if not app.config.get('TRAFFIC_CAPTURE_FILE'):
+        return
+    app.wsgi_app = TrafficCapture(
+        app.wsgi_app, app.config['TRAFFIC_CAPTURE_FILE'],
+        sample=app.config.get('TRAFFIC_CAPTURE_SAMPLE', 1.0),
+        bodies=app.config.get('TRAFFIC_CAPTURE_BODIES', False))
@@ -4,6 +4,25 @@ from functools import wraps
 from app.exceptions import ValidationException
 
 
+def clean_data(data):
+    """Collapses and trims the spaces of string fields and drops the
+    empty ones"""
+    # empty string fields...
+    to_delete = []
+    for field, value in data.items():
+        # if field is string...
+        if isinstance(value, str):
+            # subtstitute spaces with one space and trim.
+            data[field] = re.sub('\s+', ' ', value).strip()
+            if value == '':
+                to_delete.append(field)
+
+    # delete empty strings...
+    for field in to_delete:
+        del data[field]
+    return data
+
+
 def clean_json_request(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -11,19 +30,6 @@ def clean_json_request(fn):
             raise ValidationException({'request':
                                        ['Request must be valid JSON']})
 
-        # empty string fields...
-        to_delete = []
-        for field, value in request.json.items():
-            # if field is string...
-            if isinstance(value, str):
-                # subtstitute spaces with one space and trim.
-                request.json[field] = re.sub('\s+', ' ', value).strip()
-                if value == '':
-                    to_delete.append(field)
-
-        # delete empty strings...
-        for field in to_delete:
-            del request.json[field]
-
+        clean_data(request.json)
         return fn(*args, **kwargs)
     return wrapper
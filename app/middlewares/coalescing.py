@@ -0,0 +1,179 @@
+"""Caches the GET endpoints read the most, computing each response once.
+
+`@coalesced('menus', 'meals')` caches the 200 responses of a resource for
+RESPONSE_CACHE_TTL seconds under the request path, its normalized query
+string and the versions of the tables it reads, which app.cache.bus bumps
+whenever one of their rows changes. When a response is missing a single
+request computes it: the others of the worker wait for it, those of other
+workers for the lock it holds in the cache, polling the cache for the
+response up to RESPONSE_CACHE_WAIT seconds before computing it themselves.
+
+Two options keep an expiry from sending every request to the database:
+with RESPONSE_CACHE_STALE the responses are kept that many seconds past
+their TTL and served while the request holding the lock recomputes them,
+with RESPONSE_CACHE_EARLY_REFRESH, the beta of probabilistic early
+expiration, a request recomputes a response before it expires with a
+probability growing closer to expiry and with the time it took to compute.
+Responses carry an X-Cache header, HIT, STALE or MISS.
+"""
+
+import math
+import time
+import random
+import threading
+from functools import wraps
+from urllib.parse import urlencode
+from flask import Response, request, current_app
+from app.cache import bus, cache
+
+HEADER = 'X-Cache'
+POLL_INTERVAL = 0.05
+
+# {key: threading.Event} of the responses this worker is computing
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def response_key(tables, store=None):
+    """Key of the response to the current request, changing with the
+    versions of `tables`"""
+    store = store or cache()
+    args = urlencode(sorted(request.args.items(multi=True)))
+    versions = ','.join(str(version)
+                        for version in bus.versions(store, tables))
+    return 'response:{}?{}@{}'.format(request.path, args, versions)
+
+
+def lock_key(key):
+    return 'lock:' + key
+
+
+def _unpack(result):
+    if isinstance(result, tuple):
+        data, status_code = result[0], result[1]
+        headers = result[2] if len(result) > 2 else {}
+        return data, status_code, headers
+    return result, 200, {}
+
+
+def _replay(entry, state='HIT'):
+    data, status_code, headers = entry['response']
+    return data, status_code, dict(headers, **{HEADER: state})
+
+
+def _refresh_early(entry, beta, now=None):
+    """Whether to recompute a fresh response, always true at expiry:
+    now - delta * beta * log(rand) >= expires_at"""
+    if not beta:
+        return False
+    now = time.time() if now is None else now
+    return now - entry['delta'] * beta * math.log(
+        1 - random.random()) >= entry['expires_at']
+
+
+def _compute(store, key, compute, ttl, stale):
+    """Runs `compute`, caching its 200 responses for `ttl` seconds and
+    `stale` more"""
+    started = time.time()
+    result = compute()
+    if isinstance(result, Response):
+        return result
+    data, status_code, headers = _unpack(result)
+    if status_code == 200:
+        now = time.time()
+        store.set(key, {
+            'response': (data, status_code, headers),
+            'expires_at': now + ttl,
+            'delta': now - started,
+        }, ttl=ttl + stale)
+    return data, status_code, dict(headers, **{HEADER: 'MISS'})
+
+
+def _wait(store, key, timeout):
+    """Polls the cache for the response computed by another worker, until
+    its lock is gone: it gave up, or the cache cannot be reached"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = store.get(key)
+        if entry is not None:
+            return entry
+        if store.get(lock_key(key)) is None:
+            return None
+    return None
+
+
+def single_flight(store, key, compute, ttl, stale=0, wait=5,
+                  lock_timeout=10):
+    """The cached response at `key`, computed by a single request of all
+    the workers when missing"""
+    # the requests of this worker wait for the one in flight...
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = threading.Event()
+    if not leader:
+        flight.wait(wait)
+        entry = store.get(key)
+        if entry is not None:
+            return _replay(entry)
+        return _compute(store, key, compute, ttl, stale)
+
+    # ...which waits for those of the other workers
+    try:
+        if store.add(lock_key(key), True, ttl=lock_timeout):
+            try:
+                return _compute(store, key, compute, ttl, stale)
+            finally:
+                store.delete(lock_key(key))
+        entry = _wait(store, key, wait)
+        if entry is not None:
+            return _replay(entry)
+        return _compute(store, key, compute, ttl, stale)
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.set()
+
+
+def cached_response(store, key, compute, ttl, stale=0, early_refresh=0,
+                    wait=5, lock_timeout=10):
+    """The response at `key`, recomputed by the request getting the lock
+    when stale or refreshed early"""
+    entry = store.get(key)
+    if entry is None:
+        return single_flight(store, key, compute, ttl, stale, wait,
+                             lock_timeout)
+
+    fresh = time.time() < entry['expires_at']
+    if fresh and not _refresh_early(entry, early_refresh):
+        return _replay(entry)
+    if store.add(lock_key(key), True, ttl=lock_timeout):
+        try:
+            return _compute(store, key, compute, ttl, stale)
+        finally:
+            store.delete(lock_key(key))
+    return _replay(entry, 'HIT' if fresh else 'STALE')
+
+
+def coalesced(*tables):
+    """Caches the responses of the GET endpoint reading `tables`, when
+    RESPONSE_CACHE is set"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if not config.get('RESPONSE_CACHE'):
+                return fn(*args, **kwargs)
+            store = cache()
+            return cached_response(
+                store, response_key(tables, store),
+                lambda: fn(*args, **kwargs),
+                ttl=config['RESPONSE_CACHE_TTL'],
+                stale=config['RESPONSE_CACHE_STALE'],
+                early_refresh=config['RESPONSE_CACHE_EARLY_REFRESH'],
+                wait=config['RESPONSE_CACHE_WAIT'],
+                lock_timeout=config['RESPONSE_CACHE_LOCK_TIMEOUT'])
+        return wrapper
+    return decorator
@@ -0,0 +1,49 @@
+"""Optimistic concurrency for the versioned models.
+
+Order and MenuItem carry a `version` column, SQLAlchemy checks it on
+every UPDATE or DELETE and raises StaleDataError when another request
+changed the row in between, which is answered with a 409. Clients send
+the version they read, given in the ETag header, as If-Match on PUT to
+get the 409 when the row changed since they read it.
+
+Writers whose result does not depend on what the client has seen, like
+the stock updates of a new order, retry the whole request on conflict
+instead, up to CONFLICT_RETRIES times.
+"""
+
+from functools import wraps
+from flask import request, current_app
+from sqlalchemy.orm.exc import StaleDataError
+from app import db
+from app.exceptions import ConflictException
+
+
+def etag(instance):
+    """The ETag header of a versioned model"""
+    return {'ETag': '"{}"'.format(instance.version)}
+
+
+def if_match(instance):
+    """Raises a ConflictException when the If-Match header is sent and
+    does not match the version of the instance"""
+    header = request.headers.get('If-Match')
+    if not header or header.strip() == '*':
+        return
+    versions = [tag.strip().lstrip('W/').strip('"')
+                for tag in header.split(',')]
+    if str(instance.version) not in versions:
+        raise ConflictException(instance.version)
+
+
+def retry_on_conflict(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        attempts = current_app.config['CONFLICT_RETRIES']
+        for attempt in range(attempts):
+            try:
+                return fn(*args, **kwargs)
+            except StaleDataError:
+                db.session.rollback()
+                if attempt == attempts - 1:
+                    raise
+    return wrapper
@@ -0,0 +1,246 @@
+"""Makes retried POST/PUT/DELETE requests safe with an Idempotency-Key.
+
+The first request with a key claims it by inserting an in flight record,
+the (user_id, key) unique constraint lets a single request win. The
+resource then runs in one transaction, its commits only release
+savepoints, and its response is stored on the record in that same
+transaction: the writes of a request and its response commit together or
+not at all. Duplicates get the response back with an Idempotent-Replayed
+header instead of running again. Those arriving while the first request
+is in flight are not held up waiting for it: they get a 409 with a
+Retry-After of IDEMPOTENCY_RETRY_AFTER seconds, and the retry after it
+completed gets its response replayed.
+
+An in flight record older than IDEMPOTENCY_LOCK_TIMEOUT is taken over by
+a retry, its request committed nothing, and never will: storing its
+response only updates the record it claimed, and rolls everything back
+once that record was taken over.
+
+Keys are scoped to the signed in user and expire after IDEMPOTENCY_TTL
+seconds, expired keys are purged at most every IDEMPOTENCY_PURGE_INTERVAL
+seconds by every worker, or with `manage.py purge_idempotency_keys`.
+"""
+
+import json
+import time
+import hashlib
+from functools import wraps
+from datetime import datetime, timedelta
+from flask import Response, request, current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import IdempotencyKey
+from app.utils import current_user
+
+HEADER = 'Idempotency-Key'
+_last_purge = [0.0]
+
+
+def fingerprint():
+    """Hash of the request, a key may only be reused for the same one"""
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(request.full_path.encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def purge(now=None):
+    """Deletes the expired keys, returns how many"""
+    count = IdempotencyKey.query.filter(
+        IdempotencyKey.expires_at <= (now or datetime.now())).delete(
+            synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def _maybe_purge():
+    interval = current_app.config['IDEMPOTENCY_PURGE_INTERVAL']
+    if time.time() - _last_purge[0] >= interval:
+        _last_purge[0] = time.time()
+        purge()
+
+
+def _claim(key, user_id, digest):
+    """Inserts the in flight record, or returns None when the key is
+    already taken"""
+    record = IdempotencyKey.make({
+        'key': key,
+        'user_id': user_id,
+        'fingerprint': digest,
+        'expires_at': datetime.now() + timedelta(
+            seconds=current_app.config['IDEMPOTENCY_TTL']),
+    })
+    # compared with this clock when abandoned, not the database's
+    record.created_at = datetime.now()
+    try:
+        record.save()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return record
+
+
+def _existing(key, user_id):
+    # end the transaction to see the latest committed state
+    db.session.rollback()
+    return IdempotencyKey.query.filter_by(key=key, user_id=user_id).first()
+
+
+def _abandoned(record):
+    """Expired, or in flight for longer than any request takes"""
+    lock_timeout = timedelta(
+        seconds=current_app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+    return record.is_expired() or (
+        record.in_flight() and record.created_at + lock_timeout <
+        datetime.now())
+
+
+def _take_over(record):
+    """Deletes the abandoned record, unless its request just completed"""
+    deleted = IdempotencyKey.query.filter(
+        IdempotencyKey.id == record.id,
+        (IdempotencyKey.status_code.is_(None)) |
+        (IdempotencyKey.expires_at <= datetime.now())).delete(
+            synchronize_session=False)
+    db.session.commit()
+    return deleted == 1
+
+
+def _replay(record):
+    return json.loads(record.response), record.status_code, {
+        'Idempotent-Replayed': 'true'}
+
+
+def _restart_savepoint(session, transaction):
+    # the commits of the resource release a savepoint and start another
+    if session.info.get('idempotent') and transaction.nested and \
+            not transaction.parent.nested:
+        session.begin_nested()
+
+
+def _begin():
+    """Runs the resource in one transaction, until _end"""
+    if not event.contains(db.session, 'after_transaction_end',
+                          _restart_savepoint):
+        event.listen(db.session, 'after_transaction_end', _restart_savepoint)
+    session = db.session()
+    session.info['idempotent'] = True
+    session.begin_nested()
+
+
+def _end():
+    """Releases the savepoint of the resource, its writes commit with the
+    next commit"""
+    session = db.session()
+    session.info.pop('idempotent', None)
+    if session.transaction is not None and session.transaction.nested:
+        session.commit()
+
+
+def _abort():
+    """Rolls back everything the resource wrote"""
+    db.session().info.pop('idempotent', None)
+    db.session.close()
+
+
+def _complete(record, values):
+    """Stores the response in the transaction of the resource, returns
+    False when the record was taken over meanwhile"""
+    return IdempotencyKey.query.filter(
+        IdempotencyKey.id == record.id,
+        IdempotencyKey.status_code.is_(None)).update(
+            values, synchronize_session=False) == 1
+
+
+def _unpack(result):
+    if isinstance(result, tuple):
+        data, status_code = result[0], result[1]
+        headers = result[2] if len(result) > 2 else {}
+        return data, status_code, headers
+    return result, 200, {}
+
+
+def idempotent(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > 255:
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': {
+                    HEADER: ['The {} may not be greater than 255 '
+                             'characters.'.format(HEADER)]
+                }
+            }, 400
+
+        _maybe_purge()
+        user_id = current_user().id
+        digest = fingerprint()
+
+        # claim the key, taking over abandoned ones once...
+        record = _claim(key, user_id, digest)
+        if record is None:
+            existing = _existing(key, user_id)
+            if existing is not None and _abandoned(existing) and \
+                    _take_over(existing):
+                existing = None
+            if existing is None:
+                record = _claim(key, user_id, digest)
+                if record is None:
+                    existing = _existing(key, user_id)
+
+        if record is None:
+            if existing is not None and existing.fingerprint != digest:
+                return {
+                    'success': False,
+                    'message': 'The {} was already used for another '
+                               'request.'.format(HEADER),
+                }, 422
+            if existing is None or existing.in_flight():
+                return {
+                    'success': False,
+                    'message': 'A request with this {} is still in '
+                               'progress.'.format(HEADER),
+                }, 409, {'Retry-After': str(
+                    current_app.config['IDEMPOTENCY_RETRY_AFTER'])}
+            return _replay(existing)
+
+        # run the request in one transaction, giving the key back if it
+        # fails...
+        _begin()
+        try:
+            result = fn(*args, **kwargs)
+            _end()
+        except Exception:
+            _abort()
+            IdempotencyKey.query.filter_by(id=record.id).delete()
+            db.session.commit()
+            raise
+
+        # ...and store its response in that transaction
+        if isinstance(result, Response):
+            completed = IdempotencyKey.query.filter(
+                IdempotencyKey.id == record.id,
+                IdempotencyKey.status_code.is_(None)).delete(
+                    synchronize_session=False) == 1
+        else:
+            data, status_code, headers = _unpack(result)
+            completed = _complete(record, {
+                'status_code': status_code,
+                'response': json.dumps(data),
+            })
+        if not completed:
+            _abort()
+            return {
+                'success': False,
+                'message': 'The request with this {} was taken over by a '
+                           'retry.'.format(HEADER),
+            }, 409
+        db.session.commit()
+        return result
+    return wrapper
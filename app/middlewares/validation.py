@@ -1,12 +1,27 @@
 from functools import wraps
+from app.profiling.tracing import span
 
 
 def validate(Request):
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            req = Request()
-            req.validate()
+            with span('validate', request=Request.__name__):
+                req = Request()
+                req.validate()
             return fn(*args, **kwargs)
         return wrapper
     return decorator
+
+
+def validate_batch(Request):
+    """Validates a batch and passes it on to the resource as `batch`"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span('validate', request=Request.__name__):
+                batch = Request()
+                batch.validate()
+            return fn(*args, batch=batch, **kwargs)
+        return wrapper
+    return decorator
@@ -2,9 +2,33 @@
 
 import json
 from app import db
+from flask import current_app
 from passlib.hash import bcrypt
 from datetime import datetime, date
-from sqlalchemy import cast, or_
+from sqlalchemy import bindparam, cast, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import make_transient_to_detached
+from app.profiling.tracing import span
+from app.cache import bus, cache, catalog
+
+# the lookups run on almost every request are baked: their Query is built
+# and their SQL compiled once, every call only binds the parameters
+bakery = baked.bakery()
+
+
+def _default(column):
+    """The value the column defaults to, now for the timestamps"""
+    default = column.default
+    if default is None:
+        return None
+    if default.is_scalar:
+        return default.arg
+    if default.is_callable:
+        return default.arg(None)
+    if isinstance(column.type, db.DateTime):
+        return datetime.now()
+    return None
 
 
 class BaseModel:
@@ -12,6 +36,12 @@ class BaseModel:
     _fields = []
     _hidden = []
     _timestamps = True
+    # cached rows, evicted from every worker's cache when changed
+    _invalidates = False
+
+    # the server generated columns come back with RETURNING in the flush,
+    # committed instances are not expired, nothing is read back
+    __mapper_args__ = {'eager_defaults': True}
 
     @classmethod
     def make(cls, data):
@@ -19,6 +49,22 @@ class BaseModel:
         instance.from_dict(data)
         return instance
 
+    @classmethod
+    def find(cls, ident):
+        """`cls.query.get(ident)`, from the identity map when loaded"""
+        return bakery(lambda session: session.query(cls), cls)(
+            db.session()).get(ident)
+
+    @classmethod
+    def find_by(cls, column, value):
+        """The first instance whose `column` equals `value`"""
+        if column == 'id':
+            return cls.find(value)
+        query = bakery(lambda session: session.query(cls), cls, column)
+        query += lambda q: q.filter(
+            getattr(cls, column) == bindparam('value'))
+        return query(db.session()).params(value=value).first()
+
     @classmethod
     def create(cls, data):
         instance = cls()
@@ -26,6 +72,68 @@ class BaseModel:
         instance.save()
         return instance
 
+    @classmethod
+    def create_unique(cls, data):
+        """Creates the model unless it conflicts with a unique constraint,
+        returns None then. The constraint decides, no query runs before
+        the INSERT, nor after it: the columns come back with RETURNING on
+        PostgreSQL, their defaults are set beforehand elsewhere"""
+        instance = cls.make(data)
+        table = cls.__table__
+        returning = db.session.connection().dialect.name == 'postgresql'
+        if not returning:
+            # the defaults are written from here, none is read back
+            for column in table.columns:
+                if getattr(instance, column.name) is None:
+                    setattr(instance, column.name, _default(column))
+        values = {column.name: getattr(instance, column.name)
+                  for column in table.columns
+                  if getattr(instance, column.name) is not None}
+        statement = cls.insert_or_ignore(values)
+        if returning:
+            statement = statement.returning(*table.columns)
+        try:
+            result = db.session.execute(statement)
+        except IntegrityError:
+            db.session.rollback()
+            return None
+
+        if returning:
+            row = result.first()
+            if row is None:
+                db.session.rollback()
+                return None
+            for column in table.columns:
+                setattr(instance, column.name, row[column])
+        else:
+            if not result.rowcount:
+                db.session.rollback()
+                return None
+            instance.id = result.lastrowid
+        if cls._invalidates:
+            bus.invalidate(db.session, cls.__tablename__,
+                           [instance.cache_id()])
+        with span('db.commit'):
+            db.session.commit()
+
+        # a persistent instance, the columns not returned load when read
+        make_transient_to_detached(instance)
+        db.session.add(instance)
+        return instance
+
+    @classmethod
+    def insert_or_ignore(cls, values):
+        """INSERT skipping the rows conflicting with a unique constraint,
+        ON CONFLICT DO NOTHING on PostgreSQL and OR IGNORE on SQLite"""
+        table = cls.__table__
+        dialect = db.session.connection().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            return insert(table).values(values).on_conflict_do_nothing()
+        elif dialect == 'sqlite':
+            return table.insert().values(values).prefix_with('OR IGNORE')
+        return table.insert().values(values)
+
     def update(self, data):
         self.from_dict(data)
         self.save()
@@ -34,12 +142,37 @@ class BaseModel:
     def save(self):
         """Save current model"""
         db.session.add(self)
-        db.session.commit()
+        with span('db.commit'):
+            db.session.commit()
+
+    @staticmethod
+    def save_all(instances):
+        """Save many models in one commit"""
+        db.session.add_all(instances)
+        with span('db.commit'):
+            db.session.commit()
+
+    @classmethod
+    def expire_loaded(cls, ids=None):
+        """Expires the instances loaded in the session, those with `ids`
+        only when given, after a bulk update bypassed them, and the cached
+        ones"""
+        for instance in list(db.session.identity_map.values()):
+            if isinstance(instance, cls) and (ids is None or
+                                              instance.id in ids):
+                db.session.expire(instance)
+        if cls._invalidates and ids is not None:
+            bus.invalidate(db.session, cls.__tablename__, ids)
+
+    def cache_id(self):
+        """Identifies the row in the cache keys"""
+        return self.id
 
     def delete(self):
         """Delete current model"""
         db.session.delete(self)
-        db.session.commit()
+        with span('db.commit'):
+            db.session.commit()
 
     @classmethod
     def _apply_db_filters(cls, query, filters):
@@ -126,6 +259,8 @@ class BaseModel:
             query = cls._apply_db_filters(query, filters)
 
         paginated = query.paginate(error_out=False)
+        with span('serialize', model=cls.__name__):
+            items = cls._apply_data_filters(paginated.items, filters)
         return {
             'pages': paginated.pages,
             'total': paginated.total,
@@ -135,9 +270,38 @@ class BaseModel:
             'next_page': paginated.next_num,
             'prev_page': paginated.prev_num,
             'current_count': len(paginated.items),
-            name: cls._apply_data_filters(paginated.items, filters)
+            name: items
         }
 
+    @classmethod
+    def export(cls, filters=None, query=None, batch_size=1000):
+        """Yields every filtered row as a dict, reading them through a
+        server side cursor and expunging them once serialized"""
+        # default query passed?
+        if not query:
+            query = cls.query
+            # new first...
+            query = query.order_by(cls.id.desc())
+            # query with filters
+            query = cls._apply_db_filters(query, filters)
+
+        batch = []
+        for item in query.yield_per(batch_size):
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield from cls._export_batch(batch, filters)
+                batch = []
+        yield from cls._export_batch(batch, filters)
+
+    @classmethod
+    def _export_batch(cls, items, filters):
+        with span('serialize', model=cls.__name__):
+            dict_items = cls._apply_data_filters(items, filters)
+        # forget the exported rows, the session would keep them all
+        for item in items:
+            db.session.expunge(item)
+        return dict_items
+
     def from_dict(self, data):
         for field in self._fields:
             if field in data:
@@ -149,8 +313,7 @@ class BaseModel:
 
         # if no fields specified, include all..
         if not fields or len(fields) == 0:
-            fields = self._fields
-            fields.extend(['id', 'created_at', 'updated_at'])
+            fields = self._fields + ['id', 'created_at', 'updated_at']
 
         if 'id' in fields:
             try:
@@ -194,15 +357,59 @@ class Blacklist(db.Model, BaseModel):
 
     __tablename__ = 'blacklist'
     _fields = ['token']
+    _invalidates = True
 
     id = db.Column(db.Integer, primary_key=True)
-    token = db.Column(db.String(500))
+    token = db.Column(db.String(500), index=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
     def __init__(self, token=None):
         """Initialiaze the blacklist record"""
         self.token = token
 
+    def cache_id(self):
+        return self.token
+
+    @classmethod
+    def is_revoked(cls, token):
+        query = bakery(lambda session: session.query(cls.id))
+        query += lambda q: q.filter(cls.token == bindparam('token'))
+
+        def revoked():
+            return query(db.session()).params(
+                token=token).first() is not None
+        ttl = current_app.config.get('REVOCATION_CACHE_TTL')
+        if not ttl:
+            return revoked()
+        return cache().get_or_set(bus.key(cls.__tablename__, token),
+                                  revoked, ttl)
+
+
+class IdempotencyKey(db.Model, BaseModel):
+    """Holds the response of a request sent with an Idempotency-Key
+    header, the response is empty while the request is in flight"""
+
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (db.UniqueConstraint('user_id', 'key'),)
+    _fields = ['key', 'user_id', 'fingerprint', 'status_code', 'response',
+               'expires_at']
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('users.id', ondelete='CASCADE'))
+    fingerprint = db.Column(db.String(64))
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    expires_at = db.Column(db.DateTime, index=True)
+
+    def is_expired(self):
+        return self.expires_at <= datetime.now()
+
+    def in_flight(self):
+        return self.status_code is None
+
 
 class PasswordReset(db.Model, BaseModel):
     """Holds tokens for requested password resets"""
@@ -213,7 +420,7 @@ class PasswordReset(db.Model, BaseModel):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer,
                         db.ForeignKey('users.id', ondelete='CASCADE'))
-    token = db.Column(db.String(500))
+    token = db.Column(db.String(500), index=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
     user = db.relationship(
@@ -235,14 +442,15 @@ class User(db.Model, BaseModel):
     """This will have application's users details"""
 
     __tablename__ = 'users'
+    _invalidates = True
     _hidden = ['password', 'token']
     _fields = ['username', 'email', 'password', 'token', 'role']
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(256))
-    email = db.Column(db.String(1024), unique=True)
+    email = db.Column(db.String(1024))
     password = db.Column(db.String(256))
-    token = db.Column(db.String(1024))
+    token = db.Column(db.String(1024), index=True)
     role = db.Column(db.Integer, default=UserType.USER)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(
@@ -250,6 +458,10 @@ class User(db.Model, BaseModel):
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
 
+    __table_args__ = (
+        db.Index('users_lower_email_key', db.func.lower(email), unique=True),
+    )
+
     def __init__(self,
                  username=None,
                  email=None,
@@ -262,19 +474,31 @@ class User(db.Model, BaseModel):
         self.username = username
         self.token = token
         if password:
-            self.password = bcrypt.encrypt(password)
+            with span('bcrypt.hash'):
+                self.password = bcrypt.encrypt(password)
 
     def from_dict(self, data):
         for field in self._fields:
             if field in data:
                 if field == 'password':
-                    self.password = bcrypt.encrypt(data[field])
+                    with span('bcrypt.hash'):
+                        self.password = bcrypt.encrypt(data[field])
                 else:
                     setattr(self, field, data[field])
 
+    @classmethod
+    def find_by_email(cls, email):
+        """Looks the user up by email, whatever its case, through the
+        lower(email) index"""
+        query = bakery(lambda session: session.query(cls))
+        query += lambda q: q.filter(
+            db.func.lower(cls.email) == bindparam('email'))
+        return query(db.session()).params(email=email.lower()).first()
+
     def validate_password(self, password):
         """Checks the password is correct against the password hash"""
-        return bcrypt.verify(password, self.password)
+        with span('bcrypt.verify'):
+            return bcrypt.verify(password, self.password)
 
     def is_admin(self):
         """Checks if current user is a caterer"""
@@ -290,6 +514,7 @@ class Menu(db.Model, BaseModel):
     """Holds the menus"""
 
     __tablename__ = 'menus'
+    _invalidates = True
     _fields = ['name']
 
     id = db.Column(db.Integer, primary_key=True)
@@ -300,6 +525,10 @@ class Menu(db.Model, BaseModel):
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
 
+    __table_args__ = (
+        db.Index('menus_lower_name_key', db.func.lower(name), unique=True),
+    )
+
     def __init__(self, name=None):
         """Initialize the menu"""
         self.name = name
@@ -355,22 +584,44 @@ class MenuItem(db.Model, BaseModel):
     """Holds the menu item of the application"""
 
     __tablename__ = 'menu_items'
+    _invalidates = True
     _fields = ['menu_id', 'meal_id', 'quantity']
 
     id = db.Column(db.Integer, primary_key=True)
     menu_id = db.Column(db.Integer, db.ForeignKey('menus.id', ondelete='CASCADE'))
     meal_id = db.Column(db.Integer, db.ForeignKey('meals.id', ondelete='CASCADE'))
     quantity = db.Column(db.Integer)
+    # quantity held by the live reservations, kept in step with them
+    reserved = db.Column(db.Integer, default=0, server_default='0',
+                         nullable=False)
+    # quantity leased to the workers by the inventory engine, not sold yet
+    # as far as this row knows
+    allotted = db.Column(db.Integer, default=0, server_default='0',
+                         nullable=False)
+    version = db.Column(db.Integer, default=1, server_default='1',
+                        nullable=False)
+    # the day the menu item is served, once per menu and meal
+    served_on = db.Column(db.Date, default=date.today,
+                          server_default=db.text('CURRENT_DATE'),
+                          nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
 
+    __table_args__ = (
+        db.UniqueConstraint('menu_id', 'meal_id', 'served_on'),
+        db.Index('ix_menu_items_menu_id_created_at', 'menu_id', 'created_at'),
+    )
+
     # relationship with the menu
     menu = db.relationship(
         'Menu', backref=db.backref('menu_items', lazy='dynamic'))
 
+    __mapper_args__ = dict(BaseModel.__mapper_args__,
+                           version_id_col=version)
+
     # relationship with the meal
     meal = db.relationship(
         'Meal', backref=db.backref('menu_items', lazy='dynamic'))
@@ -381,10 +632,24 @@ class MenuItem(db.Model, BaseModel):
         self.meal_id = meal_id
         self.quantity = quantity
 
+    def available(self):
+        """Quantity left to order, without the reserved one and the one
+        allotted to the workers"""
+        return self.quantity - (self.reserved or 0) - (self.allotted or 0)
+
     def to_dict(self, fields=None):
         dict_repr = super().to_dict(fields=fields)
-        dict_repr['meal'] = self.meal.to_dict() if self.meal else {}
-        dict_repr['menu'] = self.menu.to_dict() if self.menu else {}
+        # the allotted quantity is still in stock, what the workers sold
+        # shows once written back
+        if not fields or 'available' in fields:
+            dict_repr['available'] = self.available() + (self.allotted or 0)
+        if not fields or 'version' in fields:
+            dict_repr['version'] = self.version
+        # from the catalog cache, without loading the relationships
+        dict_repr['meal'] = catalog.lookup(Meal, self.meal_id) or (
+            self.meal.to_dict() if self.meal else {})
+        dict_repr['menu'] = catalog.lookup(Menu, self.menu_id) or (
+            self.menu.to_dict() if self.menu else {})
         if dict_repr.get('menu_id'):
             del dict_repr['menu_id']
         if dict_repr.get('meal_id'):
@@ -430,6 +695,17 @@ class MenuItem(db.Model, BaseModel):
 
         return query
 
+    @classmethod
+    def served_today(cls, menu_ids):
+        """Ids of today's menu items of the menus keyed by their
+        (menu_id, meal_id)"""
+        if not menu_ids:
+            return {}
+        query = cls.query.with_entities(
+            cls.menu_id, cls.meal_id, cls.id).filter(
+                cls.menu_id.in_(menu_ids), cls.served_on == date.today())
+        return {(menu_id, meal_id): id for menu_id, meal_id, id in query}
+
     @classmethod
     def paginate(cls, filters=None, query=None, name='data'):
         # if user menu items specified by date...
@@ -437,14 +713,22 @@ class MenuItem(db.Model, BaseModel):
         query = cls._apply_db_filters(query, filters)
         return super().paginate(filters=filters, query=query, name=name)
 
+    @classmethod
+    def export(cls, filters=None, query=None, batch_size=1000):
+        query = cls.query.order_by(cls.id.desc())
+        query = cls._apply_db_filters(query, filters)
+        return super().export(
+            filters=filters, query=query, batch_size=batch_size)
+
 class Meal(db.Model, BaseModel):
     """Holds a meal in the application"""
 
     __tablename__ = 'meals'
+    _invalidates = True
     _fields = ['name', 'cost', 'img_url']
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(256), unique=True)
+    name = db.Column(db.String(256))
     cost = db.Column(db.Float(2))
     img_url = db.Column(db.String(2048))
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
@@ -453,6 +737,10 @@ class Meal(db.Model, BaseModel):
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
 
+    __table_args__ = (
+        db.Index('meals_lower_name_key', db.func.lower(name), unique=True),
+    )
+
     def __init__(self, name=None, cost=None, img_url=None):
         """Initialize a meal"""
         self.name = name
@@ -477,15 +765,21 @@ class Order(db.Model, BaseModel):
     quantity = db.Column(db.Integer, default=1)
     status = db.Column(db.Integer, default=OrderStatus.PENDING)
     menu_item_id = db.Column(
-        db.Integer, db.ForeignKey('menu_items.id', ondelete='CASCADE'))
+        db.Integer, db.ForeignKey('menu_items.id', ondelete='CASCADE'),
+        index=True)
     user_id = db.Column(db.Integer,
                         db.ForeignKey('users.id', ondelete='CASCADE'))
+    version = db.Column(db.Integer, default=1, server_default='1',
+                        nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(
         db.DateTime,
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
 
+    # a user's orders, newest first
+    __table_args__ = (db.Index('ix_orders_user_id_id', 'user_id', 'id'),)
+
     # relationship with the menu items
     menu_item = db.relationship(
         'MenuItem', backref=db.backref('orders', lazy='dynamic'))
@@ -493,6 +787,15 @@ class Order(db.Model, BaseModel):
     user = db.relationship(
         'User', backref=db.backref('orders', lazy='dynamic'))
 
+    __mapper_args__ = dict(BaseModel.__mapper_args__,
+                           version_id_col=version)
+
+    def to_dict(self, fields=None):
+        dict_repr = super().to_dict(fields=fields)
+        if not fields or 'version' in fields:
+            dict_repr['version'] = self.version
+        return dict_repr
+
     @classmethod
     def _apply_db_filters(cls, query, filters):
         if not filters:
@@ -545,6 +848,17 @@ class Order(db.Model, BaseModel):
         query = cls._apply_db_filters(query, filters)
         return super().paginate(filters=filters, query=query, name=name)
 
+    @classmethod
+    def export(cls, filters=None, query=None, user_id=None,
+               batch_size=1000):
+        query = cls.query
+        if user_id:
+            query = query.filter(cls.user_id == user_id)
+        query = query.order_by(cls.id.desc())
+        query = cls._apply_db_filters(query, filters)
+        return super().export(
+            filters=filters, query=query, batch_size=batch_size)
+
     def __init__(self, menu_item_id=None, user_id=None, quantity=None):
         """Initialize the order"""
         self.user_id = user_id
@@ -552,6 +866,125 @@ class Order(db.Model, BaseModel):
         self.menu_item_id = menu_item_id
 
 
+class IntakeStatus:
+    """Order intake status"""
+    QUEUED = 1
+    SETTLED = 2
+    REJECTED = 3
+
+
+class OrderIntake(db.Model, BaseModel):
+    """An order request queued for settlement, it gets its order once
+    settled or the reason it was rejected"""
+
+    __tablename__ = 'order_intakes'
+    _fields = ['quantity', 'menu_item_id', 'user_id', 'status', 'order_id',
+               'error', 'settled_at']
+
+    id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer)
+    status = db.Column(db.Integer, default=IntakeStatus.QUEUED, index=True)
+    menu_item_id = db.Column(
+        db.Integer, db.ForeignKey('menu_items.id', ondelete='CASCADE'))
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('users.id', ondelete='CASCADE'))
+    order_id = db.Column(
+        db.Integer, db.ForeignKey('orders.id', ondelete='SET NULL'))
+    error = db.Column(db.String(256))
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp())
+    settled_at = db.Column(db.DateTime)
+
+    order = db.relationship('Order')
+    menu_item = db.relationship('MenuItem')
+
+    def is_queued(self):
+        return self.status == IntakeStatus.QUEUED
+
+    def to_dict(self, fields=None):
+        dict_repr = super().to_dict(fields=fields)
+        if self.order and (not fields or 'order' in fields):
+            dict_repr['order'] = self.order.to_dict()
+        return dict_repr
+
+
+class Reservation(db.Model, BaseModel):
+    """A hold on the quantity of a menu item, until it is ordered or
+    expires"""
+
+    __tablename__ = 'reservations'
+    _fields = ['quantity', 'menu_item_id', 'user_id', 'expires_at']
+
+    id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer)
+    menu_item_id = db.Column(
+        db.Integer, db.ForeignKey('menu_items.id', ondelete='CASCADE'),
+        index=True)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('users.id', ondelete='CASCADE'))
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp())
+    expires_at = db.Column(db.DateTime, index=True)
+
+    # the user's holds on the menu items being ordered
+    __table_args__ = (db.Index('ix_reservations_user_id_menu_item_id',
+                               'user_id', 'menu_item_id'),)
+
+    menu_item = db.relationship('MenuItem')
+
+    def is_expired(self):
+        return self.expires_at <= datetime.now()
+
+    @classmethod
+    def paginate(cls, filters=None, query=None, user_id=None, name='data'):
+        # if user reservations specified...
+        query = cls.query
+        if user_id:
+            query = query.filter(cls.user_id == user_id)
+        query = query.order_by(cls.id.desc())
+        return super().paginate(filters=filters, query=query, name=name)
+
+
+class InventoryLease(db.Model, BaseModel):
+    """The quantity of a menu item allotted to a worker, with what it sold
+    of it and what was written back to the menu item"""
+
+    __tablename__ = 'inventory_leases'
+    __table_args__ = (db.UniqueConstraint('menu_item_id', 'worker'),)
+    _fields = ['menu_item_id', 'worker', 'quantity', 'consumed', 'flushed',
+               'heartbeat_at']
+
+    id = db.Column(db.Integer, primary_key=True)
+    menu_item_id = db.Column(
+        db.Integer, db.ForeignKey('menu_items.id', ondelete='CASCADE'))
+    worker = db.Column(db.String(255), nullable=False)
+    quantity = db.Column(db.Integer, default=0, nullable=False)
+    consumed = db.Column(db.Integer, default=0, nullable=False)
+    flushed = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    heartbeat_at = db.Column(db.DateTime, index=True)
+
+    def remaining(self):
+        return self.quantity - self.consumed
+
+
+class CacheInvalidation(db.Model):
+    """Invalidations polled by the workers on SQLite, see
+    app.cache.bus"""
+
+    __tablename__ = 'cache_invalidations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text)
+    sent_at = db.Column(db.Float, index=True)
+
+
 class Notification(db.Model, BaseModel):
     """Notification model"""
 
@@ -569,6 +1002,10 @@ class Notification(db.Model, BaseModel):
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
 
+    # a user's notifications, newest first
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_id', 'user_id', 'id'),)
+
     # relationship with a user
     user = db.relationship(
         'User', backref=db.backref('notifications', lazy='dynamic'))
@@ -582,6 +1019,16 @@ class Notification(db.Model, BaseModel):
         query = query.order_by(cls.id.desc())
         return super().paginate(filters=filters, query=query, name=name)
 
+    @classmethod
+    def export(cls, filters=None, query=None, user_id=None,
+               batch_size=1000):
+        query = cls.query
+        if user_id:
+            query = query.filter(cls.user_id == user_id)
+        query = query.order_by(cls.id.desc())
+        return super().export(
+            filters=filters, query=query, batch_size=batch_size)
+
     def __init__(self, title=None, message=None, user_id=None):
         """Initialize the notification"""
         self.title = title
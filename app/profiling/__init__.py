@@ -0,0 +1 @@
+"""Development and staging instrumentation for the application"""
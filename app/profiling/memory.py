@@ -0,0 +1,165 @@
+"""Opt-in memory monitoring for long running workers.
+
+With MEMORY_MONITOR enabled tracemalloc traces every allocation, and for
+each request the monitor records the traced memory delta and the RSS
+growth per endpoint together with the size of the session identity map.
+Whenever RSS grows by MEMORY_GROWTH_THRESHOLD bytes the top allocation
+sites since the previous report are logged, and once RSS goes over
+MEMORY_CEILING the worker asks to be recycled after its response is sent.
+"""
+
+import os
+import signal
+import resource
+import threading
+import tracemalloc
+from flask import g, request
+from app import db
+
+
+def rss():
+    """Resident set size of the current process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # peak usage, in kilobytes on linux, is the best we have here
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class EndpointMemory:
+    """Memory usage accumulated by the requests of an endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.allocated = 0
+        self.max_allocated = 0
+        self.rss_growth = 0
+        self.max_identity_map = 0
+
+    def add(self, allocated, rss_growth, identity_map):
+        self.requests += 1
+        self.allocated += allocated
+        self.max_allocated = max(self.max_allocated, allocated)
+        self.rss_growth += rss_growth
+        self.max_identity_map = max(self.max_identity_map, identity_map)
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'allocated': self.allocated,
+            'average_allocated': self.allocated // max(self.requests, 1),
+            'max_allocated': self.max_allocated,
+            'rss_growth': self.rss_growth,
+            'max_identity_map': self.max_identity_map,
+        }
+
+
+class MemoryMonitor:
+    """Tracks the memory growth of this worker per endpoint"""
+
+    def __init__(self, logger, growth_threshold, ceiling=None, top=10,
+                 frames=1):
+        self.logger = logger
+        self.growth_threshold = growth_threshold
+        self.ceiling = ceiling
+        self.top = top
+        self.endpoints = {}
+        self.recycling = False
+        self._lock = threading.Lock()
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._snapshot = tracemalloc.take_snapshot()
+        self._reported_rss = self.started_rss = rss()
+
+    def start(self):
+        """Memory state at the start of a request"""
+        return tracemalloc.get_traced_memory()[0], rss()
+
+    def end(self, endpoint, started, identity_map):
+        """Records the growth of a request started at `started` and tells
+        whether the worker just went over its ceiling"""
+        traced, resident = started
+        allocated = tracemalloc.get_traced_memory()[0] - traced
+        current_rss = rss()
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointMemory())
+            stats.add(allocated, current_rss - resident, identity_map)
+
+        if current_rss - self._reported_rss >= self.growth_threshold:
+            self.report(current_rss)
+        if self.ceiling and current_rss >= self.ceiling and \
+                not self.recycling:
+            self.recycling = True
+            self.logger.warning(
+                'Worker %d reached %d bytes over the ceiling of %d bytes, '
+                'recycling.', os.getpid(), current_rss, self.ceiling)
+            return True
+        return False
+
+    def report(self, current_rss=None):
+        """Logs the allocation sites that grew the most since the previous
+        report"""
+        current_rss = current_rss or rss()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        stats = snapshot.compare_to(self._snapshot, 'lineno')
+        self.logger.warning(
+            'Memory grew by %d bytes to %d bytes, top allocation sites:',
+            current_rss - self._reported_rss, current_rss)
+        for stat in stats[:self.top]:
+            self.logger.warning('  %s', stat)
+        self._snapshot = snapshot
+        self._reported_rss = current_rss
+        return stats[:self.top]
+
+    def stats(self):
+        with self._lock:
+            endpoints = {name: stats.to_dict()
+                         for name, stats in self.endpoints.items()}
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            'rss': rss(),
+            'rss_growth': rss() - self.started_rss,
+            'traced': traced,
+            'traced_peak': peak,
+            'ceiling': self.ceiling,
+            'endpoints': endpoints,
+        }
+
+
+def recycle():
+    """Asks the worker to stop gracefully, gunicorn then replaces it"""
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def init_app(app):
+    """Monitors the memory of every request when MEMORY_MONITOR is set"""
+    if not app.config.get('MEMORY_MONITOR'):
+        return
+
+    monitor = MemoryMonitor(
+        logger=app.logger,
+        growth_threshold=app.config.get('MEMORY_GROWTH_THRESHOLD', 10485760),
+        ceiling=app.config.get('MEMORY_CEILING'),
+        top=app.config.get('MEMORY_REPORT_TOP', 10),
+        frames=app.config.get('MEMORY_TRACE_FRAMES', 1))
+    app.extensions['memory_monitor'] = monitor
+
+    @app.before_request
+    def start_memory_monitor():
+        g.memory_started = monitor.start()
+
+    @app.after_request
+    def end_memory_monitor(response):
+        started = g.pop('memory_started', None)
+        if started is None:
+            return response
+
+        identity_map = len(db.session.identity_map)
+        if monitor.end(request.endpoint or request.path, started,
+                       identity_map):
+            response.call_on_close(recycle)
+        return response
@@ -0,0 +1,85 @@
+"""Finds the queries that can only be served by a sequential scan.
+
+`record_plans` explains every SELECT run on the current thread within the
+block. Sequential scans are disabled while planning, so a Seq Scan left
+in a plan means no index can serve the query, however small the tables
+of the test database are. Plans are only checked on PostgreSQL, other
+databases record none.
+"""
+
+import re
+import threading
+from contextlib import contextmanager
+from . import queries
+from .slow_queries import _is_select
+
+
+_local = threading.local()
+_seq_scan = re.compile(r'Seq Scan on (\w+)')
+
+
+class PlanRecorder:
+    """Holds the plans of the queries made while it is active"""
+
+    def __init__(self):
+        self.plans = []
+
+    def add(self, statement, plan):
+        self.plans.append((statement, plan))
+
+    def sequential_scans(self, tables=None):
+        """(table, statement) of the sequential scans, on `tables` only
+        when given"""
+        scans = []
+        for statement, plan in self.plans:
+            for table in _seq_scan.findall(plan):
+                if tables is None or table in tables:
+                    scans.append((table, statement))
+        return scans
+
+
+def _recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+def _explain(cursor, statement, parameters):
+    """Plans the statement on the same connection with sequential scans
+    off, in a savepoint so that the setting goes away with it"""
+    raw = cursor.connection.cursor()
+    try:
+        raw.execute('SAVEPOINT plan_check')
+        try:
+            raw.execute('SET LOCAL enable_seqscan = off')
+            raw.execute('EXPLAIN ' + statement, parameters)
+            return '\n'.join(row[0] for row in raw.fetchall())
+        finally:
+            raw.execute('ROLLBACK TO SAVEPOINT plan_check')
+            raw.execute('RELEASE SAVEPOINT plan_check')
+    finally:
+        raw.close()
+
+
+def _plan_listener(conn, cursor, statement, parameters, duration,
+                   executemany):
+    recorders = _recorders()
+    if not recorders or executemany or not _is_select(statement) or \
+            conn.dialect.name != 'postgresql':
+        return
+    plan = _explain(cursor, statement, parameters)
+    for recorder in recorders:
+        recorder.add(statement, plan)
+
+
+@contextmanager
+def record_plans():
+    """Records the plans of the queries made on this thread within the
+    block"""
+    queries.add_listener(_plan_listener)
+    recorder = PlanRecorder()
+    _recorders().append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders().remove(recorder)
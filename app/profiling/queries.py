@@ -0,0 +1,173 @@
+"""Counts and times the SQL queries made while handling a request.
+
+Every query executed on any engine is handed to the recorders active on
+the current thread. A recorder is started for every request when
+QUERY_PROFILER is enabled, and tests start their own through
+`record_queries` to assert query budgets. Other tools get the timed
+queries by registering a listener with `add_listener`.
+"""
+
+import re
+import time
+import threading
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+_local = threading.local()
+_listeners = []
+
+# literals left in a statement, collapsed so that queries only differing
+# by their values share the same shape
+_strings = re.compile(r"'(?:[^']|'')*'")
+_numbers = re.compile(r'\b\d+(?:\.\d+)?\b')
+_in_lists = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_spaces = re.compile(r'\s+')
+_params = re.compile(r'%\(\w+\)s|%s|:\w+')
+
+
+def normalize(statement):
+    """Reduces a statement to its shape by replacing the literals and
+    bound parameters with placeholders"""
+    shape = _params.sub('?', statement)
+    shape = _strings.sub('?', shape)
+    shape = _numbers.sub('?', shape)
+    shape = _in_lists.sub('IN (?)', shape)
+    return _spaces.sub(' ', shape).strip()
+
+
+class QueryRecorder:
+    """Holds the queries made while it is active"""
+
+    def __init__(self):
+        self.queries = []
+
+    def add(self, statement, duration):
+        self.queries.append((statement, duration))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def shapes(self):
+        """Groups the queries by their normalized statement"""
+        shapes = {}
+        for statement, duration in self.queries:
+            shape = normalize(statement)
+            count, total = shapes.get(shape, (0, 0.0))
+            shapes[shape] = (count + 1, total + duration)
+        return shapes
+
+    def repeated(self, threshold=3):
+        """Shapes run at least `threshold` times, most likely N+1 loads"""
+        return {
+            shape: stats
+            for shape, stats in self.shapes().items()
+            if stats[0] >= threshold
+        }
+
+    def report(self):
+        """Human readable summary of the recorded queries"""
+        lines = ['{} queries in {:.2f}ms'.format(
+            self.count, self.duration * 1000)]
+        shapes = sorted(
+            self.shapes().items(), key=lambda shape: shape[1][0],
+            reverse=True)
+        for shape, (count, total) in shapes:
+            lines.append('{:>4}x {:>8.2f}ms  {}'.format(
+                count, total * 1000, shape))
+        return '\n'.join(lines)
+
+
+def _recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = conn.info['query_start_time'].pop()
+    duration = time.perf_counter() - started
+    for recorder in _recorders():
+        recorder.add(statement, duration)
+    for listener in _listeners:
+        listener(conn, cursor, statement, parameters, duration, executemany)
+
+
+def add_listener(listener):
+    """Calls `listener(conn, cursor, statement, parameters, duration,
+    executemany)` after every query"""
+    listen()
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def listen():
+    """Hooks the recorders into every engine, only once"""
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@contextmanager
+def record_queries():
+    """Records the queries made on this thread within the block"""
+    listen()
+    recorder = QueryRecorder()
+    _recorders().append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders().remove(recorder)
+
+
+def init_app(app):
+    """Profiles the queries of every request when QUERY_PROFILER is set"""
+    if not app.config.get('QUERY_PROFILER'):
+        return
+    listen()
+    threshold = app.config.get('QUERY_PROFILER_N_PLUS_ONE', 3)
+
+    @app.before_request
+    def start_query_profile():
+        g.query_recorder = QueryRecorder()
+        _recorders().append(g.query_recorder)
+
+    @app.after_request
+    def end_query_profile(response):
+        recorder = g.get('query_recorder')
+        if recorder is None:
+            return response
+
+        repeated = recorder.repeated(threshold)
+        response.headers['X-Query-Count'] = str(recorder.count)
+        response.headers['X-Query-Time'] = '{:.2f}ms'.format(
+            recorder.duration * 1000)
+        response.headers['X-Query-Repeated'] = str(len(repeated))
+
+        app.logger.debug('%s %s: %s', request.method, request.path,
+                         recorder.report())
+        for shape, (count, total) in repeated.items():
+            app.logger.warning(
+                'Possible N+1 on %s %s: %d x %s', request.method,
+                request.path, count, shape)
+        return response
+
+    @app.teardown_request
+    def stop_query_profile(exception=None):
+        recorder = g.pop('query_recorder', None)
+        if recorder in _recorders():
+            _recorders().remove(recorder)
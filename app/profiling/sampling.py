@@ -0,0 +1,107 @@
+"""Statistical sampling profile of a single request on demand.
+
+An admin signs the path of the request to profile (see `manage.py
+profile_token`) and sends it back in the X-Profile header. While that
+request runs a background thread samples its stack, and the response body
+is replaced with the samples in the folded stack format understood by
+flamegraph.pl, speedscope and friends. The original status code is kept
+in the X-Profiled-Status header.
+"""
+
+import sys
+import time
+import threading
+from collections import Counter
+from flask import g, request
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+HEADER = 'X-Profile'
+
+
+def _serializer(app):
+    return URLSafeTimedSerializer(app.config['SECRET'], salt='profile')
+
+
+def make_token(app, path):
+    """Signs the path of the request to profile"""
+    return _serializer(app).dumps(path)
+
+
+def verify_token(app, token, path):
+    """Checks the token was signed for this path and has not expired"""
+    max_age = app.config.get('PROFILE_TOKEN_MAX_AGE', 300)
+    try:
+        return _serializer(app).loads(token, max_age=max_age) == path
+    except BadSignature:
+        return False
+
+
+class Sampler(threading.Thread):
+    """Samples the stack of a thread at a fixed interval"""
+
+    def __init__(self, thread_id, interval=0.001):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(
+                    frame.f_globals.get('__name__', code.co_filename),
+                    code.co_name))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self):
+        """The samples as `frame;frame;frame count` lines"""
+        return ''.join('{} {}\n'.format(stack, count)
+                       for stack, count in self.samples.most_common())
+
+
+def init_app(app):
+    """Profiles requests carrying a valid X-Profile header"""
+    if not app.config.get('SECRET'):
+        return
+    interval = app.config.get('PROFILE_SAMPLE_INTERVAL', 0.001)
+
+    @app.before_request
+    def start_sampling():
+        token = request.headers.get(HEADER)
+        if not token or not verify_token(app, token, request.path):
+            return
+        g.sampler = Sampler(threading.get_ident(), interval)
+        g.sampler_started = time.perf_counter()
+        g.sampler.start()
+
+    @app.after_request
+    def end_sampling(response):
+        sampler = g.pop('sampler', None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        elapsed = time.perf_counter() - g.pop('sampler_started')
+
+        profile = app.response_class(sampler.folded(), mimetype='text/plain')
+        profile.headers['X-Profiled-Status'] = str(response.status_code)
+        profile.headers['X-Profile-Samples'] = str(
+            sum(sampler.samples.values()))
+        profile.headers['X-Profile-Time'] = '{:.2f}ms'.format(elapsed * 1000)
+        return profile
+
+    @app.teardown_request
+    def stop_sampling(exception=None):
+        sampler = g.pop('sampler', None)
+        if sampler is not None:
+            sampler.stop()
@@ -0,0 +1,136 @@
+"""Records the queries slower than SLOW_QUERY_THRESHOLD seconds.
+
+Each record holds the statement, its bound parameters, the endpoint that
+ran it, its duration and, for SELECTs on PostgreSQL (or SQLite), the
+query plan. Records are kept in a bounded ring buffer served to admins on
+/api/v1/slow-queries and appended as JSON lines to a rotating log file.
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from flask import current_app, has_app_context, has_request_context, request
+from . import queries
+
+
+class SlowQueryLog:
+    """Ring buffer of the latest slow queries"""
+
+    def __init__(self, threshold, size=100, explain=True, analyze=False,
+                 logger=None):
+        self.threshold = threshold
+        self.explain = explain
+        self.analyze = analyze
+        self.logger = logger
+        self.records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, cursor, statement, parameters, duration, dialect):
+        record = {
+            'statement': statement,
+            'parameters': _describe(parameters),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'duration': round(duration * 1000, 2),
+            'time': str(datetime.now()),
+            'plan': None,
+        }
+        if self.explain and _is_select(statement):
+            record['plan'] = self._explain(
+                cursor, statement, parameters, dialect)
+
+        with self._lock:
+            self.records.append(record)
+        if self.logger:
+            self.logger.info(json.dumps(record, default=str))
+        return record
+
+    def all(self):
+        with self._lock:
+            return list(reversed(self.records))
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def _explain(self, cursor, statement, parameters, dialect):
+        """Runs EXPLAIN for the statement on the same connection, isolated
+        in a savepoint so that a failing plan cannot break the transaction
+        the query belongs to"""
+        if dialect == 'postgresql':
+            options = 'ANALYZE, FORMAT JSON' if self.analyze \
+                else 'FORMAT JSON'
+            explain = 'EXPLAIN ({}) {}'.format(options, statement)
+        elif dialect == 'sqlite':
+            explain = 'EXPLAIN QUERY PLAN ' + statement
+        else:
+            return None
+
+        raw = cursor.connection.cursor()
+        try:
+            raw.execute('SAVEPOINT slow_query_explain')
+            try:
+                raw.execute(explain, parameters)
+                plan = [list(row) for row in raw.fetchall()]
+            finally:
+                raw.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                raw.execute('RELEASE SAVEPOINT slow_query_explain')
+        except Exception as ex:
+            return 'EXPLAIN failed: {}'.format(ex)
+        finally:
+            raw.close()
+
+        # PostgreSQL hands back the JSON plan as a single value
+        if dialect == 'postgresql' and plan:
+            return plan[0][0]
+        return plan
+
+
+def _is_select(statement):
+    return statement.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def _describe(parameters, limit=200):
+    """Bound parameters trimmed to a sane size for the log"""
+    text = repr(parameters)
+    if len(text) > limit:
+        text = text[:limit] + '...'
+    return text
+
+
+def _slow_query_listener(conn, cursor, statement, parameters, duration,
+                         executemany):
+    if executemany or not has_app_context():
+        return
+    log = current_app.extensions.get('slow_queries')
+    if log is None or duration < log.threshold:
+        return
+    log.record(cursor, statement, parameters, duration, conn.dialect.name)
+
+
+def init_app(app):
+    """Starts recording slow queries when SLOW_QUERY_LOG is set"""
+    if not app.config.get('SLOW_QUERY_LOG'):
+        return
+
+    logger = None
+    if app.config.get('SLOW_QUERY_FILE'):
+        logger = logging.getLogger(
+            'slow_queries:' + app.config['SLOW_QUERY_FILE'])
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            logger.addHandler(RotatingFileHandler(
+                app.config['SLOW_QUERY_FILE'],
+                maxBytes=app.config.get('SLOW_QUERY_FILE_SIZE', 10485760),
+                backupCount=app.config.get('SLOW_QUERY_FILE_COUNT', 5)))
+
+    app.extensions['slow_queries'] = SlowQueryLog(
+        threshold=app.config.get('SLOW_QUERY_THRESHOLD', 0.5),
+        size=app.config.get('SLOW_QUERY_BUFFER', 100),
+        explain=app.config.get('SLOW_QUERY_EXPLAIN', True),
+        analyze=app.config.get('SLOW_QUERY_EXPLAIN_ANALYZE', False),
+        logger=logger)
+    queries.add_listener(_slow_query_listener)
@@ -0,0 +1,175 @@
+"""Lightweight span tracing of the stages a request goes through.
+
+Each traced request gets a root span, and nested spans are opened around
+the auth decorators, request validation, the resource handler, model
+serialization, JSON encoding and commits. Finished traces are handed to
+the exporters in the OTLP/JSON layout, so the file sink can be shipped to
+any OTLP compatible collector as is.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from functools import wraps
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+
+
+def _now():
+    return int(time.time() * 1e9)
+
+
+class Span:
+    """A timed stage of a request"""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = _now()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end or _now()) - self.start
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [{
+                'key': key,
+                'value': {'stringValue': str(value)}
+            } for key, value in self.attributes.items()],
+        }
+
+
+class Trace:
+    """All the spans of a single request"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._stack = []
+
+    def open(self, name, attributes=None):
+        parent_id = self._stack[-1].span_id if self._stack else None
+        span = Span(name, self.trace_id, parent_id, attributes)
+        self.spans.append(span)
+        self._stack.append(span)
+        return span
+
+    def close(self, span):
+        span.end = _now()
+        self._stack.remove(span)
+
+    def to_otlp(self, service='sadfa-fast-foods'):
+        return {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': [{
+                        'key': 'service.name',
+                        'value': {'stringValue': service}
+                    }]
+                },
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [span.to_dict() for span in self.spans]
+                }]
+            }]
+        }
+
+
+class MemoryExporter:
+    """Keeps the latest traces in process"""
+
+    def __init__(self, size=100):
+        self.traces = deque(maxlen=size)
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+class FileExporter:
+    """Appends every trace as an OTLP/JSON line to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_otlp(), separators=(',', ':'))
+        with self._lock, open(self.path, 'a') as sink:
+            sink.write(line + '\n')
+
+
+def current_trace():
+    if not has_request_context():
+        return None
+    return g.get('trace')
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the block as a span of the current request's trace"""
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    opened = trace.open(name, attributes)
+    try:
+        yield opened
+    finally:
+        trace.close(opened)
+
+
+def traced(name):
+    """Decorator tracing every call of the function as a span"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Traces every request when TRACING is set"""
+    if not app.config.get('TRACING'):
+        return
+
+    exporters = [MemoryExporter(app.config.get('TRACING_BUFFER', 100))]
+    if app.config.get('TRACING_FILE'):
+        exporters.append(FileExporter(app.config['TRACING_FILE']))
+    app.extensions['tracing'] = exporters
+
+    @app.before_request
+    def start_trace():
+        g.trace = Trace()
+        g.trace_root = g.trace.open('{} {}'.format(
+            request.method, request.url_rule or request.path), {
+                'http.method': request.method,
+                'http.target': request.full_path,
+            })
+
+    @app.after_request
+    def end_trace(response):
+        trace = g.pop('trace', None)
+        if trace is None:
+            return response
+        root = g.pop('trace_root')
+        root.attributes['http.status_code'] = response.status_code
+        trace.close(root)
+        response.headers['X-Trace-Id'] = trace.trace_id
+        for exporter in exporters:
+            exporter.export(trace)
+        return response
@@ -5,7 +5,7 @@ class RegisterRequest(JsonRequest):
     @staticmethod
     def rules():
         return {
-            'email': 'required|email|unique:User,email',
+            'email': 'required|email',
             'password': 'required|string|confirmed|least_string:6',
             'username': 'required|alpha|least_string:3',
         }
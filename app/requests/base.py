@@ -1,7 +1,8 @@
-from flask import request
+from flask import request, current_app
 from app.validation.validator import Validator
+from app.validation.batch import BatchValidator
 from app.exceptions import ValidationException
-from app.middlewares.clean_request import clean_json_request
+from app.middlewares.clean_request import clean_json_request, clean_data
 
 
 class JsonRequest:
@@ -31,3 +32,92 @@ class JsonRequest:
     @staticmethod
     def rules():
         return {}
+
+
+class BatchRequest:
+    """A JSON array of items validated with the same rules in one pass.
+
+    All items are validated before anything is written. By default the
+    batch is all or nothing, with `?mode=partial` the valid items are
+    saved and the invalid ones reported next to them.
+    """
+
+    def __init__(self):
+        if not request.is_json or not isinstance(request.json, list):
+            raise ValidationException({'request':
+                                       ['Request must be a JSON array']})
+        limit = current_app.config['BATCH_MAX_ITEMS']
+        if not 0 < len(request.json) <= limit:
+            raise ValidationException({'request': [
+                'Request must have between 1 and {} items'.format(limit)]})
+
+        self.partial = request.args.get('mode') == 'partial'
+        self.items = []
+        self.errors = {}
+        self._rules = rules = self.rules()
+        for index, item in enumerate(request.json):
+            if not isinstance(item, dict):
+                self.items.append({})
+                self.fail(index, 'item', 'Item must be a JSON object')
+                continue
+            # ensure we only pass registered fields..
+            self.items.append(clean_data({
+                field: value for field, value in item.items()
+                if field in rules or field.endswith('_confirmation')
+            }))
+
+    def validate(self):
+        indexes = self.valid()
+        validator = BatchValidator(
+            rows=[self.items[index] for index in indexes],
+            rules=self._rules)
+        validator.validate()
+        for position, errors in validator.errors().items():
+            self.errors[indexes[position]] = errors
+        self.check()
+
+        # ids compare as integers from here on
+        for index in self.valid():
+            if 'id' in self.items[index]:
+                self.items[index]['id'] = int(self.items[index]['id'])
+
+    def valid(self):
+        """Indexes of the items without errors so far"""
+        return [index for index in range(len(self.items))
+                if index not in self.errors]
+
+    def fail(self, index, field, message):
+        self.errors.setdefault(index, {}).setdefault(field, []).append(
+            message)
+
+    def check(self):
+        """Bails out of an all or nothing batch with errors, or of any
+        batch without a single valid item"""
+        if self.errors and (not self.partial or not self.valid()):
+            raise ValidationException({
+                str(index): errors
+                for index, errors in sorted(self.errors.items())
+            })
+
+    def response(self, name, saved, created=False):
+        """Results per item, `saved` maps the index of saved items to
+        their dict representation"""
+        results = []
+        for index in range(len(self.items)):
+            if index in saved:
+                results.append({'index': index, 'success': True,
+                                name: saved[index]})
+            else:
+                results.append({'index': index, 'success': False,
+                                'errors': self.errors.get(index, {})})
+        status = 207 if self.errors else 201 if created else 200
+        return {
+            'success': True,
+            'message': 'Successfully saved {} of {} items.'.format(
+                len(saved), len(self.items)),
+            'results': results,
+        }, status
+
+    @staticmethod
+    def rules():
+        return {}
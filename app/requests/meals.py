@@ -1,11 +1,11 @@
-from .base import JsonRequest
+from .base import JsonRequest, BatchRequest
 
 
 class PostRequest(JsonRequest):
     @staticmethod
     def rules():
         return {
-            'name': 'required|alpha|unique:Meal,name',
+            'name': 'required|alpha',
             'cost': 'required|positive',
             'img_url': 'url',
         }
@@ -19,3 +19,20 @@ class PutRequest(JsonRequest):
             'cost': 'positive',
             'img_url': 'url',
         }
+
+
+class BatchPostRequest(BatchRequest):
+    @staticmethod
+    def rules():
+        # one query checks the names of the whole batch
+        rules = PostRequest.rules()
+        rules['name'] += '|unique:Meal,name'
+        return rules
+
+
+class BatchPutRequest(BatchRequest):
+    @staticmethod
+    def rules():
+        rules = PutRequest.rules()
+        rules['id'] = 'required|integer|positive|exists:Meal,id'
+        return rules
@@ -1,11 +1,11 @@
-from .base import JsonRequest
+from .base import JsonRequest, BatchRequest
 
 
 class PostRequest(JsonRequest):
     @staticmethod
     def rules():
         return {
-            'name': 'required|alpha|unique:Menu,name',
+            'name': 'required|alpha',
         }
 
 
@@ -15,3 +15,12 @@ class PutRequest(JsonRequest):
         return {
             'name': 'required|alpha',
         }
+
+
+class BatchPostRequest(BatchRequest):
+    @staticmethod
+    def rules():
+        # one query checks the names of the whole batch
+        rules = PostRequest.rules()
+        rules['name'] += '|unique:Menu,name'
+        return rules
@@ -1,4 +1,4 @@
-from .base import JsonRequest
+from .base import JsonRequest, BatchRequest
 
 
 class PostRequest(JsonRequest):
@@ -19,3 +19,17 @@ class PutRequest(JsonRequest):
             'meal_id': 'integer|positive|exists:Meal,id',
             'menu_id': 'integer|positive|exists:Menu,id',
         }
+
+
+class BatchPostRequest(BatchRequest):
+    @staticmethod
+    def rules():
+        return PostRequest.rules()
+
+
+class BatchPutRequest(BatchRequest):
+    @staticmethod
+    def rules():
+        rules = PutRequest.rules()
+        rules['id'] = 'required|integer|positive|exists:MenuItem,id'
+        return rules
@@ -1,5 +1,8 @@
-from .base import JsonRequest
+from flask import request, current_app
+from .base import JsonRequest, BatchRequest
 from app.utils import current_user
+from app.exceptions import ValidationException
+from app.validation.batch import BatchValidator
 
 
 class PostRequest(JsonRequest):
@@ -22,3 +25,56 @@ class PutRequest(JsonRequest):
         if current_user().is_admin():
             rules['status'] = 'integer|found_in:1,2,3'
         return rules
+
+
+class BatchPostRequest(BatchRequest):
+    @staticmethod
+    def rules():
+        return PostRequest.rules()
+
+
+class BatchPutRequest(BatchRequest):
+    @staticmethod
+    def rules():
+        rules = PutRequest.rules()
+        rules['id'] = 'required|integer|positive|exists:Order,id'
+        return rules
+
+
+class CheckoutRequest(JsonRequest):
+    """A cart of menu items ordered together"""
+
+    @staticmethod
+    def rules():
+        return {
+            'user_id': 'integer|positive|exists:User,id',
+            'items': 'required|array',
+        }
+
+    @staticmethod
+    def item_rules():
+        return {
+            'quantity': 'required|integer|positive',
+            'menu_item_id': 'required|integer|positive|exists:MenuItem,id',
+        }
+
+    def validate(self):
+        super().validate()
+
+        items = request.json['items']
+        limit = current_app.config['BATCH_MAX_ITEMS']
+        if not 0 < len(items) <= limit:
+            raise ValidationException({'items': [
+                'The items must have between 1 and {} items.'.format(limit)]})
+        if not all(isinstance(item, dict) for item in items):
+            raise ValidationException({'items': [
+                'The items must be JSON objects.']})
+
+        validator = BatchValidator(rows=items, rules=self.item_rules())
+        validator.validate()
+        errors = {}
+        for index, item_errors in validator.errors().items():
+            for field, messages in item_errors.items():
+                errors['items.{}.{}'.format(index, field)] = messages
+        if errors:
+            raise ValidationException(errors)
@@ -0,0 +1,5 @@
+from .orders import CheckoutRequest
+
+
+class PostRequest(CheckoutRequest):
+    """The cart of menu items to hold"""
@@ -0,0 +1,150 @@
+"""Time limited holds on menu item stock.
+
+POST /reservations opens a cart by holding the quantity of its menu items
+for RESERVATION_TTL seconds, other users can only order what is left.
+Placing an order or checking out takes the user's holds on the ordered
+menu items, whatever was held is ordered first and the rest of the hold
+is given back. Holds are deleted with DELETE /reservations/<id> or, once
+expired, by the sweeper: `manage.py expire_reservations`, or every worker
+at most every RESERVATION_SWEEP_INTERVAL seconds.
+
+MenuItem.reserved holds the quantity of the live holds, it changes with
+them in the same transaction, so the available quantity reads as
+`quantity - reserved - allotted` without looking at the reservations.
+"""
+
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import tuple_
+from app import db
+from app.models import Reservation, MenuItem
+
+_last_sweep = [0.0]
+
+
+def hold(user_id, quantities, ttl):
+    """Holds the {menu_item_id: quantity} for `ttl` seconds, all or none.
+
+    Returns the reservations and the {menu_item_id: available} of the menu
+    items short of quantity, nothing is held unless that one is empty.
+    Every hold is a single conditional update, no lock is waited for
+    while checking the available quantity.
+    """
+    short = {}
+    # same order as the checkout, concurrent carts cannot deadlock...
+    for menu_item_id in sorted(quantities):
+        quantity = quantities[menu_item_id]
+        held = MenuItem.query.filter(
+            MenuItem.id == menu_item_id,
+            MenuItem.quantity - MenuItem.reserved - MenuItem.allotted >=
+            quantity).update(
+                {'reserved': MenuItem.reserved + quantity,
+                 'version': MenuItem.version + 1},
+                synchronize_session=False)
+        if not held:
+            short[menu_item_id] = None
+    if short:
+        db.session.rollback()
+        for menu_item in MenuItem.query.filter(MenuItem.id.in_(short)):
+            short[menu_item.id] = menu_item.available()
+        return [], short
+    MenuItem.expire_loaded(quantities)
+
+    expires_at = datetime.now() + timedelta(seconds=ttl)
+    reservations = [Reservation.make({
+        'user_id': user_id,
+        'menu_item_id': menu_item_id,
+        'quantity': quantity,
+        'expires_at': expires_at,
+    }) for menu_item_id, quantity in sorted(quantities.items())]
+    Reservation.save_all(reservations)
+    return reservations, {}
+
+
+def _give_back(reservations):
+    """Deletes the reservations and gives their quantity back to their
+    menu items, one update per menu item, in the current transaction"""
+    quantities = {}
+    for reservation in reservations:
+        quantities[reservation.menu_item_id] = quantities.get(
+            reservation.menu_item_id, 0) + reservation.quantity
+        db.session.delete(reservation)
+    for menu_item_id in sorted(quantities):
+        MenuItem.query.filter_by(id=menu_item_id).update(
+            {'reserved': MenuItem.reserved - quantities[menu_item_id],
+             'version': MenuItem.version + 1},
+            synchronize_session=False)
+    db.session.flush()
+    # the menu items already loaded read the new quantities and version
+    MenuItem.expire_loaded(quantities)
+    return quantities
+
+
+def release(reservation):
+    """Gives a hold back before it expires"""
+    _give_back([reservation])
+    db.session.commit()
+
+
+def take(pairs):
+    """Releases the live holds of the (user_id, menu_item_id) pairs about
+    to be ordered, in the current transaction, and returns the quantity
+    they held keyed by pair.
+
+    The caller checks the ordered quantity against the menu item's
+    available quantity plus what the user held, then commits.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    reservations = Reservation.query.filter(
+        tuple_(Reservation.user_id, Reservation.menu_item_id).in_(pairs),
+        Reservation.expires_at > datetime.now()).with_for_update(
+            skip_locked=True).populate_existing().all()
+    held = {}
+    for reservation in reservations:
+        pair = (reservation.user_id, reservation.menu_item_id)
+        held[pair] = held.get(pair, 0) + reservation.quantity
+    if reservations:
+        _give_back(reservations)
+    return held
+
+
+def expire(now=None, batch_size=1000):
+    """Deletes a batch of expired holds giving their quantity back,
+    returns how many"""
+    reservations = Reservation.query.filter(
+        Reservation.expires_at <= (now or datetime.now())).order_by(
+            Reservation.id).limit(batch_size).with_for_update(
+                skip_locked=True).populate_existing().all()
+    if not reservations:
+        db.session.rollback()
+        return 0
+    _give_back(reservations)
+    db.session.commit()
+    return len(reservations)
+
+
+def maybe_expire():
+    """Sweeps the expired holds when none was swept by this worker for
+    RESERVATION_SWEEP_INTERVAL seconds"""
+    interval = current_app.config['RESERVATION_SWEEP_INTERVAL']
+    if time.time() - _last_sweep[0] >= interval:
+        _last_sweep[0] = time.time()
+        while expire():
+            pass
+
+
+def work(batch_size=1000, interval=5, once=False, report=None):
+    """Sweeps the expired holds until there is none left when `once`,
+    otherwise forever, sleeping `interval` seconds in between"""
+    while True:
+        expired = expire(batch_size=batch_size)
+        if report and expired:
+            report(expired)
+        if expired:
+            continue
+        if once:
+            return
+        time.sleep(interval)
@@ -0,0 +1,26 @@
+from flask import current_app
+from flask_restful import Resource
+from app.cache import cache
+from app.middlewares.auth import admin_auth
+
+
+class CacheResource(Resource):
+    @admin_auth
+    def get(self):
+        bus = current_app.extensions.get('cache_bus')
+        catalog = current_app.extensions.get('catalog_cache')
+        return {
+            'success': True,
+            'message': 'Successfully retrieved cache statistics.',
+            'cache': cache().info(),
+            'bus': bus.stats() if bus else None,
+            'catalog': catalog.info() if catalog else None,
+        }
+
+    @admin_auth
+    def delete(self):
+        cache().clear()
+        return {
+            'success': True,
+            'message': 'Successfully cleared the cache.',
+        }
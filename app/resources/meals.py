@@ -1,17 +1,23 @@
 from flask import request
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app import db
 from app.models import Meal
 from flask_restful import Resource
-from app.requests.meals import PostRequest, PutRequest
-from app.middlewares.validation import validate
+from app.requests.meals import (PostRequest, PutRequest, BatchPostRequest,
+                                BatchPutRequest)
+from app.middlewares.validation import validate, validate_batch
 from app.middlewares.auth import user_auth, admin_auth
+from app.middlewares.coalescing import coalesced
 from app.utils import decoded_qs
+from app.utils.export import export_response
 
 
 class MealResource(Resource):
     @user_auth
     def get(self, meal_id):
         # exists? ...
-        meal = Meal.query.get(meal_id)
+        meal = Meal.find(meal_id)
 
         if not meal:
             return {
@@ -33,33 +39,30 @@ class MealResource(Resource):
     @validate(PutRequest)
     def put(self, meal_id):
         # check exists? ...
-        meal = Meal.query.get(meal_id)
+        meal = Meal.find(meal_id)
         if not meal:
             return {
                 'success': False,
                 'message': 'Meal not found',
             }, 404
 
-        # check if another meal exists with new name...
-        if request.json.get('name'):
-            name = request.json['name']
-            new_meal = Meal.query.filter(Meal.name.ilike(name)).first()
-            if new_meal and new_meal.name.lower() == name.lower() and \
-                    new_meal.id != meal_id:
-                return {
-                    'success': False,
-                    'message': 'Validation error.',
-                    'errors': {
-                        'name': ['Meal name must be unique.']
-                    }
-                }, 400
-
         fields = decoded_qs()
         if fields and fields.get('fields') is not None:
             fields = fields.get('fields').split(',')
 
-        # now update...
-        meal.update(request.json)
+        # now update, unless another meal has the new name...
+        try:
+            meal.update(request.json)
+        except IntegrityError:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': {
+                    'name': ['Meal name must be unique.']
+                }
+            }, 400
+
         return {
             'success': True,
             'message': 'Meal successfully updated.',
@@ -69,7 +72,7 @@ class MealResource(Resource):
     @admin_auth
     def delete(self, meal_id):
         # exists? ...
-        meal = Meal.query.get(meal_id)
+        meal = Meal.find(meal_id)
         if not meal:
             return {
                 'success': False,
@@ -85,6 +88,7 @@ class MealResource(Resource):
 
 class MealListResource(Resource):
     @user_auth
+    @coalesced('meals')
     def get(self):
         resp = Meal.paginate(
             filters=decoded_qs(),
@@ -97,9 +101,70 @@ class MealListResource(Resource):
     @admin_auth
     @validate(PostRequest)
     def post(self):
-        meal = Meal.create(request.json)
+        meal = Meal.create_unique(request.json)
+        if meal is None:
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': {
+                    'name': ['The name is already taken.']
+                }
+            }, 400
         return {
             'success': True,
             'message': 'Successfully saved meal.',
             'meal': meal.to_dict()
         }, 201
+
+
+class MealExportResource(Resource):
+    @user_auth
+    def get(self):
+        return export_response(Meal, 'meals', filters=decoded_qs())
+
+
+class MealBatchResource(Resource):
+    @admin_auth
+    @validate_batch(BatchPostRequest)
+    def post(self, batch):
+        meals = {index: Meal.make(batch.items[index])
+                 for index in batch.valid()}
+        Meal.save_all(meals.values())
+        return batch.response('meal', {
+            index: meal.to_dict() for index, meal in meals.items()
+        }, created=True)
+
+    @admin_auth
+    @validate_batch(BatchPutRequest)
+    def put(self, batch):
+        valid = batch.valid()
+        meals = {meal.id: meal for meal in Meal.query.filter(
+            Meal.id.in_([batch.items[index]['id'] for index in valid]))}
+
+        # new names must not be taken by other meals, nor in this batch
+        names = {batch.items[index]['name'].lower() for index in valid
+                 if batch.items[index].get('name')}
+        taken = {}
+        if names:
+            taken = {name.lower(): id for id, name in Meal.query.with_entities(
+                Meal.id, Meal.name).filter(func.lower(Meal.name).in_(names))}
+        for index in valid:
+            item = batch.items[index]
+            if not item.get('name'):
+                continue
+            name = item['name'].lower()
+            if taken.get(name, item['id']) != item['id']:
+                batch.fail(index, 'name', 'Meal name must be unique.')
+            else:
+                taken[name] = item['id']
+        batch.check()
+
+        saved = {}
+        for index in batch.valid():
+            meal = meals[batch.items[index]['id']]
+            meal.from_dict(batch.items[index])
+            saved[index] = meal
+        Meal.save_all(saved.values())
+        return batch.response('meal', {
+            index: meal.to_dict() for index, meal in saved.items()
+        })
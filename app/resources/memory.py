@@ -0,0 +1,20 @@
+from flask import current_app
+from flask_restful import Resource
+from app.middlewares.auth import admin_auth
+
+
+class MemoryResource(Resource):
+    @admin_auth
+    def get(self):
+        monitor = current_app.extensions.get('memory_monitor')
+        if monitor is None:
+            return {
+                'success': False,
+                'message': 'Memory monitor is not enabled.',
+            }, 404
+
+        return {
+            'success': True,
+            'message': 'Successfully retrieved memory usage.',
+            'memory': monitor.stats(),
+        }
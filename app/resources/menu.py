@@ -1,10 +1,14 @@
 from flask import request
+from sqlalchemy.exc import IntegrityError
+from app import db
 from app.models import Menu
 from flask_restful import Resource
 from app.requests.menu import PostRequest, PutRequest
 from app.middlewares.auth import user_auth, admin_auth
+from app.middlewares.coalescing import coalesced
 from app.middlewares.validation import validate
 from app.utils import decoded_qs
+from app.utils.export import export_response
 
 
 class MenuResource(Resource):
@@ -12,7 +16,7 @@ class MenuResource(Resource):
     @user_auth
     def get(self, menu_id):
         # exists? ...
-        menu = Menu.query.get(menu_id)
+        menu = Menu.find(menu_id)
         if not menu:
             return {
                 'success': False,
@@ -33,30 +37,26 @@ class MenuResource(Resource):
     @validate(PutRequest)
     def put(self, menu_id):
 
-        # check if another menu exists with new name...
-        if request.json.get('name'):
-            name = request.json['name']
-            menu = Menu.query.filter_by(name=name).first()
-            if menu and menu.name.lower() == name.lower() and \
-                    menu.id != menu_id:
-                return {
-                    'success': False,
-                    'message': 'Validation error.',
-                    'errors': {
-                        'name': ['Menu name must be unique.']
-                    }
-                }, 400
-
         # check exists? ...
-        menu = Menu.query.get(menu_id)
+        menu = Menu.find(menu_id)
         if not menu:
             return {
                 'success': False,
                 'message': 'Menu not found.',
             }, 404
 
-        # now update...
-        menu.update(request.json)
+        # now update, unless another menu has the new name...
+        try:
+            menu.update(request.json)
+        except IntegrityError:
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': {
+                    'name': ['Menu name must be unique.']
+                }
+            }, 400
         return {
             'success': True,
             'message': 'Menu successfully updated.',
@@ -66,7 +66,7 @@ class MenuResource(Resource):
     @admin_auth
     def delete(self, menu_id):
         # exists? ...
-        menu = Menu.query.get(menu_id)
+        menu = Menu.find(menu_id)
         if not menu:
             return {
                 'success': False,
@@ -82,6 +82,7 @@ class MenuResource(Resource):
 
 class MenuListResource(Resource):
     @user_auth
+    @coalesced('menus', 'menu_items', 'meals')
     def get(self):
         resp = Menu.paginate(
             filters=decoded_qs(),
@@ -94,10 +95,23 @@ class MenuListResource(Resource):
     @admin_auth
     @validate(PostRequest)
     def post(self):
-        menu = Menu.create(request.json)
+        menu = Menu.create_unique(request.json)
+        if menu is None:
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': {
+                    'name': ['The name is already taken.']
+                }
+            }, 400
         return {
             'success': True,
             'message': 'Successfully saved menu.',
             'menu': menu.to_dict()
         }, 201
 
+
+class MenuExportResource(Resource):
+    @user_auth
+    def get(self):
+        return export_response(Menu, 'menus', filters=decoded_qs())
@@ -1,19 +1,23 @@
 from flask import request
-from datetime import date
+from sqlalchemy.exc import IntegrityError
+from app import db
 from app.models import MenuItem
 from flask_restful import Resource
-from app.requests.menu_items import PostRequest, PutRequest
+from app.requests.menu_items import (PostRequest, PutRequest,
+                                     BatchPostRequest, BatchPutRequest)
 from app.middlewares.auth import user_auth, admin_auth
-from app.middlewares.validation import validate
+from app.middlewares.coalescing import coalesced
+from app.middlewares.validation import validate, validate_batch
+from app.middlewares.concurrency import etag, if_match
 from app.utils import decoded_qs
-from sqlalchemy import cast, DATE
+from app.utils.export import export_response
 
 
 class MenuItemResource(Resource):
     @user_auth
     def get(self, menu_item_id):
         # exists? ...
-        menu_item = MenuItem.query.get(menu_item_id)
+        menu_item = MenuItem.find(menu_item_id)
         if not menu_item:
             return {
                 'success': False,
@@ -28,30 +32,28 @@ class MenuItemResource(Resource):
             'success': True,
             'message': 'Menu item successfully retrieved.',
             'menu_item': menu_item.to_dict(fields=fields)
-        }
+        }, 200, etag(menu_item)
 
     @admin_auth
     @validate(PutRequest)
     def put(self, menu_item_id):
 
         # check exists? ...
-        menu_item = MenuItem.query.get(menu_item_id)
+        menu_item = MenuItem.find(menu_item_id)
         if not menu_item:
             return {
                 'success': False,
                 'message': 'Menu item not found.',
             }, 404
 
-        # for uniqueness check...
-        meal_id = request.json.get('meal_id') or menu_item.meal_id
-        menu_id = request.json.get('menu_id') or menu_item.menu_id
-
-        # check if another menu item exists with same values today
-        timestamp = cast(MenuItem.created_at, DATE)
-        existing = MenuItem.query.filter(timestamp == date.today()).filter_by(
-            meal_id=meal_id, menu_id=menu_id
-        ).first()
-        if existing and existing.id != menu_item_id:
+        # changed since the client read it? ...
+        if_match(menu_item)
+
+        # now update, unless the menu already serves the meal that day...
+        try:
+            menu_item.update(request.json)
+        except IntegrityError:
+            db.session.rollback()
             return {
                 'success': False,
                 'message': 'Validation error.',
@@ -59,19 +61,16 @@ class MenuItemResource(Resource):
                     'ids': ['Menu item must be unique.']
                 }
             }, 400
-
-        # now update...
-        menu_item.update(request.json)
         return {
             'success': True,
             'message': 'Menu item successfully updated.',
             'menu_item': menu_item.to_dict()
-        }
+        }, 200, etag(menu_item)
 
     @admin_auth
     def delete(self, menu_item_id):
         # exists? ...
-        menu_item = MenuItem.query.get(menu_item_id)
+        menu_item = MenuItem.find(menu_item_id)
         if not menu_item:
             return {
                 'success': False,
@@ -87,6 +86,7 @@ class MenuItemResource(Resource):
 
 class MenuItemListResource(Resource):
     @user_auth
+    @coalesced('menu_items', 'menus', 'meals')
     def get(self):
         resp = MenuItem.paginate(
             filters=decoded_qs(),
@@ -100,16 +100,9 @@ class MenuItemListResource(Resource):
     @validate(PostRequest)
     def post(self):
 
-        # ensure uniqueness
-        meal_id = request.json['meal_id']
-        menu_id = request.json['menu_id']
-
-        # check if another menu item exists with same values today
-        timestamp = cast(MenuItem.created_at, DATE)
-        menu_item = MenuItem.query.filter(timestamp == date.today()).filter_by(
-            meal_id=meal_id, menu_id=menu_id
-        ).first()
-        if menu_item:
+        # once per menu, meal and day...
+        menu_item = MenuItem.create_unique(request.json)
+        if menu_item is None:
             return {
                 'success': False,
                 'message': 'Validation error.',
@@ -118,9 +111,76 @@ class MenuItemListResource(Resource):
                 }
             }, 400
 
-        menu_item = MenuItem.create(request.json)
         return {
             'success': True,
             'message': 'Successfully saved menu item.',
             'menu_item': menu_item.to_dict()
         }, 201
+
+
+class MenuItemExportResource(Resource):
+    @user_auth
+    def get(self):
+        return export_response(MenuItem, 'menu_items', filters=decoded_qs())
+
+
+class MenuItemBatchResource(Resource):
+    @admin_auth
+    @validate_batch(BatchPostRequest)
+    def post(self, batch):
+        # ensure uniqueness against today's menu items and in this batch
+        valid = batch.valid()
+        taken = MenuItem.served_today(
+            {int(batch.items[index]['menu_id']) for index in valid})
+        for index in valid:
+            item = batch.items[index]
+            pair = (int(item['menu_id']), int(item['meal_id']))
+            if pair in taken:
+                batch.fail(index, 'ids', 'Menu item must be unique.')
+            else:
+                taken[pair] = None
+        batch.check()
+
+        menu_items = {index: MenuItem.make(batch.items[index])
+                      for index in batch.valid()}
+        MenuItem.save_all(menu_items.values())
+        return batch.response('menu_item', {
+            index: menu_item.to_dict()
+            for index, menu_item in menu_items.items()
+        }, created=True)
+
+    @admin_auth
+    @validate_batch(BatchPutRequest)
+    def put(self, batch):
+        valid = batch.valid()
+        menu_items = {menu_item.id: menu_item for menu_item in
+                      MenuItem.query.filter(MenuItem.id.in_(
+                          [batch.items[index]['id'] for index in valid]))}
+
+        # for uniqueness check...
+        pairs = {}
+        for index in valid:
+            item = batch.items[index]
+            menu_item = menu_items[item['id']]
+            pairs[index] = (int(item.get('menu_id') or menu_item.menu_id),
+                            int(item.get('meal_id') or menu_item.meal_id))
+        taken = MenuItem.served_today({menu_id for menu_id, _ in
+                                       pairs.values()})
+        for index in valid:
+            item_id = batch.items[index]['id']
+            if taken.get(pairs[index], item_id) != item_id:
+                batch.fail(index, 'ids', 'Menu item must be unique.')
+            else:
+                taken[pairs[index]] = item_id
+        batch.check()
+
+        saved = {}
+        for index in batch.valid():
+            menu_item = menu_items[batch.items[index]['id']]
+            menu_item.from_dict(batch.items[index])
+            saved[index] = menu_item
+        MenuItem.save_all(saved.values())
+        return batch.response('menu_item', {
+            index: menu_item.to_dict()
+            for index, menu_item in saved.items()
+        })
@@ -4,13 +4,14 @@ from flask_restful import Resource
 from app.middlewares.validation import validate
 from app.middlewares.auth import user_auth
 from app.utils import decoded_qs, current_user
+from app.utils.export import export_response
 
 
 class NotificationResource(Resource):
     @user_auth
     def get(self, notification_id):
         # exists? ...
-        notification = Notification.query.get(notification_id)
+        notification = Notification.find(notification_id)
         if not notification:
             return {
                 'success': False,
@@ -38,7 +39,7 @@ class NotificationResource(Resource):
     @user_auth
     def delete(self, notification_id):
         # exists? ...
-        notification = Notification.query.get(notification_id)
+        notification = Notification.find(notification_id)
         if not notification:
             return {
                 'success': False,
@@ -80,3 +81,11 @@ class NotificationListResource(Resource):
             'success': True,
             'message': 'Successfully deleted all notifications.',
         }
+
+
+class NotificationExportResource(Resource):
+    @user_auth
+    def get(self):
+        return export_response(
+            Notification, 'notifications', filters=decoded_qs(),
+            user_id=current_user().id)
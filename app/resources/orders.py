@@ -1,19 +1,82 @@
-from flask import request
+from flask import request, current_app
 from datetime import date
 from flask_restful import Resource
-from app.models import OrderStatus, Order, MenuItem, Notification
-from app.requests.orders import PostRequest, PutRequest
+from app import db, inventory, reservations
+from app.models import (OrderStatus, Order, OrderIntake, MenuItem,
+                        Notification)
+from app.requests.orders import (PostRequest, PutRequest, BatchPostRequest,
+                                 BatchPutRequest, CheckoutRequest)
 from app.middlewares.auth import user_auth, admin_auth
 from app.utils import current_user
-from app.middlewares.validation import validate
+from app.middlewares.validation import validate, validate_batch
+from app.middlewares.idempotency import idempotent
+from app.middlewares.concurrency import etag, if_match, retry_on_conflict
 from app.utils import decoded_qs
+from app.utils.export import export_response
+
+
+def received_notification(order, user_id):
+    """Notification of a newly placed order"""
+    message = """Your order (#{}) for
+        {} with {} items was successfully received.""".format(
+        order.id, order.menu_item.meal.name, order.quantity)
+    return Notification.make({
+        'user_id': user_id,
+        'title': 'Order(#{}) recieved'.format(order.id),
+        'message': message
+    })
+
+
+def checkout_notification(orders, user_id):
+    """One notification for all the orders of a checkout"""
+    ids = ', '.join('#{}'.format(order.id) for order in orders)
+    message = """Your orders ({}) for
+        {} with {} items were successfully received.""".format(
+        ids, ', '.join(order.menu_item.meal.name for order in orders),
+        sum(order.quantity for order in orders))
+    return Notification.make({
+        'user_id': user_id,
+        'title': 'Orders({}) recieved'.format(ids),
+        'message': message
+    })
+
+
+def updated_notification(order, previous_status):
+    """Notification of an order updated by its owner or with its status
+    changed by the admin"""
+    # check if order status has been changed by the admin
+    if previous_status != order.status:
+        status = ''
+        if order.status == OrderStatus.PENDING:
+            status = 'Pending'
+        elif order.status == OrderStatus.ACCEPTED:
+            status = 'Accepted'
+        else:
+            status = 'Revoked'
+        title = 'Order(#{}) status changed'.format(order.id)
+        message = """Your order (#{}) for {} with {} items
+            status has changed to {}.""".format(
+            order.id, order.menu_item.meal.name, order.quantity, status)
+
+    # use update their own order...
+    else:
+        title = 'Order(#{}) updated'.format(order.id)
+        message = """You updated your order (#{}) for
+            {} with {} items.""".format(order.id, order.menu_item.meal.name,
+                                        order.quantity)
+
+    return Notification.make({
+        'user_id': order.user_id,
+        'title': title,
+        'message': message
+    })
 
 
 class OrderResource(Resource):
     @user_auth
     def get(self, order_id):
         # exists? ...
-        order = Order.query.get(order_id)
+        order = Order.find(order_id)
         if not order:
             return {
                 'success': False,
@@ -28,14 +91,15 @@ class OrderResource(Resource):
             'success': True,
             'message': 'Order successfully retrieved.',
             'order': order.to_dict(fields=fields)
-        }
+        }, 200, etag(order)
 
     @user_auth
+    @idempotent
     @validate(PutRequest)
     def put(self, order_id):
 
         # exists? ...
-        order = Order.query.get(order_id)
+        order = Order.find(order_id)
         if not order:
             return {
                 'success': False,
@@ -50,15 +114,18 @@ class OrderResource(Resource):
                 'message': 'Unauthorized access to this order.'
             }, 401
 
+        # changed since the client read it? ...
+        if_match(order)
+
         if request.json.get('quantity'):
             # check that we have enough quantity...
-            menu_item = MenuItem.query.get(request.json['menu_item_id'])
-            available = order.quantity + menu_item.quantity
+            menu_item = MenuItem.find(request.json['menu_item_id'])
+            available = order.quantity + menu_item.available()
             if available < request.json['quantity']:
                 message = None
-                if menu_item.quantity > 0:
+                if menu_item.available() > 0:
                     message = 'Only {} more meals are available.'.format(
-                        menu_item.quantity)
+                        menu_item.available())
                 else:
                     message = 'No more orders can be made on this meal.'
                 return {
@@ -69,10 +136,9 @@ class OrderResource(Resource):
                     }
                 }, 400
 
-            # set the new quantity...
+            # set the new quantity, saved along with the order...
             menu_item.quantity = (
                 menu_item.quantity - request.json['quantity'] + order.quantity)
-            menu_item.save()
 
         # save status for comparison
         order_status = order.status
@@ -80,48 +146,21 @@ class OrderResource(Resource):
         # update...
         order.update(request.json)
 
-        # for notification
-        message = title = ''
-
-        # check if order status has been changed by the admin
-        if order_status != order.status:
-            status = ''
-            if order.status == OrderStatus.PENDING:
-                status = 'Pending'
-            elif order.status == OrderStatus.ACCEPTED:
-                status = 'Accepted'
-            else:
-                status = 'Revoked'
-            title = 'Order(#{}) status changed'.format(order.id)
-            message = """Your order (#{}) for {} with {} items
-            status has changed to {}.""".format(
-                order.id, order.menu_item.meal.name, order.quantity, status)
-
-        # use update their own order...
-        else:
-            title = 'Order(#{}) updated'.format(order.id)
-            # save notification
-            message = """You updated your order (#{}) for
-            {} with {} items.""".format(order.id, order.menu_item.meal.name,
-                                        order.quantity)
-
         # save notification
-        Notification.create({
-            'user_id': order.user_id,
-            'title': title,
-            'message': message
-        })
+        updated_notification(order, order_status).save()
 
         return {
             'success': True,
             'message': 'Order(#{}) successfully updated.'.format(order.id),
             'order': order.to_dict()
-        }
+        }, 200, etag(order)
 
     @user_auth
+    @idempotent
+    @retry_on_conflict
     def delete(self, order_id):
         # exists? ...
-        order = Order.query.get(order_id)
+        order = Order.find(order_id)
         if not order:
             return {
                 'success': False,
@@ -136,10 +175,9 @@ class OrderResource(Resource):
                 'message': 'Unauthorized access to this order.'
             }, 401
 
-        # restore quantity...
-        menu_item = MenuItem.query.get(order.menu_item_id)
+        # restore quantity, saved along with the deletion...
+        menu_item = MenuItem.find(order.menu_item_id)
         menu_item.quantity += order.quantity
-        menu_item.save()
 
         # now delete...
         order.delete()
@@ -179,7 +217,9 @@ class OrderListResource(Resource):
         return resp
 
     @user_auth
+    @idempotent
     @validate(PostRequest)
+    @retry_on_conflict
     def post(self):
 
         user = current_user()
@@ -189,16 +229,30 @@ class OrderListResource(Resource):
                 'message': 'Unauthorized to create this order.'
             }, 401
 
-        # check we have enough quantity...
-        menu_item = MenuItem.query.get(request.json['menu_item_id'])
-        if menu_item.quantity < request.json['quantity']:
+        # the user's holds on the menu item are theirs to order...
+        pair = (request.json['user_id'], request.json['menu_item_id'])
+        held = reservations.take([pair]).get(pair, 0)
+
+        # check we have enough quantity, the holds were given back...
+        menu_item = MenuItem.find(request.json['menu_item_id'])
+        available = menu_item.available()
+
+        # or sell it from this worker's allotment...
+        allotted = False
+        if current_app.config['INVENTORY_ENGINE'] and not held and \
+                not current_app.config['ORDER_INTAKE']:
+            allotted = inventory.consume(
+                menu_item.id, request.json['quantity'])
+
+        if not allotted and available < request.json['quantity']:
             message = None
-            if menu_item.quantity > 0:
-                message = 'Only {} meal(s) are available.'.format(
-                    menu_item.quantity)
+            if available > 0:
+                message = 'Only {} meal(s) are available.'.format(available)
             else:
                 message = 'No more orders can be made on this meal.'
 
+            # keep the holds...
+            db.session.rollback()
             return {
                 'success': False,
                 'message': 'Validation error.',
@@ -207,26 +261,261 @@ class OrderListResource(Resource):
                 }
             }, 400
 
-        # update quantity...
-        menu_item.quantity -= request.json['quantity']
-        menu_item.save()
+        # queue it for settlement, answering before taking the quantity...
+        if current_app.config['ORDER_INTAKE']:
+            # the holds are taken by the settlement...
+            db.session.rollback()
+            queued = OrderIntake.create({
+                'quantity': request.json['quantity'],
+                'menu_item_id': request.json['menu_item_id'],
+                'user_id': request.json['user_id'],
+            })
+            return {
+                'success': True,
+                'message': 'Order(#{}) queued.'.format(queued.id),
+                'intake': queued.to_dict()
+            }, 202, {'Location': '/api/v1/orders/intake/{}'.format(queued.id)}
+
+        # update quantity, written back later when allotted...
+        if not allotted:
+            menu_item.quantity -= request.json['quantity']
+            menu_item.save()
 
         # create order...
         order = Order.create(request.json)
 
-        message = """Your order (#{}) for
-        {} with {} items was successfully received.""".format(
-            order.id, order.menu_item.meal.name, order.quantity)
-
         # save notification
-        Notification.create({
-            'user_id': user.id,
-            'title': 'Order(#{}) recieved'.format(order.id),
-            'message': message
-        })
+        received_notification(order, user.id).save()
 
         return {
             'success': True,
             'message': 'Successfully saved order.',
             'order': order.to_dict()
         }, 201
+
+
+class OrderIntakeResource(Resource):
+    @user_auth
+    def get(self, intake_id):
+        # exists? ...
+        queued = OrderIntake.find(intake_id)
+        if not queued:
+            return {
+                'success': False,
+                'message': 'Order intake not found.',
+            }, 404
+
+        user = current_user()
+        if not user.is_admin() and user.id != queued.user_id:
+            return {
+                'success': False,
+                'message': 'Unauthorized access to this order.'
+            }, 401
+
+        # poll again later while queued, or watch the notifications...
+        headers = {}
+        if queued.is_queued():
+            headers['Retry-After'] = str(
+                current_app.config['ORDER_INTAKE_RETRY_AFTER'])
+
+        return {
+            'success': True,
+            'message': 'Order intake successfully retrieved.',
+            'intake': queued.to_dict()
+        }, 200, headers
+
+
+class OrderExportResource(Resource):
+    @user_auth
+    def get(self):
+
+        # user should export his/her orders only...
+        user = current_user()
+        user_id = None if user.is_admin() else user.id
+
+        return export_response(
+            Order, 'orders', filters=decoded_qs(), user_id=user_id)
+
+
+class OrderBatchResource(Resource):
+    @user_auth
+    @idempotent
+    @validate_batch(BatchPostRequest)
+    def post(self, batch):
+        user = current_user()
+        valid = batch.valid()
+        menu_items = {menu_item.id: menu_item for menu_item in
+                      MenuItem.query.filter(MenuItem.id.in_(
+                          {int(batch.items[index]['menu_item_id'])
+                           for index in valid}))}
+
+        for index in valid:
+            item = batch.items[index]
+            if not user.is_admin() and user.id != int(item['user_id']):
+                batch.fail(index, 'user_id',
+                           'Unauthorized to create this order.')
+                continue
+
+            # check we have enough quantity left by the previous items...
+            menu_item = menu_items[int(item['menu_item_id'])]
+            quantity = int(item['quantity'])
+            if menu_item.available() < quantity:
+                if menu_item.available() > 0:
+                    message = 'Only {} meal(s) are available.'.format(
+                        menu_item.available())
+                else:
+                    message = 'No more orders can be made on this meal.'
+                batch.fail(index, 'quantity', message)
+                continue
+            menu_item.quantity -= quantity
+        batch.check()
+
+        # create orders, their ids are needed by the notifications...
+        orders = {index: Order.make(batch.items[index])
+                  for index in batch.valid()}
+        db.session.add_all(orders.values())
+        db.session.flush()
+        Notification.save_all([received_notification(order, user.id)
+                               for order in orders.values()])
+        return batch.response('order', {
+            index: order.to_dict() for index, order in orders.items()
+        }, created=True)
+
+    @user_auth
+    @idempotent
+    @validate_batch(BatchPutRequest)
+    def put(self, batch):
+        user = current_user()
+        valid = batch.valid()
+        orders = {order.id: order for order in Order.query.filter(
+            Order.id.in_([batch.items[index]['id'] for index in valid]))}
+        menu_item_ids = {order.menu_item_id for order in orders.values()}
+        menu_item_ids.update(int(batch.items[index]['menu_item_id'])
+                             for index in valid
+                             if batch.items[index].get('menu_item_id'))
+        menu_items = {menu_item.id: menu_item for menu_item in
+                      MenuItem.query.filter(MenuItem.id.in_(menu_item_ids))}
+
+        for index in valid:
+            item = batch.items[index]
+            order = orders[item['id']]
+
+            # check user is authorized to update order
+            if not user.is_admin() and user.id != order.user_id:
+                batch.fail(index, 'id', 'Unauthorized access to this order.')
+                continue
+
+            if not item.get('quantity') and not item.get('menu_item_id'):
+                continue
+
+            # check that we have enough quantity...
+            menu_item = menu_items[
+                int(item.get('menu_item_id') or order.menu_item_id)]
+            quantity = int(item.get('quantity') or order.quantity)
+            available = menu_item.available()
+            if menu_item.id == order.menu_item_id:
+                available += order.quantity
+            if available < quantity:
+                if menu_item.available() > 0:
+                    message = 'Only {} more meals are available.'.format(
+                        menu_item.available())
+                else:
+                    message = 'No more orders can be made on this meal.'
+                batch.fail(index, 'quantity', message)
+                continue
+
+            # give back the previous quantity and take the new one...
+            menu_items[order.menu_item_id].quantity += order.quantity
+            menu_item.quantity -= quantity
+        batch.check()
+
+        saved = {}
+        notifications = []
+        for index in batch.valid():
+            order = orders[batch.items[index]['id']]
+            order_status = order.status
+            order.from_dict(batch.items[index])
+            order.menu_item = menu_items[int(order.menu_item_id)]
+            saved[index] = order
+            notifications.append(updated_notification(order, order_status))
+        Notification.save_all(notifications)
+        return batch.response('order', {
+            index: order.to_dict() for index, order in saved.items()
+        })
+
+
+class CheckoutResource(Resource):
+    @user_auth
+    @idempotent
+    @validate(CheckoutRequest)
+    def post(self):
+
+        user = current_user()
+        user_id = int(request.json.get('user_id') or user.id)
+        if not user.is_admin() and user.id != user_id:
+            return {
+                'success': False,
+                'message': 'Unauthorized to create this order.'
+            }, 401
+
+        # the quantities of every menu item in the cart...
+        quantities = {}
+        lines = {}
+        for index, item in enumerate(request.json['items']):
+            menu_item_id = int(item['menu_item_id'])
+            quantities[menu_item_id] = quantities.get(menu_item_id, 0) + \
+                int(item['quantity'])
+            lines.setdefault(menu_item_id, index)
+
+        # lock the menu items in id order so that concurrent checkouts
+        # sharing menu items cannot deadlock...
+        menu_items = MenuItem.query.filter(
+            MenuItem.id.in_(quantities)).order_by(
+                MenuItem.id).with_for_update().populate_existing().all()
+
+        # the user's holds on them are theirs to order...
+        reservations.take(
+            [(user_id, menu_item_id) for menu_item_id in quantities])
+
+        # check we have enough quantity of all of them, the holds were
+        # given back...
+        errors = {}
+        for menu_item in menu_items:
+            available = menu_item.available()
+            if available < quantities[menu_item.id]:
+                if available > 0:
+                    message = 'Only {} meal(s) are available.'.format(
+                        available)
+                else:
+                    message = 'No more orders can be made on this meal.'
+                errors['items.{}.quantity'.format(
+                    lines[menu_item.id])] = [message]
+        if errors:
+            # release the locks, keeping the holds...
+            db.session.rollback()
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': errors
+            }, 400
+
+        # update quantities and create the orders together...
+        orders = []
+        for menu_item in menu_items:
+            menu_item.quantity -= quantities[menu_item.id]
+            orders.append(Order.make({
+                'user_id': user_id,
+                'menu_item_id': menu_item.id,
+                'quantity': quantities[menu_item.id],
+            }))
+        db.session.add_all(orders)
+        db.session.flush()
+
+        # save notification
+        checkout_notification(orders, user_id).save()
+
+        return {
+            'success': True,
+            'message': 'Successfully saved {} orders.'.format(len(orders)),
+            'orders': [order.to_dict() for order in orders]
+        }, 201
@@ -0,0 +1,120 @@
+from flask import request, current_app
+from flask_restful import Resource
+from app import reservations
+from app.models import Reservation
+from app.requests.reservations import PostRequest
+from app.middlewares.auth import user_auth
+from app.middlewares.validation import validate
+from app.utils import decoded_qs, current_user
+
+
+class ReservationResource(Resource):
+    @user_auth
+    def get(self, reservation_id):
+        # exists? ...
+        reservation = Reservation.find(reservation_id)
+        if not reservation:
+            return {
+                'success': False,
+                'message': 'Reservation not found.',
+            }, 404
+
+        user = current_user()
+        if not user.is_admin() and user.id != reservation.user_id:
+            return {
+                'success': False,
+                'message': 'Unauthorized access to this reservation.'
+            }, 401
+
+        return {
+            'success': True,
+            'message': 'Reservation successfully retrieved.',
+            'reservation': reservation.to_dict()
+        }
+
+    @user_auth
+    def delete(self, reservation_id):
+        # exists? ...
+        reservation = Reservation.find(reservation_id)
+        if not reservation:
+            return {
+                'success': False,
+                'message': 'Reservation not found.',
+            }, 404
+
+        user = current_user()
+        if not user.is_admin() and user.id != reservation.user_id:
+            return {
+                'success': False,
+                'message': 'Unauthorized access to this reservation.'
+            }, 401
+
+        reservations.release(reservation)
+        return {
+            'success': True,
+            'message': 'Reservation successfully deleted.',
+        }
+
+
+class ReservationListResource(Resource):
+    @user_auth
+    def get(self):
+
+        # user should see his/her reservations only...
+        user = current_user()
+        user_id = None if user.is_admin() else user.id
+
+        resp = Reservation.paginate(
+            filters=decoded_qs(), user_id=user_id, name='reservations')
+        resp['message'] = 'Successfully retrieved reservations.'
+        resp['success'] = True
+        return resp
+
+    @user_auth
+    @validate(PostRequest)
+    def post(self):
+
+        user = current_user()
+        user_id = int(request.json.get('user_id') or user.id)
+        if not user.is_admin() and user.id != user_id:
+            return {
+                'success': False,
+                'message': 'Unauthorized to create this reservation.'
+            }, 401
+
+        # give the expired holds back before taking new ones...
+        reservations.maybe_expire()
+
+        # the quantities of every menu item in the cart...
+        quantities = {}
+        lines = {}
+        for index, item in enumerate(request.json['items']):
+            menu_item_id = int(item['menu_item_id'])
+            quantities[menu_item_id] = quantities.get(menu_item_id, 0) + \
+                int(item['quantity'])
+            lines.setdefault(menu_item_id, index)
+
+        held, short = reservations.hold(
+            user_id, quantities, current_app.config['RESERVATION_TTL'])
+        if short:
+            errors = {}
+            for menu_item_id, available in short.items():
+                if available > 0:
+                    message = 'Only {} meal(s) are available.'.format(
+                        available)
+                else:
+                    message = 'No more orders can be made on this meal.'
+                errors['items.{}.quantity'.format(
+                    lines[menu_item_id])] = [message]
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': errors
+            }, 400
+
+        return {
+            'success': True,
+            'message': 'Successfully saved {} reservations.'.format(
+                len(held)),
+            'reservations': [reservation.to_dict() for reservation in held]
+        }, 201
@@ -0,0 +1,38 @@
+from flask import current_app
+from flask_restful import Resource
+from app.middlewares.auth import admin_auth
+
+
+class SlowQueryListResource(Resource):
+    @admin_auth
+    def get(self):
+        log = current_app.extensions.get('slow_queries')
+        if log is None:
+            return {
+                'success': False,
+                'message': 'Slow query log is not enabled.',
+            }, 404
+
+        slow_queries = log.all()
+        return {
+            'success': True,
+            'message': 'Successfully retrieved slow queries.',
+            'threshold': log.threshold,
+            'total': len(slow_queries),
+            'slow_queries': slow_queries,
+        }
+
+    @admin_auth
+    def delete(self):
+        log = current_app.extensions.get('slow_queries')
+        if log is None:
+            return {
+                'success': False,
+                'message': 'Slow query log is not enabled.',
+            }, 404
+
+        log.clear()
+        return {
+            'success': True,
+            'message': 'Successfully cleared slow queries.',
+        }
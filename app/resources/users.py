@@ -5,13 +5,14 @@ from app.requests.users import PostRequest, PutRequest
 from app.middlewares.validation import validate
 from app.middlewares.auth import user_auth, admin_auth
 from app.utils import decoded_qs
+from app.utils.export import export_response
 
 
 class UserResource(Resource):
     @admin_auth
     def get(self, user_id):
         # exists? ...
-        user = User.query.get(user_id)
+        user = User.find(user_id)
 
         if not user:
             return {
@@ -33,7 +34,7 @@ class UserResource(Resource):
     @validate(PutRequest)
     def put(self, user_id):
         # check exists? ...
-        user = User.query.get(user_id)
+        user = User.find(user_id)
         if not user:
             return {
                 'success': False,
@@ -64,7 +65,7 @@ class UserResource(Resource):
     @admin_auth
     def delete(self, user_id):
         # exists? ...
-        user = User.query.get(user_id)
+        user = User.find(user_id)
         if not user:
             return {
                 'success': False,
@@ -98,9 +99,23 @@ class UserListResource(Resource):
     @admin_auth
     @validate(PostRequest)
     def post(self):
-        user = User.create(request.json)
+        user = User.create_unique(request.json)
+        if user is None:
+            return {
+                'success': False,
+                'message': 'Validation error.',
+                'errors': {
+                    'email': ['The email is already taken.']
+                }
+            }, 400
         return {
             'success': True,
             'message': 'Successfully saved user.',
             'user': user.to_dict()
         }, 201
+
+
+class UserExportResource(Resource):
+    @admin_auth
+    def get(self):
+        return export_response(User, 'users', filters=decoded_qs())
@@ -8,7 +8,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 
 
 def current_user():
-    user = User.query.filter_by(email=get_jwt_identity()).first()
+    user = User.find_by_email(get_jwt_identity())
     if not user:
         raise Exception('Authentication: current user not found')
     return user
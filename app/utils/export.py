@@ -0,0 +1,73 @@
+"""Streams model exports as NDJSON or CSV"""
+
+import io
+import csv
+import json
+from flask import Response, current_app, stream_with_context
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def flatten(item, prefix=''):
+    """Flattens nested dicts into dotted keys, lists are JSON encoded"""
+    flat = {}
+    for key, value in item.items():
+        key = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, key + '.'))
+        elif isinstance(value, list):
+            flat[key] = json.dumps(value)
+        else:
+            flat[key] = value
+    return flat
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def csv_lines(rows):
+    """CSV with the columns of the first row"""
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        row = flatten(row)
+        if writer is None:
+            writer = csv.DictWriter(
+                buffer, fieldnames=list(row), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_response(model, name, filters=None, **kwargs):
+    """Streams `model.export(filters)` in the requested `format`"""
+    fmt = (filters or {}).get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return {
+            'success': False,
+            'message': 'Validation error.',
+            'errors': {
+                'format': ['The format must be one of: {}.'.format(
+                    ', '.join(FORMATS))]
+            }
+        }, 400
+
+    rows = model.export(
+        filters=filters,
+        batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 1000),
+        **kwargs)
+    lines = csv_lines(rows) if fmt == 'csv' else ndjson_lines(rows)
+    return Response(
+        stream_with_context(lines),
+        mimetype=FORMATS[fmt],
+        headers={
+            'Content-Disposition': 'attachment; filename={}.{}'.format(
+                name, fmt)
+        })
@@ -0,0 +1,107 @@
+"""Validates many requests against the same rules at once.
+
+Every row goes through the Validator with its own rules, except for the
+`exists` and `unique` rules which would cost a query per row. Those are
+checked against sets prefetched with a single IN query per rule, and rows
+repeating a unique value already seen in the batch fail like rows taken
+in the database.
+"""
+
+from sqlalchemy import func
+from .translator import trans
+from .validator import Validator
+from app.models import (User, Meal, Menu, MenuItem, Order, Notification,
+                        PasswordReset)
+
+SET_RULES = ['exists', 'unique']
+
+
+class BatchValidator:
+    def __init__(self, rows=[], rules={}):
+        """Split the rules into per row rules and set based rules"""
+        self._rows = rows
+        self._row_rules = {}
+        self._set_rules = {}
+        for field, field_rules in rules.items():
+            row_rules = []
+            for rule in field_rules.split('|'):
+                if rule.split(':')[0] in SET_RULES:
+                    self._set_rules.setdefault(field, []).append(rule)
+                else:
+                    row_rules.append(rule)
+            self._row_rules[field] = '|'.join(row_rules)
+        self._errors = {}
+
+    def validate(self):
+        """Validates every row, returns the indexes of the valid rows"""
+        self._errors = {}
+        for index, row in enumerate(self._rows):
+            validator = Validator(rules=self._row_rules, request=row)
+            if validator.fails():
+                self._errors[index] = validator.errors()
+
+        # set based rules only for rows that passed so far
+        candidates = [index for index in range(len(self._rows))
+                      if index not in self._errors]
+        for field, rules in self._set_rules.items():
+            for rule in rules:
+                rule_name, params = rule.split(':')
+                check = getattr(self, '_' + rule_name)
+                candidates = check(field, params, candidates)
+        return candidates
+
+    def errors(self):
+        """Errors of the failed rows keyed by their index"""
+        return self._errors
+
+    def _fail(self, index, field, message):
+        self._errors.setdefault(index, {}).setdefault(field, []).append(
+            message)
+
+    def _values(self, field, candidates):
+        return {self._rows[index][field] for index in candidates
+                if self._rows[index].get(field)}
+
+    def _exists(self, field, params, candidates):
+        model_name, column = params.split(',')
+        model = eval(model_name)
+        column = getattr(model, column)
+        values = self._values(field, candidates)
+        found = set()
+        if values:
+            found = {str(value) for value, in model.query.with_entities(
+                column).filter(column.in_(values))}
+
+        passed = []
+        for index in candidates:
+            value = self._rows[index].get(field)
+            if value and str(value) not in found:
+                self._fail(index, field, trans('exists', {':field:': field}))
+            else:
+                passed.append(index)
+        return passed
+
+    def _unique(self, field, params, candidates):
+        model_name, column = params.split(',')
+        model = eval(model_name)
+        column = getattr(model, column)
+        values = {str(value).lower()
+                  for value in self._values(field, candidates)}
+        taken = set()
+        if values:
+            taken = {value.lower() for value, in model.query.with_entities(
+                column).filter(func.lower(column).in_(values))}
+
+        passed = []
+        for index in candidates:
+            value = self._rows[index].get(field)
+            if not value:
+                passed.append(index)
+                continue
+            value = str(value).lower()
+            if value in taken:
+                self._fail(index, field, trans('unique', {':field:': field}))
+            else:
+                taken.add(value)
+                passed.append(index)
+        return passed
@@ -1,6 +1,7 @@
 import re
 import json
 from datetime import date
+from sqlalchemy import func
 from .translator import trans
 from app.models import (User, Meal, Menu, MenuItem, Order, Notification,
                         PasswordReset)
@@ -103,6 +104,11 @@ class Validator:
             return (False, trans('alpha_num', {':field:': field}))
         return True, ''
 
+    def _array(self, field=None, **kwargs):
+        if not isinstance(self._request[field], list):
+            return (False, trans('array', {':field:': field}))
+        return (True, '')
+
     def _before(self, field=None, params=None, **kwargs):
         field_date = self.__to_date(self._request[field])
         if not field_date:
@@ -206,7 +212,7 @@ class Validator:
     def _exists(self, field=None, params=None, **kwargs):
         modelName, column = params.split(',')
         model = eval(modelName)
-        if not model.query.filter_by(**{column: self._request[field]}).first():
+        if not model.find_by(column, self._request[field]):
             return (False, trans('exists', {':field:': field}))
         return (True, '')
 
@@ -361,7 +367,9 @@ class Validator:
     def _unique(self, field=None, params=None, **kwargs):
         modelName, column = params.split(',')
         model = eval(modelName)
-        predicate = getattr(model, column).ilike(self._request[field])
+        # compared like the lower() unique indexes do
+        predicate = func.lower(getattr(model, column)) == \
+            str(self._request[field]).lower()
         if model.query.filter(predicate).first():
             return (False, trans('unique', {':field:': field}))
         return (True, '')
@@ -0,0 +1,27 @@
+"""Seeds a reproducible dataset for the load tests.
+
+The data comes from the bulk generator behind `manage.py generate`.
+Every seeded user signs in with PASSWORD, the first `admins` users are
+caterers, and the hot items are today's menu items of the most popular
+meals.
+"""
+
+from app.generator import Generator, DISHES
+
+PASSWORD = 'secret'
+
+
+def seed(users=200, admins=5, meals=40, menus=6, items_per_menu=8,
+         orders=5000, hot_items=3, stock=100000, days=30, rand_seed=42):
+    """Fills the database with the dataset, must run in an app context"""
+    generated = Generator(
+        users=users, admins=admins, meals=meals, menus=menus,
+        items_per_menu=items_per_menu, days=days, orders=orders,
+        stock=stock, rand_seed=rand_seed, domain='load.test',
+        password=PASSWORD, progress=None).run()
+    return {
+        'admins': generated['admins'],
+        'users': generated['users'] or generated['admins'],
+        'menu_items': generated['today_items'],
+        'hot_items': generated['today_items'][:hot_items],
+    }
@@ -0,0 +1,301 @@
+"""Lunch rush load test against a locally started gunicorn.
+
+Seeds a dataset, starts gunicorn on a local database and drives a mix of
+virtual users browsing menus, ordering the same few hot menu items,
+editing their orders, polling notifications and, for admins, searching
+orders and users. Throughput and p50/p95/p99 latencies are reported per
+endpoint and compared against a stored baseline:
+
+    DATABASE_URL=postgresql://localhost/bam_load python -m benchmarks.loadtest \\
+        --seed --start-server --duration 60 --concurrency 50 \\
+        --baseline benchmarks/baselines/loadtest.json
+
+Run once with --save-baseline to record the baseline. The run exits with
+status 1 when an endpoint's p95 regresses by more than --tolerance.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import subprocess
+import requests
+from collections import defaultdict
+from . import stats
+from .dataset import PASSWORD, DISHES
+
+# scenario weights of the lunch rush mix
+MIX = {
+    'browse_menus': 40,
+    'poll_notifications': 25,
+    'order_hot_item': 20,
+    'edit_order': 10,
+    'admin_search': 5,
+}
+
+
+class Recorder:
+    """Latencies and status codes per endpoint, shared by the clients"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed, status):
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            self.statuses[name][status] += 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name, samples in self.latencies.items():
+            endpoints[name] = stats.summarize(samples)
+            endpoints[name]['throughput'] = round(len(samples) / elapsed, 2)
+            endpoints[name]['statuses'] = dict(self.statuses[name])
+            endpoints[name]['errors'] = sum(
+                count for status, count in self.statuses[name].items()
+                if status >= 500)
+        everything = [sample for samples in self.latencies.values()
+                      for sample in samples]
+        return {
+            'duration': round(elapsed, 2),
+            'requests': len(everything),
+            'throughput': round(len(everything) / elapsed, 2),
+            'total': stats.summarize(everything),
+            'endpoints': endpoints,
+        }
+
+
+class VirtualUser(threading.Thread):
+    """A client signed in as one user and running the scenario mix"""
+
+    def __init__(self, url, email, dataset, recorder, deadline, rand_seed,
+                 admin=False):
+        super().__init__(daemon=True)
+        self.url = url
+        self.email = email
+        self.dataset = dataset
+        self.recorder = recorder
+        self.deadline = deadline
+        self.admin = admin
+        self.rand = random.Random(rand_seed)
+        self.session = requests.Session()
+        self.user_id = None
+        self.orders = []
+
+    def call(self, name, method, path, **kwargs):
+        started = time.perf_counter()
+        res = self.session.request(method, self.url + path, **kwargs)
+        self.recorder.add(name, time.perf_counter() - started,
+                          res.status_code)
+        return res
+
+    def login(self):
+        res = self.call('POST /auth/login', 'POST', '/api/v1/auth/login',
+                        json={'email': self.email, 'password': PASSWORD})
+        body = res.json()
+        self.user_id = body['user']['id']
+        self.session.headers['Authorization'] = 'Bearer {}'.format(
+            body['access_token'])
+
+    def browse_menus(self):
+        self.call('GET /menus', 'GET', '/api/v1/menus?time=today')
+        self.call('GET /menu-items', 'GET', '/api/v1/menu-items?time=today')
+
+    def poll_notifications(self):
+        self.call('GET /notifications', 'GET', '/api/v1/notifications')
+
+    def order_hot_item(self):
+        menu_item_id = self.rand.choice(self.dataset['hot_items'])
+        res = self.call('POST /orders', 'POST', '/api/v1/orders', json={
+            'quantity': 1,
+            'user_id': self.user_id,
+            'menu_item_id': menu_item_id,
+        })
+        if res.status_code == 201:
+            self.orders.append((res.json()['order']['id'], menu_item_id))
+
+    def edit_order(self):
+        if not self.orders:
+            return self.order_hot_item()
+        order_id, menu_item_id = self.rand.choice(self.orders)
+        self.call('PUT /orders/<id>', 'PUT',
+                  '/api/v1/orders/{}'.format(order_id),
+                  json={'quantity': self.rand.randint(1, 3),
+                        'menu_item_id': menu_item_id})
+
+    def admin_search(self):
+        if not self.admin:
+            return self.browse_menus()
+        self.call('GET /orders?search', 'GET',
+                  '/api/v1/orders?time=all&search={}'.format(
+                      self.rand.choice(DISHES)))
+        self.call('GET /users?search', 'GET', '/api/v1/users?search=user1')
+
+    def run(self):
+        self.login()
+        scenarios = list(MIX)
+        weights = [MIX[name] for name in scenarios]
+        while time.time() < self.deadline:
+            scenario = self.rand.choices(scenarios, weights=weights)[0]
+            getattr(self, scenario)()
+
+
+def seed_database(database_url, **sizes):
+    """Recreates the schema and seeds the dataset"""
+    from app import create_app, db
+    from .dataset import seed
+
+    app = create_app('production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        return seed(**sizes)
+
+
+def load_dataset(database_url, admins, hot_items):
+    """Describes an already seeded database"""
+    from datetime import datetime, date, time
+    from sqlalchemy import func
+    from app import create_app, db
+    from app.models import User, UserType, MenuItem, Order
+
+    app = create_app('production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    with app.app_context():
+        users = User.query.filter(User.email.like('%@load.test')).order_by(
+            User.id).all()
+        # today's menu items, the most ordered first
+        items = [item_id for item_id, _ in db.session.query(
+            MenuItem.id, func.count(Order.id)).outerjoin(Order).filter(
+                MenuItem.created_at >= datetime.combine(
+                    date.today(), time())).group_by(MenuItem.id).order_by(
+                        func.count(Order.id).desc())]
+        return {
+            'admins': [user.email for user in users
+                       if user.role == UserType.ADMIN][:admins],
+            'users': [user.email for user in users
+                      if user.role == UserType.USER],
+            'menu_items': items,
+            'hot_items': items[:hot_items],
+        }
+
+
+def start_server(database_url, bind, workers):
+    """Starts gunicorn the way the Procfile does, on the local database"""
+    env = dict(os.environ, APP_MODE='production', DATABASE_URL=database_url)
+    server = subprocess.Popen(
+        ['gunicorn', 'run:app', '--workers', str(workers), '--bind', bind],
+        env=env)
+    url = 'http://' + bind
+    for _ in range(100):
+        try:
+            requests.get(url + '/api/v1/auth', timeout=5)
+            return server
+        except requests.RequestException:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start on ' + bind)
+
+
+def run(url, dataset, duration, concurrency, rand_seed):
+    recorder = Recorder()
+    deadline = time.time() + duration
+    clients = []
+    for index in range(concurrency):
+        admin = index % 10 == 0 and bool(dataset['admins'])
+        emails = dataset['admins'] if admin else dataset['users']
+        clients.append(VirtualUser(
+            url, emails[index % len(emails)], dataset, recorder, deadline,
+            rand_seed + index, admin=admin))
+
+    started = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return recorder.summary(time.time() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--bind', default='127.0.0.1:8000')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--start-server', action='store_true')
+    parser.add_argument('--seed', action='store_true',
+                        help='recreate the schema and seed the dataset')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--admins', type=int, default=5)
+    parser.add_argument('--meals', type=int, default=40)
+    parser.add_argument('--menus', type=int, default=6)
+    parser.add_argument('--items-per-menu', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--hot-items', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--rand-seed', type=int, default=42)
+    parser.add_argument('--output', default='loadtest-results.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    if args.seed:
+        dataset = seed_database(
+            args.database_url, users=args.users, admins=args.admins,
+            meals=args.meals, menus=args.menus,
+            items_per_menu=args.items_per_menu, orders=args.orders,
+            hot_items=args.hot_items, rand_seed=args.rand_seed)
+    else:
+        dataset = load_dataset(
+            args.database_url, args.admins, args.hot_items)
+
+    server = None
+    if args.start_server:
+        server = start_server(args.database_url, args.bind, args.workers)
+    try:
+        results = run('http://' + args.bind, dataset, args.duration,
+                      args.concurrency, args.rand_seed)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    results['config'] = {
+        key: value for key, value in vars(args).items()
+        if key not in ['database_url', 'baseline', 'save_baseline']
+    }
+    stats.save(results, args.output)
+    print('{requests} requests in {duration}s, {throughput} req/s'.format(
+        **results))
+
+    if args.baseline and args.save_baseline:
+        stats.save(results, args.baseline)
+        print('baseline saved to ' + args.baseline)
+    elif args.baseline and os.path.exists(args.baseline):
+        baseline = stats.load(args.baseline)
+        rows, regressions = stats.compare(
+            results['endpoints'], baseline['endpoints'],
+            tolerance=args.tolerance)
+        print(stats.report(rows))
+        if regressions:
+            print('{} endpoint(s) regressed by more than {:.0%}'.format(
+                len(regressions), args.tolerance))
+            return 1
+    else:
+        for name, summary in sorted(results['endpoints'].items()):
+            print('{:<22} {count:>7} p50 {p50:>8.2f}ms p95 {p95:>8.2f}ms '
+                  'p99 {p99:>8.2f}ms errors {errors}'.format(name, **summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
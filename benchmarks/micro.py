@@ -0,0 +1,331 @@
+"""Microbenchmarks of the in-process code every request runs through.
+
+Runs model serialization, data filters, request validation and the
+request helpers against an in-memory SQLite fixture, stores the timings
+as JSON and diffs them against a baseline:
+
+    python -m benchmarks.micro --baseline benchmarks/baselines/micro.json
+
+Run once with --save-baseline to record the baseline, and use --filter to
+run only the benchmarks whose name contains the given text. The run exits
+with status 1 when a benchmark's median regresses by more than --tolerance.
+"""
+
+import os
+import sys
+import time
+import argparse
+from . import stats
+
+benchmarks = []
+
+
+def benchmark(name):
+    """Registers `fn(fixture)`, which returns the callable to time"""
+    def decorator(fn):
+        benchmarks.append((name, fn))
+        return fn
+    return decorator
+
+
+class Fixture:
+    """An application on an in-memory SQLite database with a small
+    seeded dataset"""
+
+    def __init__(self):
+        os.environ.setdefault('SECRET', 'benchmark')
+        os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+        from app import create_app, db
+        from .dataset import seed
+
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.dataset = seed(users=20, admins=2, meals=20, menus=4,
+                            items_per_menu=5, orders=200)
+
+    def auth_headers(self, email):
+        from flask_jwt_extended import create_access_token
+        return {'Authorization': 'Bearer {}'.format(
+            create_access_token(identity=email))}
+
+    def close(self):
+        self.context.pop()
+
+
+def _models():
+    from app.models import Meal, Menu, MenuItem, Order
+    return Meal, Menu, MenuItem, Order
+
+
+@benchmark('BaseModel.to_dict')
+def bench_to_dict(fixture):
+    Meal = _models()[0]
+    meal = Meal.query.first()
+    return meal.to_dict
+
+
+@benchmark('BaseModel.to_dict(fields)')
+def bench_to_dict_fields(fixture):
+    Meal = _models()[0]
+    meal = Meal.query.first()
+    return lambda: meal.to_dict(fields=['name', 'cost'])
+
+
+@benchmark('MenuItem.to_dict')
+def bench_menu_item_to_dict(fixture):
+    MenuItem = _models()[2]
+    menu_item = MenuItem.query.first()
+    return menu_item.to_dict
+
+
+@benchmark('_apply_data_filters(related)')
+def bench_apply_data_filters(fixture):
+    Order = _models()[3]
+    orders = Order.query.limit(20).all()
+    filters = {'fields': 'quantity,status',
+               'related': 'user:username,email|menu_item:quantity'}
+    return lambda: Order._apply_data_filters(orders, filters)
+
+
+@benchmark('Menu._apply_data_filters')
+def bench_menu_data_filters(fixture):
+    Menu = _models()[1]
+    menus = Menu.query.all()
+    return lambda: Menu._apply_data_filters(menus, {'time': 'today'})
+
+
+def _request_payloads(fixture):
+    """A passing payload for every JsonRequest subclass"""
+    from app.models import User, PasswordReset
+
+    _, _, MenuItem, _ = _models()
+    user = User.query.filter_by(email=fixture.dataset['users'][0]).first()
+    reset = PasswordReset.query.filter_by(token='reset-token').first() or \
+        PasswordReset.create({'token': 'reset-token', 'user_id': user.id})
+    menu_item = MenuItem.query.get(fixture.dataset['menu_items'][0])
+    password = {'password': 'secret', 'password_confirmation': 'secret'}
+    return {
+        'auth.RegisterRequest': dict(
+            password, email='new@load.test', username='newbie'),
+        'auth.LoginRequest': {'email': user.email, 'password': 'secret'},
+        'auth.EmailVerificationRequest': {'token': 'unknown-token'},
+        'auth.MakePasswordResetRequest': {'email': user.email},
+        'auth.PasswordResetRequest': dict(password, token=reset.token),
+        'meals.PostRequest': {'name': 'omena', 'cost': 100,
+                              'img_url': 'http://bam.com/omena.png'},
+        'meals.PutRequest': {'name': 'omena', 'cost': 100},
+        'menu.PostRequest': {'name': 'Supper'},
+        'menu.PutRequest': {'name': 'Supper'},
+        'menu_items.PostRequest': {'quantity': 10,
+                                   'meal_id': menu_item.meal_id,
+                                   'menu_id': menu_item.menu_id},
+        'menu_items.PutRequest': {'quantity': 10},
+        'orders.PostRequest': {'quantity': 1, 'user_id': user.id,
+                               'menu_item_id': menu_item.id},
+        'orders.PutRequest': {'quantity': 2, 'menu_item_id': menu_item.id},
+        'users.PostRequest': dict(password, email='new@load.test',
+                                  username='newbie', role=2),
+        'users.PutRequest': {'username': 'renamed'},
+    }
+
+
+VALIDATED_REQUESTS = [
+    'auth.RegisterRequest', 'auth.LoginRequest',
+    'auth.EmailVerificationRequest', 'auth.MakePasswordResetRequest',
+    'auth.PasswordResetRequest', 'meals.PostRequest', 'meals.PutRequest',
+    'menu.PostRequest', 'menu.PutRequest', 'menu_items.PostRequest',
+    'menu_items.PutRequest', 'orders.PostRequest', 'orders.PutRequest',
+    'users.PostRequest', 'users.PutRequest',
+]
+
+
+def bench_validator(fixture, request_name):
+    """Validator.passes with the rules of a JsonRequest subclass"""
+    from importlib import import_module
+    from flask_jwt_extended import verify_jwt_in_request
+    from app.validation.validator import Validator
+
+    module, name = request_name.split('.')
+    Request = getattr(import_module('app.requests.' + module), name)
+    payload = _request_payloads(fixture)[request_name]
+
+    # some rules depend on the signed in user
+    headers = fixture.auth_headers(fixture.dataset['admins'][0])
+    with fixture.app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        rules = Request.rules()
+    return lambda: Validator(rules=rules, request=payload).passes()
+
+
+for request_name in VALIDATED_REQUESTS:
+    benchmarks.append((
+        'Validator.passes[{}]'.format(request_name),
+        lambda fixture, request_name=request_name: bench_validator(
+            fixture, request_name)))
+
+
+@benchmark('User.find_by_email')
+def bench_find_by_email(fixture):
+    from app.models import User
+    email = fixture.dataset['users'][0]
+    return lambda: User.find_by_email(email)
+
+
+@benchmark('User.find_by_email (unbaked)')
+def bench_find_by_email_unbaked(fixture):
+    from app import db
+    from app.models import User
+    email = fixture.dataset['users'][0]
+    return lambda: User.query.filter(
+        db.func.lower(User.email) == email.lower()).first()
+
+
+@benchmark('Blacklist.is_revoked')
+def bench_is_revoked(fixture):
+    from app.models import Blacklist
+    return lambda: Blacklist.is_revoked('unknown-jti')
+
+
+@benchmark('Blacklist.is_revoked (unbaked)')
+def bench_is_revoked_unbaked(fixture):
+    from app.models import Blacklist
+    return lambda: Blacklist.query.filter_by(
+        token='unknown-jti').first() is not None
+
+
+def _load_by_id(fixture, get):
+    """Loads a menu item by id with an empty identity map"""
+    from app import db
+    menu_item_id = fixture.dataset['menu_items'][0]
+
+    def run():
+        db.session.expunge_all()
+        get(menu_item_id)
+    return run
+
+
+@benchmark('BaseModel.find')
+def bench_find(fixture):
+    MenuItem = _models()[2]
+    return _load_by_id(fixture, MenuItem.find)
+
+
+@benchmark('BaseModel.find (unbaked)')
+def bench_find_unbaked(fixture):
+    MenuItem = _models()[2]
+    return _load_by_id(fixture, lambda ident: MenuItem.query.get(ident))
+
+
+@benchmark('clean_json_request (with request context)')
+def bench_clean_json_request(fixture):
+    from app.middlewares.clean_request import clean_json_request
+
+    cleaned = clean_json_request(lambda: None)
+    payload = {'name': '  big   beef  ', 'cost': 100, 'img_url': ''}
+
+    def run():
+        with fixture.app.test_request_context(json=payload):
+            cleaned()
+    return run
+
+
+@benchmark('decoded_qs')
+def bench_decoded_qs(fixture):
+    from app.utils import decoded_qs
+
+    context = fixture.app.test_request_context(
+        '/api/v1/orders?search=ugali%20beef&fields=quantity,status'
+        '&time=2018-07-01&related=user:username,email')
+    context.push()
+    fixture.contexts = getattr(fixture, 'contexts', []) + [context]
+    return decoded_qs
+
+
+@benchmark('str_to_date')
+def bench_str_to_date(fixture):
+    from app.utils import str_to_date
+    return lambda: str_to_date('2018-07-01')
+
+
+def measure(fn, repeat=5, min_time=0.05):
+    """Per call timings of `fn` over `repeat` calibrated rounds"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+
+    rounds.sort()
+    return {
+        'number': number,
+        'min': round(rounds[0] * 1e6, 3),
+        'median': round(rounds[len(rounds) // 2] * 1e6, 3),
+        'max': round(rounds[-1] * 1e6, 3),
+    }
+
+
+def run(names=None, repeat=5, min_time=0.05):
+    """Runs the benchmarks, timings are in microseconds per call"""
+    fixture = Fixture()
+    results = {}
+    try:
+        for name, setup in benchmarks:
+            if names and not any(part in name for part in names):
+                continue
+            results[name] = measure(setup(fixture), repeat, min_time)
+    finally:
+        for context in reversed(getattr(fixture, 'contexts', [])):
+            context.pop()
+        fixture.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--filter', action='append')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05)
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.repeat, args.min_time)
+    stats.save(results, args.output)
+
+    if args.baseline and args.save_baseline:
+        stats.save(results, args.baseline)
+        print('baseline saved to ' + args.baseline)
+    elif args.baseline and os.path.exists(args.baseline):
+        rows, regressions = stats.compare(
+            results, stats.load(args.baseline), metric='median',
+            tolerance=args.tolerance)
+        print(stats.report(rows, metric='median'))
+        if regressions:
+            print('{} benchmark(s) regressed by more than {:.0%}'.format(
+                len(regressions), args.tolerance))
+            return 1
+    else:
+        for name, timing in results.items():
+            print('{:<45} {median:>10.3f}us (min {min:.3f}us)'.format(
+                name, **timing))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
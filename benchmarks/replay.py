@@ -0,0 +1,230 @@
+"""Replays captured traffic against a local instance.
+
+Plays back the NDJSON log written by the traffic capture middleware
+(TRAFFIC_CAPTURE_FILE) keeping the recorded arrival times, divided by
+--rate to replay faster than production, and reports p50/p95/p99
+latencies per route next to the latencies recorded at capture time:
+
+    python -m benchmarks.replay traffic.ndjson --url http://127.0.0.1:8000 \\
+        --email admin@example.com --rate 4 \\
+        --baseline benchmarks/baselines/replay.json
+
+Authenticated requests are sent as the --email user and scrubbed password
+fields are replaced with --password. Bodies captured without
+TRAFFIC_CAPTURE_BODIES are synthesized from their schema: numbers are 1,
+strings random letters, emails unique and dates today's, so some replayed
+writes may be rejected where the captured ones were not. The ids in the
+recorded paths are replayed as they are, so replay against a copy of the
+captured database.
+The run exits with status 1 when a route's p95 regresses by more than
+--tolerance.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import threading
+import itertools
+import requests
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from . import stats
+from .dataset import PASSWORD
+from .loadtest import Recorder, start_server
+
+SCRUBBED = '***'
+SECRET_FIELDS = re.compile(r'password|token|secret|jwt', re.IGNORECASE)
+_emails = itertools.count()
+
+
+def load(path, limit=None):
+    """The captured requests in arrival order"""
+    records = []
+    with open(path) as log:
+        for line in log:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+            if limit and len(records) == limit:
+                break
+    records.sort(key=lambda record: record['t'])
+    return records
+
+
+def unscrub(value, password):
+    """Puts the replay password back in the scrubbed fields"""
+    if isinstance(value, dict):
+        return {key: unscrub(item, password) for key, item in value.items()}
+    if isinstance(value, list):
+        return [unscrub(item, password) for item in value]
+    return password if value == SCRUBBED else value
+
+
+def synthesize(schema, password, key=''):
+    """A body of the captured schema, see the module docstring"""
+    if isinstance(schema, dict):
+        return {field: synthesize(item, password, field)
+                for field, item in schema.items()}
+    if isinstance(schema, list):
+        return [synthesize(item, password, key) for item in schema]
+    if schema == 'number':
+        return 1
+    if schema == 'boolean':
+        return False
+    if schema != 'string':
+        return None
+    if SECRET_FIELDS.search(key):
+        return password
+    if 'email' in key:
+        return 'replay{}@example.com'.format(next(_emails))
+    if 'date' in key or key.endswith('_on'):
+        return date.today().isoformat()
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(8))
+
+
+class Replayer:
+    """Re-issues the captured requests on a pool of sessions"""
+
+    def __init__(self, url, email, password, concurrency):
+        self.url = url
+        self.email = email
+        self.password = password
+        self.concurrency = concurrency
+        self.recorder = Recorder()
+        self.recorded = Recorder()
+        self.token = None
+        self._local = threading.local()
+
+    def login(self):
+        res = requests.post(self.url + '/api/v1/auth/login', json={
+            'email': self.email, 'password': self.password})
+        res.raise_for_status()
+        self.token = res.json()['access_token']
+
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def send(self, record):
+        name = '{m} {r}'.format(**record)
+        headers = {}
+        if record.get('a') and self.token:
+            headers['Authorization'] = 'Bearer ' + self.token
+        path = record['p'] + ('?' + record['q'] if record.get('q') else '')
+        if record.get('b') is not None:
+            body = unscrub(record['b'], self.password)
+        elif record.get('s') is not None:
+            body = synthesize(record['s'], self.password)
+        else:
+            body = None
+        started = time.perf_counter()
+        res = self.session().request(
+            record['m'], self.url + path, headers=headers, json=body)
+        self.recorder.add(name, time.perf_counter() - started,
+                          res.status_code)
+        if record.get('d') is not None:
+            self.recorded.add(name, record['d'] / 1000.0,
+                              record.get('c') or 0)
+
+    def run(self, records, rate=1.0):
+        """Sends every record at its recorded offset divided by `rate`"""
+        if self.email:
+            self.login()
+        if not records:
+            return self.recorder.summary(1.0)
+
+        first = records[0]['t']
+        started = time.time()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for record in records:
+                delay = started + (record['t'] - first) / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.send, record)
+        return self.recorder.summary(time.time() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('capture', help='NDJSON traffic capture')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--email', help='user the authenticated requests '
+                        'are sent as')
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='replay speed, 2 replays twice as fast')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--start-server', action='store_true')
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', default='replay-results.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    if args.rate <= 0:
+        parser.error('--rate must be positive')
+    if args.start_server and not args.database_url:
+        parser.error('--start-server needs --database-url or DATABASE_URL')
+
+    records = load(args.capture, args.limit)
+    replayer = Replayer(args.url, args.email, args.password,
+                        args.concurrency)
+
+    server = None
+    if args.start_server:
+        bind = args.url.split('://', 1)[-1]
+        server = start_server(args.database_url, bind, args.workers)
+    try:
+        results = replayer.run(records, args.rate)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    results['recorded'] = {
+        name: stats.summarize(samples)
+        for name, samples in replayer.recorded.latencies.items()
+    }
+    results['config'] = {
+        key: value for key, value in vars(args).items()
+        if key not in ['database_url', 'password', 'baseline',
+                       'save_baseline']
+    }
+    stats.save(results, args.output)
+    print('{requests} requests in {duration}s, {throughput} req/s'.format(
+        **results))
+
+    if args.baseline and args.save_baseline:
+        stats.save(results, args.baseline)
+        print('baseline saved to ' + args.baseline)
+    elif args.baseline and os.path.exists(args.baseline):
+        baseline = stats.load(args.baseline)
+        rows, regressions = stats.compare(
+            results['endpoints'], baseline['endpoints'],
+            tolerance=args.tolerance)
+        print(stats.report(rows))
+        if regressions:
+            print('{} route(s) regressed by more than {:.0%}'.format(
+                len(regressions), args.tolerance))
+            return 1
+    else:
+        for name, summary in sorted(results['endpoints'].items()):
+            recorded = results['recorded'].get(name, {})
+            print('{:<32} {count:>7} p50 {p50:>8.2f}ms p95 {p95:>8.2f}ms '
+                  'p99 {p99:>8.2f}ms errors {errors} (captured p95 '
+                  '{recorded:.2f}ms)'.format(
+                      name, recorded=recorded.get('p95', 0.0), **summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
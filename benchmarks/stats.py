@@ -0,0 +1,74 @@
+"""Summaries of timing samples and their comparison with a baseline"""
+
+import json
+import math
+
+
+def percentile(samples, pct):
+    """Nearest rank percentile of unsorted samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(math.ceil(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(samples):
+    """Timing summary of samples given in seconds, reported in ms"""
+    if not samples:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0,
+                'p99': 0.0, 'max': 0.0}
+    return {
+        'count': len(samples),
+        'mean': round(sum(samples) / len(samples) * 1000, 3),
+        'p50': round(percentile(samples, 50) * 1000, 3),
+        'p95': round(percentile(samples, 95) * 1000, 3),
+        'p99': round(percentile(samples, 99) * 1000, 3),
+        'max': round(max(samples) * 1000, 3),
+    }
+
+
+def save(results, path):
+    with open(path, 'w') as out:
+        json.dump(results, out, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as source:
+        return json.load(source)
+
+
+def compare(current, baseline, metric='p95', tolerance=0.10):
+    """Compares the `metric` of every named summary against the baseline.
+
+    Returns (rows, regressions) where every row is
+    (name, baseline, current, change) and the regressions are the rows
+    slower than the baseline by more than `tolerance`.
+    """
+    rows = []
+    regressions = []
+    for name in sorted(current):
+        now = current[name].get(metric)
+        before = baseline.get(name, {}).get(metric)
+        if not before:
+            rows.append((name, None, now, None))
+            continue
+        change = (now - before) / before
+        row = (name, before, now, change)
+        rows.append(row)
+        if change > tolerance:
+            regressions.append(row)
+    return rows, regressions
+
+
+def report(rows, metric='p95'):
+    """Table of the rows returned by `compare`"""
+    lines = ['{:<45} {:>12} {:>12} {:>9}'.format(
+        'name', 'baseline ' + metric, 'current', 'change')]
+    for name, before, now, change in rows:
+        lines.append('{:<45} {:>12} {:>12} {:>9}'.format(
+            name,
+            '-' if before is None else '{:.3f}'.format(before),
+            '{:.3f}'.format(now),
+            '-' if change is None else '{:+.1%}'.format(change)))
+    return '\n'.join(lines)
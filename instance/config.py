@@ -23,6 +23,119 @@ class Config(object):
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
 
+    # per request query counts, timings and N+1 warnings
+    QUERY_PROFILER = os.getenv('QUERY_PROFILER') == '1'
+    QUERY_PROFILER_N_PLUS_ONE = int(os.getenv('QUERY_PROFILER_N_PLUS_ONE', 3))
+
+    # request spans, kept in memory and appended to TRACING_FILE
+    TRACING = os.getenv('TRACING') == '1'
+    TRACING_FILE = os.getenv('TRACING_FILE')
+    TRACING_BUFFER = 100
+
+    # sampling profiles requested through a signed X-Profile header
+    PROFILE_TOKEN_MAX_AGE = 300
+    PROFILE_SAMPLE_INTERVAL = 0.001
+
+    # queries slower than SLOW_QUERY_THRESHOLD seconds and their plans
+    SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG') == '1'
+    SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.5))
+    SLOW_QUERY_FILE = os.getenv('SLOW_QUERY_FILE')
+    SLOW_QUERY_BUFFER = 100
+    SLOW_QUERY_EXPLAIN = True
+    SLOW_QUERY_EXPLAIN_ANALYZE = os.getenv('SLOW_QUERY_EXPLAIN_ANALYZE') == '1'
+
+    # tracemalloc based memory monitor, sizes in bytes
+    MEMORY_MONITOR = os.getenv('MEMORY_MONITOR') == '1'
+    MEMORY_GROWTH_THRESHOLD = int(
+        os.getenv('MEMORY_GROWTH_THRESHOLD', 10 * 1024 * 1024))
+    MEMORY_CEILING = int(os.getenv('MEMORY_CEILING', 0)) or None
+    MEMORY_REPORT_TOP = 10
+    MEMORY_TRACE_FRAMES = 1
+
+    # rows read per server side cursor fetch by the export endpoints
+    EXPORT_BATCH_SIZE = 1000
+
+    # most items accepted by the batch endpoints
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 100))
+
+    # responses of requests sent with an Idempotency-Key, in seconds,
+    # duplicates of one in flight are retried after IDEMPOTENCY_RETRY_AFTER
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+    IDEMPOTENCY_LOCK_TIMEOUT = 60
+    IDEMPOTENCY_RETRY_AFTER = 1
+    IDEMPOTENCY_PURGE_INTERVAL = 5 * 60
+
+    # attempts of the writers retried on version conflicts
+    CONFLICT_RETRIES = 3
+
+    # queue POST /orders for `manage.py settle_orders` instead of placing
+    # the order right away, queued intakes are polled again after
+    # ORDER_INTAKE_RETRY_AFTER seconds
+    ORDER_INTAKE = os.getenv('ORDER_INTAKE') == '1'
+    ORDER_INTAKE_BATCH_SIZE = int(os.getenv('ORDER_INTAKE_BATCH_SIZE', 500))
+    ORDER_INTAKE_INTERVAL = 0.2
+    ORDER_INTAKE_RETRY_AFTER = 1
+
+    # cart holds on menu item stock, expired ones are swept by every
+    # worker at most every RESERVATION_SWEEP_INTERVAL seconds, in seconds
+    RESERVATION_TTL = int(os.getenv('RESERVATION_TTL', 10 * 60))
+    RESERVATION_SWEEP_INTERVAL = 30
+
+    # sell hot menu items from per worker allotments written back to the
+    # menu items by a timer every INVENTORY_FLUSH_INTERVAL seconds, see
+    # app.inventory
+    INVENTORY_ENGINE = os.getenv('INVENTORY_ENGINE') == '1'
+    INVENTORY_ALLOTMENT = int(os.getenv('INVENTORY_ALLOTMENT', 20))
+    INVENTORY_FLUSH_INTERVAL = 1
+    INVENTORY_LEASE_TIMEOUT = 10
+
+    # where the cached values live: memory (this worker), sqlite (this
+    # host) or redis (every node), see app.cache, TTL in seconds
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 300))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+    CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'bam:')
+    CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', '/tmp/bam-cache.db')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_REDIS_TIMEOUT = 1
+
+    # evict the rows changed by a worker from the caches of the others,
+    # through NOTIFY on PostgreSQL, polled every CACHE_BUS_POLL_INTERVAL
+    # seconds on SQLite, see app.cache.bus
+    CACHE_BUS = os.getenv('CACHE_BUS') == '1'
+    CACHE_BUS_CHANNEL = 'cache_invalidation'
+    CACHE_BUS_POLL_INTERVAL = 0.5
+
+    # seconds the revocation check of a token is cached, 0 to not cache it
+    REVOCATION_CACHE_TTL = int(os.getenv('REVOCATION_CACHE_TTL', 0))
+
+    # cache the menus, menu items and meals lists, computed by a single
+    # request at a time, serving them RESPONSE_CACHE_STALE seconds past
+    # their TTL while recomputing and refreshing them early with the beta
+    # RESPONSE_CACHE_EARLY_REFRESH, 0 to disable either, see
+    # app.middlewares.coalescing
+    RESPONSE_CACHE = os.getenv('RESPONSE_CACHE') == '1'
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 30))
+    RESPONSE_CACHE_STALE = int(os.getenv('RESPONSE_CACHE_STALE', 10))
+    RESPONSE_CACHE_EARLY_REFRESH = float(
+        os.getenv('RESPONSE_CACHE_EARLY_REFRESH', 1.0))
+    RESPONSE_CACHE_WAIT = 5
+    RESPONSE_CACHE_LOCK_TIMEOUT = 10
+
+    # keep the serialized meals and menus in every worker, nested in the
+    # menu items and orders without a query, read again when invalidated
+    # and at least every CATALOG_CACHE_REFRESH_INTERVAL seconds, see
+    # app.cache.catalog
+    CATALOG_CACHE = os.getenv('CATALOG_CACHE') == '1'
+    CATALOG_CACHE_REFRESH_INTERVAL = int(
+        os.getenv('CATALOG_CACHE_REFRESH_INTERVAL', 60))
+
+    # sanitized NDJSON log of the API traffic for benchmarks/replay.py,
+    # the request bodies are only recorded with TRAFFIC_CAPTURE_BODIES
+    TRAFFIC_CAPTURE_FILE = os.getenv('TRAFFIC_CAPTURE_FILE')
+    TRAFFIC_CAPTURE_SAMPLE = float(os.getenv('TRAFFIC_CAPTURE_SAMPLE', 1.0))
+    TRAFFIC_CAPTURE_BODIES = os.getenv('TRAFFIC_CAPTURE_BODIES') == '1'
+
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -36,6 +149,7 @@ class DevConfig(Config):
     "Config for development"
     ENV = 'development'
     DEBUG = True
+    QUERY_PROFILER = True
 
 
 class TestingConfig(Config):
@@ -6,6 +6,10 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from app.models import User, UserType
 from app import db, create_app
+from app import catalog, intake, inventory, reservations
+from app.generator import Generator
+from app.middlewares import idempotency
+from app.profiling.sampling import make_token
 
 
 app = create_app(config_name=os.getenv('APP_MODE'))
@@ -28,5 +32,102 @@ def seed():
     print('manager: seed complete')
 
 
+@manager.option('--users', dest='users', type=int, default=1000)
+@manager.option('--admins', dest='admins', type=int, default=10)
+@manager.option('--meals', dest='meals', type=int, default=200)
+@manager.option('--menus', dest='menus', type=int, default=8)
+@manager.option('--items-per-menu', dest='items_per_menu', type=int,
+                default=10)
+@manager.option('--days', dest='days', type=int, default=365)
+@manager.option('--orders', dest='orders', type=int, default=1000000)
+@manager.option('--stock', dest='stock', type=int, default=100)
+@manager.option('--seed', dest='seed', type=int, default=42)
+@manager.option('--batch-size', dest='batch_size', type=int, default=10000)
+def generate(users, admins, meals, menus, items_per_menu, days, orders,
+             stock, seed, batch_size):
+    """Generate a large synthetic dataset for scale testing"""
+    Generator(
+        users=users, admins=admins, meals=meals, menus=menus,
+        items_per_menu=items_per_menu, days=days, orders=orders,
+        stock=stock, rand_seed=seed, batch_size=batch_size,
+        progress=lambda message: print('manager: ' + message)).run()
+    print('manager: generate complete')
+
+
+@manager.option('path')
+@manager.option('kind', choices=list(catalog.KINDS))
+@manager.option('--format', dest='fmt', choices=catalog.FORMATS)
+@manager.option('--batch-size', dest='batch_size', type=int, default=1000)
+def import_catalog(kind, path, fmt=None, batch_size=1000):
+    """Import meals, menus or menu items from a CSV or NDJSON file"""
+    fmt = fmt or catalog.guess_format(path)
+    with open(path, newline='') as source:
+        importer = catalog.Importer(kind, batch_size=batch_size).run(
+            catalog.read_rows(source, fmt))
+    for line, errors in sorted(importer.errors, key=lambda error: error[0]):
+        for field, messages in errors.items():
+            print('manager: line {}: {}: {}'.format(
+                line, field, ' '.join(messages)))
+    print('manager: imported {} {}, {} invalid, {} skipped as '
+          'duplicates'.format(importer.imported, kind, len(importer.errors),
+                              importer.skipped))
+
+
+@manager.option('path')
+@manager.option('kind', choices=list(catalog.KINDS))
+@manager.option('--format', dest='fmt', choices=catalog.FORMATS)
+@manager.option('--time', dest='time', default='all')
+def export_catalog(kind, path, fmt=None, time='all'):
+    """Export meals, menus or menu items to a CSV or NDJSON file"""
+    fmt = fmt or catalog.guess_format(path)
+    with open(path, 'w', newline='') as out:
+        count = catalog.export(kind, out, fmt, filters={'time': time})
+    print('manager: exported {} {} to {}'.format(count, kind, path))
+
+
+@manager.command
+def purge_idempotency_keys():
+    """Delete the expired Idempotency-Key responses"""
+    print('manager: purged {} idempotency keys'.format(idempotency.purge()))
+
+
+@manager.option('--batch-size', dest='batch_size', type=int)
+@manager.option('--once', dest='once', action='store_true')
+def settle_orders(batch_size=None, once=False):
+    """Settle the queued orders, forever unless --once"""
+    intake.work(
+        batch_size=batch_size or app.config['ORDER_INTAKE_BATCH_SIZE'],
+        interval=app.config['ORDER_INTAKE_INTERVAL'], once=once,
+        report=lambda settled, rejected: print(
+            'manager: settled {} orders, rejected {}'.format(
+                settled, rejected)))
+
+
+@manager.option('--batch-size', dest='batch_size', type=int, default=1000)
+@manager.option('--interval', dest='interval', type=float, default=5)
+@manager.option('--once', dest='once', action='store_true')
+def expire_reservations(batch_size=1000, interval=5, once=False):
+    """Give the quantity of expired reservations back, forever unless
+    --once"""
+    reservations.work(
+        batch_size=batch_size, interval=interval, once=once,
+        report=lambda expired: print(
+            'manager: expired {} reservations'.format(expired)))
+
+
+@manager.option('--timeout', dest='timeout', type=float)
+def reconcile_inventory(timeout=None):
+    """Write back and delete the abandoned inventory leases, all of them
+    with --timeout 0 once the workers are stopped"""
+    print('manager: reconciled {} inventory leases'.format(
+        inventory.reconcile(timeout=timeout)))
+
+
+@manager.command
+def profile_token(path):
+    """Sign a request path to be profiled through the X-Profile header"""
+    print(make_token(app, path))
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,77 @@
+"""index pack for the main access paths
+
+Databases brought up to the ordering schema by 9b0d4e2a6c15 get the
+indexes of their main access paths here. On PostgreSQL they are built
+CONCURRENTLY, on a separate autocommit connection since that cannot run
+in a transaction, so orders keep being taken while the indexes build.
+The schema revision commits first, every revision runs in its own
+transaction. An index left invalid by a failed concurrent build is
+dropped and built again.
+
+Revision ID: 3f1c9a7d2b64
+Revises: 9b0d4e2a6c15
+Create Date: 2026-10-19 09:12:40.518305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b64'
+down_revision = '9b0d4e2a6c15'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_orders_user_id_id', 'orders', ['user_id', 'id']),
+    ('ix_orders_menu_item_id', 'orders', ['menu_item_id']),
+    ('ix_notifications_user_id_id', 'notifications', ['user_id', 'id']),
+    ('ix_menu_items_menu_id_created_at', 'menu_items',
+     ['menu_id', 'created_at']),
+    ('ix_reservations_user_id_menu_item_id', 'reservations',
+     ['user_id', 'menu_item_id']),
+    ('ix_blacklist_token', 'blacklist', ['token']),
+    ('ix_users_token', 'users', ['token']),
+    ('ix_password_resets_token', 'password_resets', ['token']),
+]
+
+
+def _autocommit():
+    bind = op.get_bind()
+    return bind.engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, columns in INDEXES:
+            op.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                name, table, ', '.join(columns)))
+        return
+
+    with _autocommit() as connection:
+        for name, table, columns in INDEXES:
+            invalid = connection.execute(sa.text(
+                'SELECT 1 FROM pg_index i '
+                'JOIN pg_class c ON c.oid = i.indexrelid '
+                'WHERE c.relname = :name AND NOT i.indisvalid'),
+                name=name).scalar()
+            if invalid:
+                connection.execute(
+                    'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+            connection.execute(
+                'CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})'.format(
+                    name, table, ', '.join(columns)))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, _, _ in reversed(INDEXES):
+            op.execute('DROP INDEX IF EXISTS {}'.format(name))
+        return
+
+    with _autocommit() as connection:
+        for name, _, _ in reversed(INDEXES):
+            connection.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
@@ -0,0 +1,33 @@
+"""cache invalidations polled by the workers on SQLite
+
+Revision ID: 5e8a1f3c7b42
+Revises: 3f1c9a7d2b64
+Create Date: 2026-10-19 09:20:03.771946
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a1f3c7b42'
+down_revision = '3f1c9a7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'cache_invalidations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('sent_at', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_cache_invalidations_sent_at', 'cache_invalidations',
+                    ['sent_at'])
+
+
+def downgrade():
+    op.drop_index('ix_cache_invalidations_sent_at',
+                  table_name='cache_invalidations')
+    op.drop_table('cache_invalidations')
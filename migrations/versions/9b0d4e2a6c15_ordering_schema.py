@@ -0,0 +1,183 @@
+"""ordering schema: stock holds, intake queue, leases and versions
+
+Brings a database created with `db.create_all` from the original models
+to the schema of the ordering work: the reservations, order_intakes,
+inventory_leases and idempotency_keys tables, the reserved, allotted,
+version and served_on columns of the menu items, the version of the
+orders, and the case insensitive unique names and emails. served_on is
+backfilled from created_at before the (menu_id, meal_id, served_on)
+unique constraint is added. Databases created with `db.create_all` from
+the current models already have all of it and are stamped instead:
+`python manage.py db stamp head`.
+
+Revision ID: 9b0d4e2a6c15
+Revises:
+Create Date: 2026-10-19 09:05:12.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b0d4e2a6c15'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# (index, table, expression, unique constraint it replaces)
+LOWER_UNIQUES = [
+    ('users_lower_email_key', 'users', 'lower(email)', 'users_email_key'),
+    ('meals_lower_name_key', 'meals', 'lower(name)', 'meals_name_key'),
+    ('menus_lower_name_key', 'menus', 'lower(name)', None),
+]
+
+
+def _timestamps():
+    return [
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    ]
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+
+    # the menu items, one per menu, meal and day...
+    op.add_column('menu_items', sa.Column(
+        'reserved', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('menu_items', sa.Column(
+        'allotted', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('menu_items', sa.Column(
+        'version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('menu_items', sa.Column(
+        'served_on', sa.Date(), nullable=True))
+    op.execute(
+        'UPDATE menu_items SET served_on = {}'.format(
+            'CAST(created_at AS DATE)' if postgres else 'date(created_at)'))
+    op.execute(
+        'UPDATE menu_items SET served_on = CURRENT_DATE '
+        'WHERE served_on IS NULL')
+    with op.batch_alter_table('menu_items') as batch:
+        batch.alter_column('served_on', existing_type=sa.Date(),
+                           nullable=False,
+                           server_default=sa.text('CURRENT_DATE'))
+        batch.create_unique_constraint(
+            'menu_items_menu_id_meal_id_served_on_key',
+            ['menu_id', 'meal_id', 'served_on'])
+
+    op.add_column('orders', sa.Column(
+        'version', sa.Integer(), server_default='1', nullable=False))
+
+    # names and emails unique whatever their case, SQLite keeps the case
+    # sensitive constraint it cannot drop in place
+    for name, table, expression, replaced in LOWER_UNIQUES:
+        if replaced and postgres:
+            op.execute('ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}'.format(
+                table, replaced))
+        op.execute('CREATE UNIQUE INDEX {} ON {} ({})'.format(
+            name, table, expression))
+
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('fingerprint', sa.String(length=64), nullable=True),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('response', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'key'))
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys',
+                    ['expires_at'])
+
+    op.create_table(
+        'reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.Column('menu_item_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        *_timestamps(),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['menu_item_id'], ['menu_items.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_reservations_menu_item_id', 'reservations',
+                    ['menu_item_id'])
+    op.create_index('ix_reservations_expires_at', 'reservations',
+                    ['expires_at'])
+
+    op.create_table(
+        'order_intakes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.Column('status', sa.Integer(), nullable=True),
+        sa.Column('menu_item_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('order_id', sa.Integer(), nullable=True),
+        sa.Column('error', sa.String(length=256), nullable=True),
+        *_timestamps(),
+        sa.Column('settled_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['menu_item_id'], ['menu_items.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id'],
+                                ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_order_intakes_status', 'order_intakes', ['status'])
+
+    op.create_table(
+        'inventory_leases',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('menu_item_id', sa.Integer(), nullable=True),
+        sa.Column('worker', sa.String(length=255), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('consumed', sa.Integer(), nullable=False),
+        sa.Column('flushed', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['menu_item_id'], ['menu_items.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('menu_item_id', 'worker'))
+    op.create_index('ix_inventory_leases_heartbeat_at', 'inventory_leases',
+                    ['heartbeat_at'])
+
+
+def downgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+
+    op.drop_index('ix_inventory_leases_heartbeat_at',
+                  table_name='inventory_leases')
+    op.drop_table('inventory_leases')
+    op.drop_index('ix_order_intakes_status', table_name='order_intakes')
+    op.drop_table('order_intakes')
+    op.drop_index('ix_reservations_expires_at', table_name='reservations')
+    op.drop_index('ix_reservations_menu_item_id', table_name='reservations')
+    op.drop_table('reservations')
+    op.drop_index('ix_idempotency_keys_expires_at',
+                  table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
+
+    for name, table, expression, replaced in reversed(LOWER_UNIQUES):
+        op.execute('DROP INDEX IF EXISTS {}'.format(name))
+        if replaced and postgres:
+            column = expression[len('lower('):-1]
+            op.create_unique_constraint(replaced, table, [column])
+
+    with op.batch_alter_table('orders') as batch:
+        batch.drop_column('version')
+    with op.batch_alter_table('menu_items') as batch:
+        batch.drop_constraint('menu_items_menu_id_meal_id_served_on_key',
+                              type_='unique')
+        batch.drop_column('served_on')
+        batch.drop_column('version')
+        batch.drop_column('allotted')
+        batch.drop_column('reserved')
@@ -1,6 +1,12 @@
+import re
 import json
 import unittest
+from contextlib import contextmanager
 from app.models import User, UserType
+from app.profiling.queries import record_queries
+
+_writes = re.compile(r'^\s*(?:INSERT INTO|UPDATE) (\w+)', re.IGNORECASE)
+_reads = re.compile(r'\b(?:FROM|JOIN) (\w+)', re.IGNORECASE)
 
 
 class BaseTest(unittest.TestCase):
@@ -52,6 +58,29 @@ class BaseTest(unittest.TestCase):
                 without[field] = value
         return json.dumps(without)
 
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        """Fails when the block runs more queries than the budget"""
+        with record_queries() as recorder:
+            yield recorder
+        if recorder.count > budget:
+            self.fail('{} queries exceed the budget of {}.\n{}'.format(
+                recorder.count, budget, recorder.report()))
+
+    @contextmanager
+    def assertNoReloads(self):
+        """Fails when the block reads back a table it wrote to"""
+        with record_queries() as recorder:
+            yield recorder
+        written = set()
+        for statement, _ in recorder.queries:
+            write = _writes.match(statement)
+            if write:
+                written.add(write.group(1))
+            elif written.intersection(_reads.findall(statement)):
+                self.fail('Reads back what it wrote: {}\n{}'.format(
+                    statement, recorder.report()))
+
     def to_dict(self, res):
         return json.loads(res.get_data(as_text=True))
 
@@ -0,0 +1,391 @@
+import io
+import os
+import json
+import time
+import tempfile
+import threading
+from app import cache, create_app, db
+from app.cache import MemoryCache, SQLiteCache, RedisCache, FakeRedis, bus
+from app.cache.redis import encode, read_reply
+from app.middlewares import coalescing
+from app.models import Meal
+from app.profiling.queries import record_queries
+from .base import BaseTest, _reads
+
+
+class CacheBackendTests:
+    """Behaviour every backend shares, on a clock the tests move"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = self.create(clock=lambda: self.now, prefix='test:')
+        self.cache.clear()
+
+    def test_sets_and_gets(self):
+        self.assertIsNone(self.cache.get('meal'))
+        self.cache.set('meal', {'name': 'ugali'})
+        self.assertEqual(self.cache.get('meal'), {'name': 'ugali'})
+        self.cache.delete('meal')
+        self.assertEqual(self.cache.get('meal', 'missing'), 'missing')
+
+    def test_expires_after_ttl(self):
+        self.cache.set('meal', 'ugali', ttl=10)
+        self.now += 9
+        self.assertEqual(self.cache.get('meal'), 'ugali')
+        self.now += 1
+        self.assertIsNone(self.cache.get('meal'))
+
+    def test_adds_only_missing_keys(self):
+        self.assertTrue(self.cache.add('lock', 1, ttl=5))
+        self.assertFalse(self.cache.add('lock', 2, ttl=5))
+        self.now += 5
+        self.assertTrue(self.cache.add('lock', 3, ttl=5))
+        self.assertEqual(self.cache.get('lock'), 3)
+
+    def test_increments_counters(self):
+        self.assertEqual(self.cache.incr('version'), 1)
+        self.assertEqual(self.cache.incr('version', 5), 6)
+        self.assertEqual(self.cache.get('version'), 6)
+
+    def test_counts_hits_and_misses(self):
+        self.cache.get_or_set('meal', lambda: 'ugali')
+        self.cache.get_or_set('meal', lambda: 'beef')
+        info = self.cache.info()
+        self.assertEqual((info['hits'], info['misses'], info['sets']),
+                         (1, 1, 1))
+        self.assertEqual(info['backend'], self.cache.name)
+
+
+class TestMemoryCache(CacheBackendTests, BaseTest):
+    def create(self, **kwargs):
+        return MemoryCache(max_entries=3, **kwargs)
+
+    def test_evicts_least_recently_used(self):
+        for key in ['a', 'b', 'c']:
+            self.cache.set(key, key)
+        self.cache.get('a')
+        self.cache.set('d', 'd')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 'a')
+        self.assertEqual(self.cache.info()['evictions'], 1)
+
+
+class TestSQLiteCache(CacheBackendTests, BaseTest):
+    def create(self, **kwargs):
+        self.path = tempfile.mktemp(suffix='.db')
+        return SQLiteCache(self.path, max_entries=3, prune_every=1,
+                           **kwargs)
+
+    def test_evicts_oldest_past_max_entries(self):
+        for key in ['a', 'b', 'c', 'd']:
+            self.now += 1
+            self.cache.set(key, key)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.size(), 3)
+        self.assertEqual(self.cache.info()['evictions'], 1)
+
+    def test_is_shared_through_the_file(self):
+        self.cache.set('meal', 'ugali')
+        other = SQLiteCache(self.path, prefix='test:')
+        self.assertEqual(other.get('meal'), 'ugali')
+
+    def tearDown(self):
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class TestRedisCache(CacheBackendTests, BaseTest):
+    def create(self, **kwargs):
+        return RedisCache(FakeRedis(clock=kwargs['clock']), **kwargs)
+
+    def test_speaks_resp(self):
+        self.assertEqual(encode('GET', 'test:meal'),
+                         b'*2\r\n$3\r\nGET\r\n$9\r\ntest:meal\r\n')
+        self.assertEqual(
+            read_reply(io.BytesIO(b'*3\r\n$5\r\nugali\r\n:5\r\n$-1\r\n')),
+            [b'ugali', 5, None])
+
+    def test_skips_commands_while_the_server_is_down(self):
+        class DownRedis:
+            def execute(self, *args):
+                raise ConnectionRefusedError('Connection refused')
+
+        store = RedisCache(DownRedis())
+        self.assertIsNone(store.get('test:meal'))
+        self.assertFalse(store.add('test:meal', 'ugali'))
+        self.assertIsNone(store.incr('test:counter'))
+
+
+class TestCacheResource(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def test_reports_cache_statistics(self):
+        self.app.extensions['cache'].get('meal')
+        res = self.client.get('api/v1/cache', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['cache']['misses'], 1)
+
+        res = self.client.get('api/v1/cache', headers=self.user_headers)
+        self.assertEqual(res.status_code, 401)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+
+class TestInvalidationBus(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.app.config['REVOCATION_CACHE_TTL'] = 60
+        # the bus without its listener thread
+        self.app.extensions['cache_bus'] = bus.InvalidationBus(self.app)
+        self.client = self.app.test_client()
+        self.cache = self.app.extensions['cache']
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def test_commit_evicts_changed_rows(self):
+        res = self.client.post(
+            'api/v1/meals',
+            data=json.dumps({'name': 'ugali', 'cost': 30}),
+            headers=self.admin_headers)
+        meal_id = self.to_dict(res)['meal']['id']
+        self.cache.set(bus.key('meals', meal_id), 'stale')
+        published = self.app.extensions['cache_bus'].published
+
+        res = self.client.put(
+            'api/v1/meals/{}'.format(meal_id),
+            data=json.dumps({'cost': 40}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(self.cache.get(bus.key('meals', meal_id)))
+        self.assertEqual(self.app.extensions['cache_bus'].published,
+                         published + 1)
+
+    def test_evicts_what_other_workers_changed(self):
+        received = []
+
+        def subscriber(table, ids):
+            received.append((table, ids))
+        bus.subscribe(subscriber)
+        self.addCleanup(bus.unsubscribe, subscriber)
+        self.cache.set(bus.key('menus', 7), 'stale')
+        listener = self.app.extensions['cache_bus']
+        listener.receive(json.dumps({
+            'w': 'other:1', 't': 'menus', 'k': ['7'],
+            's': time.time() - 0.01}))
+        self.assertIsNone(self.cache.get(bus.key('menus', 7)))
+        self.assertIn(('menus', ['7']), received)
+        stats = listener.stats()
+        self.assertEqual(stats['received'], 1)
+        self.assertGreaterEqual(stats['lag_max'], 10)
+
+        # its own messages were applied on commit already
+        listener.receive(json.dumps({
+            'w': listener.worker(), 't': 'menus', 'k': ['7'],
+            's': time.time()}))
+        self.assertEqual(listener.stats()['received'], 1)
+
+    def test_logout_evicts_cached_revocation(self):
+        res = self.client.get('api/v1/auth', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(self.cache.size(), 0)
+
+        res = self.client.delete(
+            'api/v1/auth/logout', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get('api/v1/auth', headers=self.user_headers)
+        self.assertNotEqual(res.status_code, 200)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+
+class TestResponseCache(BaseTest):
+    tables = ('menus', 'menu_items', 'meals')
+
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.app.config.update(RESPONSE_CACHE=True,
+                               RESPONSE_CACHE_EARLY_REFRESH=0)
+        self.client = self.app.test_client()
+        self.cache = self.app.extensions['cache']
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def key(self, path):
+        with self.app.test_request_context(path):
+            return coalescing.response_key(self.tables, self.cache)
+
+    def test_serves_cached_response_until_a_write(self):
+        res = self.client.get('api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client.get('api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+        res = self.client.post(
+            'api/v1/menus', data=json.dumps({'name': 'Lunch'}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        res = self.client.get('api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertEqual(len(self.to_dict(res)['menus']), 1)
+
+    def test_reads_and_writes_while_the_cache_is_down(self):
+        class DownRedis:
+            def execute(self, *args):
+                raise ConnectionRefusedError('Connection refused')
+
+        self.app.extensions['cache'] = RedisCache(DownRedis())
+        res = self.client.get('api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client.post(
+            'api/v1/menus', data=json.dumps({'name': 'Lunch'}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+
+    def test_normalizes_query_string(self):
+        self.assertEqual(self.key('/api/v1/menus?page=2&limit=5'),
+                         self.key('/api/v1/menus?limit=5&page=2'))
+        self.assertNotEqual(self.key('/api/v1/menus?page=2'),
+                            self.key('/api/v1/menus?page=3'))
+
+    def test_computes_concurrent_misses_once(self):
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return {'menus': []}
+
+        results = []
+
+        def request():
+            results.append(coalescing.single_flight(
+                self.cache, 'response:menus', compute, ttl=30))
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        threads[0].start()
+        started.wait(1)
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(result[2]['X-Cache'] for result in results),
+                         ['HIT'] * 4 + ['MISS'])
+
+    def test_serves_stale_while_revalidating(self):
+        self.client.get('api/v1/menus', headers=self.user_headers)
+        key = self.key('/api/v1/menus')
+        entry = self.cache.get(key)
+        entry['expires_at'] = time.time() - 1
+        self.cache.set(key, entry)
+
+        # another request holds the lock while recomputing it
+        self.cache.add(coalescing.lock_key(key), True)
+        res = self.client.get('api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.headers['X-Cache'], 'STALE')
+
+        self.cache.delete(coalescing.lock_key(key))
+        res = self.client.get('api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        res = self.client.get('api/v1/menus', headers=self.user_headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+
+    def test_refreshes_early_closer_to_expiry(self):
+        entry = {'expires_at': 100.0, 'delta': 1.0}
+        self.assertFalse(coalescing._refresh_early(entry, 0, now=100.0))
+        self.assertTrue(coalescing._refresh_early(entry, 1.0, now=100.0))
+        self.assertFalse(coalescing._refresh_early(entry, 1.0, now=50.0))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+
+class TestCatalogCache(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.app.config['CATALOG_CACHE'] = True
+        cache.catalog.init_app(self.app)
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def post(self, path, data):
+        res = self.client.post(path, data=json.dumps(data),
+                               headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        return self.to_dict(res)
+
+    def menu_items(self):
+        res = self.client.get('api/v1/menu-items', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        return self.to_dict(res)['menu_items']
+
+    def test_nests_meals_and_menus_without_queries(self):
+        menu = self.post('api/v1/menus', {'name': 'Lunch'})['menu']
+        for name in ['ugali', 'beef']:
+            meal = self.post('api/v1/meals', {'name': name, 'cost': 30})
+            self.post('api/v1/menu-items', {
+                'menu_id': menu['id'], 'meal_id': meal['meal']['id'],
+                'quantity': 10})
+        self.menu_items()
+
+        with record_queries() as recorder:
+            menu_items = self.menu_items()
+        tables = set()
+        for statement, _ in recorder.queries:
+            tables.update(_reads.findall(statement))
+        self.assertNotIn('meals', tables)
+        self.assertNotIn('menus', tables)
+        self.assertEqual(sorted(item['meal']['name'] for item in menu_items),
+                         ['beef', 'ugali'])
+        self.assertEqual(menu_items[0]['menu']['name'], 'Lunch')
+
+    def test_reads_changed_rows_again(self):
+        menu = self.post('api/v1/menus', {'name': 'Lunch'})['menu']
+        meal = self.post('api/v1/meals', {'name': 'ugali', 'cost': 30})
+        meal_id = meal['meal']['id']
+        self.post('api/v1/menu-items', {
+            'menu_id': menu['id'], 'meal_id': meal_id, 'quantity': 10})
+        self.assertEqual(self.menu_items()[0]['meal']['cost'], 30)
+        version = self.app.extensions['catalog_cache'].info()['meals'][
+            'version']
+
+        res = self.client.put(
+            'api/v1/meals/{}'.format(meal_id),
+            data=json.dumps({'cost': 40}), headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.menu_items()[0]['meal']['cost'], 40)
+        self.assertGreater(
+            self.app.extensions['catalog_cache'].info()['meals']['version'],
+            version)
+
+    def test_refreshes_tables_invalidated_without_ids(self):
+        catalog = self.app.extensions['catalog_cache']
+        with self.app.app_context():
+            self.assertIsNone(catalog.lookup(Meal, 1))
+            db.session.execute(Meal.__table__.insert().values(
+                id=1, name='ugali', cost=30))
+            db.session.commit()
+            catalog.invalidate('meals', [])
+            self.assertEqual(catalog.lookup(Meal, 1)['name'], 'ugali')
+            self.assertEqual(catalog.info()['meals']['refreshes'], 1)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
@@ -0,0 +1,73 @@
+import io
+import json
+from app import create_app, db
+from app.catalog import Importer, read_rows, export
+from app.models import Meal, Menu, MenuItem
+from .base import BaseTest
+
+
+class TestCatalog(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        with self.app.app_context():
+            db.create_all()
+
+    def load(self, kind, text, fmt='csv', batch_size=1000):
+        return Importer(kind, batch_size=batch_size).run(
+            read_rows(io.StringIO(text), fmt))
+
+    def test_imports_valid_rows_and_reports_the_others(self):
+        with self.app.app_context():
+            importer = self.load('meals', (
+                'name,cost,img_url\n'
+                'ugali,50,\n'
+                'beef,120,http://bam.com/beef.png\n'
+                ' UGALI ,40,\n'
+                'rice2,30,\n'
+                'chips,-3,\n'), batch_size=2)
+            self.assertEqual(importer.imported, 2)
+            self.assertEqual(
+                sorted(line for line, _ in importer.errors), [4, 5, 6])
+            self.assertEqual(dict(importer.errors)[4],
+                             {'name': ['The name is already taken.']})
+            self.assertEqual(Meal.query.count(), 2)
+            self.assertEqual(Meal.query.filter_by(name='beef').first().cost,
+                             120)
+
+    def test_imports_menu_items_by_name(self):
+        with self.app.app_context():
+            self.load('meals', 'name,cost\nugali,50\nbeef,120\n')
+            self.load('menus', 'name\nLunch\n')
+            importer = self.load('menu-items', '\n'.join([
+                json.dumps({'meal': 'ugali', 'menu': 'Lunch', 'quantity': 10}),
+                json.dumps({'meal': 'beef', 'menu': 'lunch', 'quantity': 5}),
+                json.dumps({'meal': 'pizza', 'menu': 'Lunch', 'quantity': 1}),
+                'not json',
+                json.dumps({'meal': 'ugali', 'menu': 'Lunch', 'quantity': 3}),
+            ]), fmt='ndjson')
+            self.assertEqual(importer.imported, 2)
+            errors = dict(importer.errors)
+            self.assertIn('meal', errors[3])
+            self.assertIn('row', errors[4])
+            self.assertEqual(errors[5], {'ids': ['Menu item must be unique.']})
+            self.assertEqual(MenuItem.query.count(), 2)
+
+    def test_exports_what_the_importer_reads(self):
+        with self.app.app_context():
+            self.load('meals', 'name,cost\nugali,50\n')
+            self.load('menus', 'name\nLunch\n')
+            self.load('menu-items', 'menu,meal,quantity\nLunch,ugali,10\n')
+
+            out = io.StringIO()
+            self.assertEqual(export('menu-items', out, 'csv'), 1)
+            self.assertEqual(out.getvalue().splitlines(),
+                             ['menu,meal,quantity', 'Lunch,ugali,10'])
+
+            out = io.StringIO()
+            self.assertEqual(export('menus', out, 'ndjson'), 1)
+            self.assertEqual(json.loads(out.getvalue()), {'name': 'Lunch'})
+            self.assertEqual(Menu.query.count(), 1)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
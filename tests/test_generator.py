@@ -0,0 +1,69 @@
+from app import create_app, db
+from app.generator import Generator
+from app.models import (User, UserType, Meal, Menu, MenuItem, Order,
+                        Notification)
+from .base import BaseTest
+
+
+class TestGenerator(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        with self.app.app_context():
+            db.create_all()
+
+    def generate(self, **kwargs):
+        options = dict(users=10, admins=2, meals=6, menus=2,
+                       items_per_menu=3, days=4, orders=100, batch_size=30,
+                       progress=None)
+        options.update(kwargs)
+        return Generator(**options).run()
+
+    def test_generates_requested_rows(self):
+        with self.app.app_context():
+            result = self.generate()
+            self.assertEqual(User.query.count(), 10)
+            self.assertEqual(
+                User.query.filter_by(role=UserType.ADMIN).count(), 2)
+            self.assertEqual(Meal.query.count(), 6)
+            self.assertEqual(Menu.query.count(), 2)
+            self.assertEqual(MenuItem.query.count(), 4 * 2 * 3)
+            self.assertEqual(Order.query.count(), 100)
+            self.assertEqual(Notification.query.count(), 100)
+            self.assertEqual(len(result['today_items']), 2 * 3)
+
+            # orders point at existing menu items and customers
+            order = Order.query.first()
+            self.assertIsNotNone(order.menu_item)
+            self.assertFalse(order.user.is_admin())
+
+    def test_generated_users_can_login(self):
+        with self.app.app_context():
+            self.generate(password='secret')
+            user = User.query.filter_by(email='user5@example.com').first()
+            self.assertTrue(user.validate_password('secret'))
+
+    def test_generates_more_users_next_to_existing_ones(self):
+        with self.app.app_context():
+            self.generate()
+            result = self.generate()
+            self.assertEqual(User.query.count(), 20)
+            self.assertEqual(result['admins'],
+                             ['user10@example.com', 'user11@example.com'])
+            self.assertEqual(len(result['users']), 8)
+
+    def test_is_deterministic(self):
+        with self.app.app_context():
+            self.generate(rand_seed=7)
+            first = [(order.menu_item_id, order.user_id, order.quantity)
+                     for order in Order.query.order_by(Order.id)]
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+            self.generate(rand_seed=7)
+            second = [(order.menu_item_id, order.user_id, order.quantity)
+                      for order in Order.query.order_by(Order.id)]
+        self.assertEqual(first, second)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
@@ -184,6 +184,72 @@ class TestMeals(BaseTest):
         self.assertIn(b'Successfully saved meal', res.data)
         return self.to_dict(res)
 
+    def test_can_create_meals_in_batch(self):
+        res = self.client.post(
+            'api/v1/meals/batch',
+            data=json.dumps([{'name': 'ugali', 'cost': 30},
+                             {'name': 'beef', 'cost': 120}]),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        results = self.to_dict(res)['results']
+        self.assertEqual([result['meal']['name'] for result in results],
+                         ['ugali', 'beef'])
+
+    def test_meals_batch_is_all_or_nothing(self):
+        res = self.client.post(
+            'api/v1/meals/batch',
+            data=json.dumps([{'name': 'ugali', 'cost': 30},
+                             {'name': 'Ugali', 'cost': 40},
+                             {'name': 'beef'}]),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 400)
+        errors = self.to_dict(res)['errors']
+        self.assertEqual(sorted(errors), ['1', '2'])
+        self.assertIn('name', errors['1'])
+        self.assertIn('cost', errors['2'])
+        res = self.client.get('api/v1/meals', headers=self.user_headers)
+        self.assertEqual(self.to_dict(res)['total'], 0)
+
+    def test_meals_batch_can_partially_succeed(self):
+        res = self.client.post(
+            'api/v1/meals/batch?mode=partial',
+            data=json.dumps([{'name': 'ugali', 'cost': 30},
+                             {'name': 'ugali', 'cost': 40}]),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 207)
+        results = self.to_dict(res)['results']
+        self.assertTrue(results[0]['success'])
+        self.assertFalse(results[1]['success'])
+        self.assertIn('name', results[1]['errors'])
+
+    def test_can_update_meals_in_batch(self):
+        res = self.client.post(
+            'api/v1/meals/batch',
+            data=json.dumps([{'name': 'ugali', 'cost': 30},
+                             {'name': 'beef', 'cost': 120}]),
+            headers=self.admin_headers)
+        ugali, beef = [result['meal']['id']
+                       for result in self.to_dict(res)['results']]
+        res = self.client.put(
+            'api/v1/meals/batch?mode=partial',
+            data=json.dumps([{'id': ugali, 'cost': 35},
+                             {'id': beef, 'name': 'UGALI'},
+                             {'id': 1000, 'cost': 10}]),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 207)
+        results = self.to_dict(res)['results']
+        self.assertEqual(results[0]['meal']['cost'], 35)
+        self.assertEqual(results[1]['errors'],
+                         {'name': ['Meal name must be unique.']})
+        self.assertIn('id', results[2]['errors'])
+
+    def test_cannot_send_a_batch_that_is_not_an_array(self):
+        res = self.client.post(
+            'api/v1/meals/batch', data=self.data(),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'Request must be a JSON array', res.data)
+
     def tearDown(self):
         with self.app.app_context():
             db.drop_all()
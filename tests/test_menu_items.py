@@ -135,6 +135,37 @@ class MenuItemTests(BaseTest):
         self.assertEqual(res.status_code, 200)
         self.assertIn(b'Menu item successfully deleted', res.data)
 
+    def test_can_create_menu_items_in_batch(self):
+        menu_id = self.create_menu()['menu']['id']
+        ugali = self.create_meal()['meal']['id']
+        beef = self.create_meal(name='beef')['meal']['id']
+        self.create_menu_item(json.dumps(
+            {'quantity': 10, 'menu_id': menu_id, 'meal_id': ugali}))
+        res = self.client.post(
+            'api/v1/menu-items/batch?mode=partial',
+            data=json.dumps([
+                {'quantity': 10, 'menu_id': menu_id, 'meal_id': beef},
+                {'quantity': 10, 'menu_id': menu_id, 'meal_id': ugali},
+                {'quantity': 20, 'menu_id': menu_id, 'meal_id': beef},
+            ]),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 207)
+        results = self.to_dict(res)['results']
+        self.assertEqual(results[0]['menu_item']['meal']['name'], 'beef')
+        for result in results[1:]:
+            self.assertEqual(result['errors'],
+                             {'ids': ['Menu item must be unique.']})
+
+    def test_can_update_menu_items_in_batch(self):
+        menu_item = self.create_menu_item(self.data())['menu_item']
+        res = self.client.put(
+            'api/v1/menu-items/batch',
+            data=json.dumps([{'id': menu_item['id'], 'quantity': 5}]),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            self.to_dict(res)['results'][0]['menu_item']['quantity'], 5)
+
     def create_menu_item(self, data):
         res = self.client.post(
             'api/v1/menu-items', data=data, headers=self.admin_headers)
@@ -1,6 +1,13 @@
 import json
-from app import create_app, db
-from app.models import User, UserType
+import hashlib
+from unittest import mock
+from datetime import datetime, timedelta
+from app import create_app, db, intake, inventory
+from app.middlewares import idempotency
+from app.profiling.queries import record_queries
+from sqlalchemy.orm.exc import StaleDataError
+from app.models import (User, UserType, IdempotencyKey, IntakeStatus,
+                        InventoryLease, MenuItem, Order, OrderStatus)
 from .base import BaseTest
 
 
@@ -8,6 +15,7 @@ class TestOrders(BaseTest):
     def setUp(self):
         self.app = create_app(config_name='testing')
         self.client = self.app.test_client()
+        inventory._leases.clear()
         with self.app.app_context():
             db.create_all()
             self.setUpAuth()
@@ -100,6 +108,40 @@ class TestOrders(BaseTest):
         self.assertEqual(res.status_code, 401)
         self.assertIn(b'Unauthorized access', res.data)
 
+    def test_stale_if_match_conflicts(self):
+        order = self.create_order()['order']
+        url = 'api/v1/orders/{}'.format(order['id'])
+        res = self.client.get(url, headers=self.user_headers)
+        self.assertEqual(res.headers['ETag'], '"{}"'.format(order['version']))
+
+        headers = dict(self.admin_headers, **{'If-Match': res.headers['ETag']})
+        res = self.client.put(
+            url, data=json.dumps({'status': OrderStatus.ACCEPTED}),
+            headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['order']['version'],
+                         order['version'] + 1)
+
+        res = self.client.put(
+            url, data=json.dumps({'status': OrderStatus.REVOKED}),
+            headers=dict(self.admin_headers, **{
+                'If-Match': '"{}"'.format(order['version'])}))
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.headers['ETag'],
+                         '"{}"'.format(order['version'] + 1))
+
+    def test_concurrent_order_update_is_stale(self):
+        order_id = self.create_order()['order']['id']
+        with self.app.app_context():
+            order = Order.query.get(order_id)
+            # another request updates it meanwhile...
+            db.session.execute(Order.__table__.update().values(
+                version=Order.__table__.c.version + 1))
+            order.status = OrderStatus.ACCEPTED
+            with self.assertRaises(StaleDataError):
+                db.session.commit()
+            db.session.rollback()
+
     def test_can_get_order(self):
         json_res = self.create_order()
         res = self.client.get(
@@ -145,6 +187,420 @@ class TestOrders(BaseTest):
         self.assertEqual(res.status_code, 401)
         self.assertIn(b'Unauthorized access', res.data)
 
+    def test_can_export_orders(self):
+        self.create_order()
+        res = self.client.get(
+            'api/v1/orders/export?time=all', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        orders = [json.loads(line)
+                  for line in res.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders[0]['quantity'], 2)
+
+    def test_can_export_orders_as_csv(self):
+        self.create_order()
+        res = self.client.get(
+            'api/v1/orders/export?format=csv&fields=quantity,status'
+            '&related=user:email', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        lines = res.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], 'quantity,status,user.email')
+        self.assertEqual(lines[1], '2,1,user@mail.com')
+
+    def test_users_export_their_own_orders_only(self):
+        self.create_order()
+        user, headers = self.authUser(email='other@mail.com')
+        res = self.client.get('api/v1/orders/export', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_data(as_text=True), '')
+
+    def test_cannot_export_orders_in_unknown_format(self):
+        res = self.client.get(
+            'api/v1/orders/export?format=xml', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'The format must be one of', res.data)
+
+    def test_can_create_orders_in_batch(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        order = {'quantity': 60, 'user_id': self.user['id'],
+                 'menu_item_id': menu_item_id}
+        res = self.client.post(
+            'api/v1/orders/batch?mode=partial',
+            data=json.dumps([order, order]), headers=self.user_headers)
+        self.assertEqual(res.status_code, 207)
+        results = self.to_dict(res)['results']
+        self.assertEqual(results[0]['order']['quantity'], 60)
+        self.assertEqual(results[1]['errors'],
+                         {'quantity': ['Only 40 meal(s) are available.']})
+
+        res = self.client.get('api/v1/notifications',
+                              headers=self.user_headers)
+        self.assertEqual(self.to_dict(res)['total'], 1)
+
+    def test_cannot_create_orders_for_others_in_batch(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        res = self.client.post(
+            'api/v1/orders/batch',
+            data=json.dumps([{'quantity': 1, 'user_id': self.admin['id'],
+                              'menu_item_id': menu_item_id}]),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'Unauthorized to create this order', res.data)
+
+    def test_can_update_orders_in_batch(self):
+        order = self.create_order()['order']
+        res = self.client.put(
+            'api/v1/orders/batch',
+            data=json.dumps([{'id': order['id'], 'quantity': 5,
+                              'status': 2}]),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        updated = self.to_dict(res)['results'][0]['order']
+        self.assertEqual(updated['quantity'], 5)
+        self.assertEqual(updated['status'], 2)
+
+        res = self.client.get(
+            'api/v1/menu-items/{}'.format(order['menu_item_id']),
+            headers=self.user_headers)
+        self.assertEqual(self.to_dict(res)['menu_item']['quantity'], 95)
+
+    def test_can_checkout_a_cart(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        other_id = self.create_menu_item(name='beef', menu='Dinner')['menu_item']['id']
+        res = self.client.post(
+            'api/v1/orders/checkout',
+            data=json.dumps({'items': [
+                {'menu_item_id': other_id, 'quantity': 1},
+                {'menu_item_id': menu_item_id, 'quantity': 2},
+                {'menu_item_id': other_id, 'quantity': 3},
+            ]}),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 201)
+        orders = self.to_dict(res)['orders']
+        self.assertEqual([(order['menu_item_id'], order['quantity'])
+                          for order in orders],
+                         [(menu_item_id, 2), (other_id, 4)])
+
+        res = self.client.get('api/v1/notifications',
+                              headers=self.user_headers)
+        notifications = self.to_dict(res)['notifications']
+        self.assertEqual(len(notifications), 1)
+        self.assertIn('with 6 items', notifications[0]['message'])
+
+    def test_checkout_for_a_user_notifies_them(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        res = self.client.post(
+            'api/v1/orders/checkout',
+            data=json.dumps({'user_id': self.user['id'], 'items': [
+                {'menu_item_id': menu_item_id, 'quantity': 2}]}),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+
+        res = self.client.get('api/v1/notifications',
+                              headers=self.user_headers)
+        self.assertEqual(len(self.to_dict(res)['notifications']), 1)
+        res = self.client.get('api/v1/notifications',
+                              headers=self.admin_headers)
+        self.assertEqual(self.to_dict(res)['total'], 0)
+
+    def test_checkout_is_all_or_nothing(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        other_id = self.create_menu_item(name='beef', menu='Dinner')['menu_item']['id']
+        res = self.client.post(
+            'api/v1/orders/checkout',
+            data=json.dumps({'items': [
+                {'menu_item_id': menu_item_id, 'quantity': 2},
+                {'menu_item_id': other_id, 'quantity': 101},
+            ]}),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.to_dict(res)['errors'], {
+            'items.1.quantity': ['Only 100 meal(s) are available.']})
+
+        res = self.client.get(
+            'api/v1/menu-items/{}'.format(menu_item_id),
+            headers=self.user_headers)
+        self.assertEqual(self.to_dict(res)['menu_item']['quantity'], 100)
+
+    def test_cannot_checkout_invalid_items(self):
+        res = self.client.post(
+            'api/v1/orders/checkout',
+            data=json.dumps({'items': [{'menu_item_id': 1000}]}),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 400)
+        errors = self.to_dict(res)['errors']
+        self.assertIn('items.0.quantity', errors)
+
+    def test_retried_order_is_created_once(self):
+        data = self.data()
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'order-1'})
+        res = self.client.post('api/v1/orders', data=data, headers=headers)
+        self.assertEqual(res.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', res.headers)
+
+        replay = self.client.post('api/v1/orders', data=data, headers=headers)
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.to_dict(replay), self.to_dict(res))
+
+        res = self.client.get('api/v1/orders', headers=self.user_headers)
+        self.assertEqual(len(self.to_dict(res)['orders']), 1)
+        menu_item_id = json.loads(data)['menu_item_id']
+        res = self.client.get(
+            'api/v1/menu-items/{}'.format(menu_item_id),
+            headers=self.user_headers)
+        self.assertEqual(self.to_dict(res)['menu_item']['quantity'], 98)
+
+    def test_cannot_reuse_idempotency_key_for_another_request(self):
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'order-1'})
+        data = json.loads(self.data())
+        res = self.client.post(
+            'api/v1/orders', data=json.dumps(data), headers=headers)
+        self.assertEqual(res.status_code, 201)
+
+        data['quantity'] = 3
+        res = self.client.post(
+            'api/v1/orders', data=json.dumps(data), headers=headers)
+        self.assertEqual(res.status_code, 422)
+
+    def test_duplicate_of_request_in_progress_conflicts(self):
+        with self.app.app_context():
+            IdempotencyKey.make({
+                'key': 'order-1',
+                'user_id': self.user['id'],
+                'fingerprint': 'in flight',
+                'expires_at': datetime.now() + timedelta(hours=1),
+            }).save()
+        data = self.data()
+        res = self.client.post(
+            'api/v1/orders', data=data,
+            headers=dict(self.user_headers, **{'Idempotency-Key': 'order-1'}))
+        self.assertEqual(res.status_code, 422)
+
+        with self.app.app_context():
+            record = IdempotencyKey.query.first()
+            record.fingerprint = hashlib.sha256(
+                b'POST/api/v1/orders?' + data.encode('utf-8')).hexdigest()
+            record.save()
+        res = self.client.post(
+            'api/v1/orders', data=data,
+            headers=dict(self.user_headers, **{'Idempotency-Key': 'order-1'}))
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+        # the retry after it completed gets its response
+        with self.app.app_context():
+            record = IdempotencyKey.query.first()
+            record.status_code = 201
+            record.response = json.dumps({'success': True})
+            record.save()
+        res = self.client.post(
+            'api/v1/orders', data=data,
+            headers=dict(self.user_headers, **{'Idempotency-Key': 'order-1'}))
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.to_dict(res), {'success': True})
+
+    def test_abandoned_idempotency_key_is_taken_over(self):
+        data = self.data()
+        with self.app.app_context():
+            record = IdempotencyKey.make({
+                'key': 'order-1',
+                'user_id': self.user['id'],
+                'fingerprint': hashlib.sha256(
+                    b'POST/api/v1/orders?' + data.encode('utf-8')).hexdigest(),
+                'expires_at': datetime.now() + timedelta(hours=1),
+            })
+            record.created_at = datetime.now() - timedelta(minutes=5)
+            record.save()
+        res = self.client.post(
+            'api/v1/orders', data=data,
+            headers=dict(self.user_headers, **{'Idempotency-Key': 'order-1'}))
+        self.assertEqual(res.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', res.headers)
+
+    def test_failed_idempotent_request_commits_nothing(self):
+        data = self.data()
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'order-1'})
+        with mock.patch('app.resources.orders.received_notification',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post('api/v1/orders', data=data, headers=headers)
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 0)
+            self.assertEqual(IdempotencyKey.query.count(), 0)
+            menu_item = MenuItem.query.get(json.loads(data)['menu_item_id'])
+            self.assertEqual(menu_item.quantity, 100)
+
+        # the retry runs it, once
+        res = self.client.post('api/v1/orders', data=data, headers=headers)
+        self.assertEqual(res.status_code, 201)
+
+    def test_taken_over_request_commits_nothing(self):
+        data = self.data()
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'order-1'})
+        with mock.patch.object(idempotency, '_complete', return_value=False):
+            res = self.client.post('api/v1/orders', data=data,
+                                   headers=headers)
+        self.assertEqual(res.status_code, 409)
+        with self.app.app_context():
+            self.assertEqual(Order.query.count(), 0)
+
+    def test_expired_idempotency_keys_are_purged(self):
+        headers = dict(self.user_headers, **{'Idempotency-Key': 'order-1'})
+        data = self.data()
+        self.client.post('api/v1/orders', data=data, headers=headers)
+        with self.app.app_context():
+            record = IdempotencyKey.query.first()
+            record.expires_at = datetime.now() - timedelta(seconds=1)
+            record.save()
+
+        res = self.client.post('api/v1/orders', data=data, headers=headers)
+        self.assertEqual(res.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', res.headers)
+
+        with self.app.app_context():
+            self.assertEqual(idempotency.purge(), 0)
+            self.assertEqual(
+                idempotency.purge(datetime.now() + timedelta(days=2)), 1)
+            self.assertEqual(IdempotencyKey.query.count(), 0)
+
+    def test_queued_orders_are_settled_first_come_first_served(self):
+        self.app.config['ORDER_INTAKE'] = True
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        ids = []
+        for quantity in [60, 50, 30]:
+            res = self.client.post(
+                'api/v1/orders',
+                data=json.dumps({
+                    'quantity': quantity,
+                    'user_id': self.user['id'],
+                    'menu_item_id': menu_item_id
+                }),
+                headers=self.user_headers)
+            self.assertEqual(res.status_code, 202)
+            queued = self.to_dict(res)['intake']
+            self.assertEqual(queued['status'], IntakeStatus.QUEUED)
+            self.assertTrue(res.headers['Location'].endswith(
+                '/orders/intake/{}'.format(queued['id'])))
+            ids.append(queued['id'])
+
+        res = self.client.get(
+            'api/v1/orders/intake/{}'.format(ids[0]),
+            headers=self.user_headers)
+        self.assertEqual(self.to_dict(res)['intake']['status'],
+                         IntakeStatus.QUEUED)
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+        with self.app.app_context():
+            with record_queries() as recorder:
+                self.assertEqual(intake.settle(), (2, 1))
+            self.assertEqual(len([
+                statement for statement, _ in recorder.queries
+                if statement.startswith('INSERT INTO orders')]), 1)
+            self.assertEqual(intake.settle(), (0, 0))
+            self.assertEqual(MenuItem.query.get(menu_item_id).quantity, 10)
+
+        statuses = []
+        for intake_id in ids:
+            res = self.client.get(
+                'api/v1/orders/intake/{}'.format(intake_id),
+                headers=self.user_headers)
+            statuses.append(self.to_dict(res)['intake'])
+        self.assertEqual([item['status'] for item in statuses], [
+            IntakeStatus.SETTLED, IntakeStatus.REJECTED, IntakeStatus.SETTLED])
+        self.assertEqual(statuses[0]['order']['quantity'], 60)
+        self.assertEqual(statuses[1]['error'],
+                         'Only 40 meal(s) are available.')
+
+        res = self.client.get('api/v1/notifications',
+                              headers=self.user_headers)
+        self.assertEqual(len(self.to_dict(res)['notifications']), 3)
+
+    def test_cannot_get_another_users_order_intake(self):
+        self.app.config['ORDER_INTAKE'] = True
+        data = json.loads(self.data())
+        data['user_id'] = self.admin['id']
+        res = self.client.post(
+            'api/v1/orders', data=json.dumps(data),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 202)
+        intake_id = self.to_dict(res)['intake']['id']
+
+        res = self.client.get(
+            'api/v1/orders/intake/{}'.format(intake_id),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 401)
+        res = self.client.get(
+            'api/v1/orders/intake/1000', headers=self.user_headers)
+        self.assertEqual(res.status_code, 404)
+
+    def test_allotted_orders_are_written_back(self):
+        self.app.config['INVENTORY_ENGINE'] = True
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        with self.app.app_context():
+            inventory.flush()
+        for _ in range(3):
+            res = self.client.post(
+                'api/v1/orders',
+                data=json.dumps({
+                    'quantity': 2,
+                    'user_id': self.user['id'],
+                    'menu_item_id': menu_item_id
+                }),
+                headers=self.user_headers)
+            self.assertEqual(res.status_code, 201)
+
+        with self.app.app_context():
+            menu_item = MenuItem.query.get(menu_item_id)
+            self.assertEqual((menu_item.quantity, menu_item.allotted),
+                             (100, 20))
+            self.assertEqual(menu_item.to_dict()['available'], 100)
+
+            self.assertEqual(inventory.flush(), 1)
+            menu_item = MenuItem.query.get(menu_item_id)
+            self.assertEqual((menu_item.quantity, menu_item.allotted),
+                             (94, 14))
+
+            self.assertEqual(inventory.reconcile(timeout=0), 1)
+            menu_item = MenuItem.query.get(menu_item_id)
+            self.assertEqual((menu_item.quantity, menu_item.allotted),
+                             (94, 0))
+
+    def test_takes_back_what_other_workers_did_not_sell(self):
+        self.app.config['INVENTORY_ENGINE'] = True
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        with self.app.app_context():
+            menu_item = MenuItem.query.get(menu_item_id)
+            menu_item.allotted = 100
+            menu_item.save()
+            InventoryLease.make({
+                'menu_item_id': menu_item_id,
+                'worker': 'idle:1',
+                'quantity': 100,
+                'consumed': 5,
+                'heartbeat_at': datetime.now(),
+            }).save()
+
+        res = self.client.post(
+            'api/v1/orders',
+            data=json.dumps({
+                'quantity': 2,
+                'user_id': self.user['id'],
+                'menu_item_id': menu_item_id
+            }),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 201)
+
+        with self.app.app_context():
+            idle = InventoryLease.query.filter_by(worker='idle:1').first()
+            self.assertEqual((idle.quantity, idle.flushed), (5, 5))
+            menu_item = MenuItem.query.get(menu_item_id)
+            self.assertEqual((menu_item.quantity, menu_item.allotted),
+                             (95, 20))
+
     def create_order(self):
         res = self.client.post(
             'api/v1/orders', data=self.data(), headers=self.user_headers)
@@ -152,12 +608,12 @@ class TestOrders(BaseTest):
         self.assertIn(b'Successfully saved order', res.data)
         return self.to_dict(res)
 
-    def create_menu_item(self):
+    def create_menu_item(self, name='ugali', menu='Lunch'):
         # create a meal
         res = self.client.post(
             'api/v1/meals',
             data=json.dumps({
-                'name': 'ugali',
+                'name': name,
                 'cost': 30,
             }),
             headers=self.admin_headers)
@@ -169,7 +625,7 @@ class TestOrders(BaseTest):
         res = self.client.post(
             'api/v1/menus',
             data=json.dumps({
-                'name': 'Lunch'
+                'name': menu
             }),
             headers=self.admin_headers)
         self.assertEqual(res.status_code, 201)
@@ -190,5 +646,6 @@ class TestOrders(BaseTest):
         return self.to_dict(res)
 
     def tearDown(self):
+        inventory._leases.clear()
         with self.app.app_context():
             db.drop_all()
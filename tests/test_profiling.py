@@ -0,0 +1,394 @@
+import os
+import json
+import tempfile
+import tracemalloc
+from urllib import parse
+from unittest import mock
+from app import create_app, db
+from app.profiling import memory, queries, sampling, slow_queries, tracing
+from app.middlewares import capture
+from benchmarks import replay
+from app.profiling.queries import normalize, record_queries
+from .base import BaseTest
+
+
+class TestQueryProfiler(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def test_normalize_collapses_literals(self):
+        self.assertEqual(
+            normalize("SELECT * FROM meals WHERE id = 5 AND name = 'x'"),
+            normalize("SELECT * FROM meals\n WHERE id = 7 AND name = 'y'"))
+        self.assertEqual(
+            normalize('SELECT * FROM meals WHERE id IN (?, ?, ?)'),
+            'SELECT * FROM meals WHERE id IN (?)')
+
+    def test_flags_repeated_queries(self):
+        with self.app.app_context():
+            with record_queries() as recorder:
+                for meal_id in range(1, 5):
+                    db.session.execute(
+                        'SELECT * FROM meals WHERE id = :id', {'id': meal_id})
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(len(recorder.repeated(threshold=3)), 1)
+        self.assertEqual(recorder.repeated(threshold=5), {})
+
+    def test_reports_query_headers(self):
+        app = create_app(config_name='testing')
+        app.config['QUERY_PROFILER'] = True
+        queries.init_app(app)
+        res = app.test_client().get(
+            'api/v1/meals', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('X-Query-Count', res.headers)
+        self.assertIn('X-Query-Time', res.headers)
+        self.assertEqual(res.headers['X-Query-Repeated'], '0')
+
+    def test_menu_items_query_budget(self):
+        for name in ['ugali', 'beef', 'rice']:
+            self.create_menu_item(name)
+        with self.assertMaxQueries(9):
+            res = self.client.get(
+                'api/v1/menu-items', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+
+    def test_orders_query_budget(self):
+        for name in ['ugali', 'beef', 'rice']:
+            menu_item = self.create_menu_item(name)
+            self.client.post(
+                'api/v1/orders',
+                data=json.dumps({
+                    'quantity': 1,
+                    'user_id': self.user['id'],
+                    'menu_item_id': menu_item['id'],
+                }),
+                headers=self.user_headers)
+        with self.assertMaxQueries(4):
+            res = self.client.get('api/v1/orders', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['total'], 3)
+
+    def test_create_meal_query_budget(self):
+        # the unique index decides, nothing is read around the INSERT
+        with self.assertMaxQueries(3):
+            res = self.client.post(
+                'api/v1/meals',
+                data=json.dumps({'name': 'ugali', 'cost': 30}),
+                headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        with self.assertMaxQueries(3):
+            res = self.client.post(
+                'api/v1/meals',
+                data=json.dumps({'name': 'Ugali', 'cost': 30}),
+                headers=self.admin_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.to_dict(res)['errors'],
+                         {'name': ['The name is already taken.']})
+
+    def test_writes_read_nothing_back(self):
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('the defaults come back with RETURNING')
+        with self.assertNoReloads():
+            res = self.client.post(
+                'api/v1/meals',
+                data=json.dumps({'name': 'ugali', 'cost': 30}),
+                headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        meal = self.to_dict(res)['meal']
+        self.assertIsNotNone(meal['created_at'])
+
+        with self.assertNoReloads():
+            res = self.client.put(
+                'api/v1/meals/{}'.format(meal['id']),
+                data=json.dumps({'cost': 40}),
+                headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+
+        with self.assertNoReloads():
+            res = self.client.post(
+                'api/v1/menus',
+                data=json.dumps({'name': 'Lunch'}),
+                headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        menu_id = self.to_dict(res)['menu']['id']
+
+        with self.assertNoReloads():
+            res = self.client.post(
+                'api/v1/menu-items',
+                data=json.dumps({'quantity': 30, 'meal_id': meal['id'],
+                                 'menu_id': menu_id}),
+                headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        menu_item = self.to_dict(res)['menu_item']
+        self.assertEqual(menu_item['meal']['name'], 'ugali')
+
+        with self.assertNoReloads():
+            res = self.client.put(
+                'api/v1/menu-items/{}'.format(menu_item['id']),
+                data=json.dumps({'quantity': 50}),
+                headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['menu_item']['quantity'], 50)
+
+        with self.assertNoReloads():
+            res = self.client.post(
+                'api/v1/orders',
+                data=json.dumps({'quantity': 2, 'user_id': self.user['id'],
+                                 'menu_item_id': menu_item['id']}),
+                headers=self.user_headers)
+        self.assertEqual(res.status_code, 201)
+        order = self.to_dict(res)['order']
+
+        with self.assertNoReloads():
+            res = self.client.put(
+                'api/v1/orders/{}'.format(order['id']),
+                data=json.dumps({'quantity': 3,
+                                 'menu_item_id': menu_item['id']}),
+                headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.to_dict(res)['order']['version'], 2)
+
+    def create_menu_item(self, name):
+        meal = self.client.post(
+            'api/v1/meals',
+            data=json.dumps({'name': name, 'cost': 30}),
+            headers=self.admin_headers)
+        menu = self.client.post(
+            'api/v1/menus',
+            data=json.dumps({'name': name + ' Lunch'}),
+            headers=self.admin_headers)
+        res = self.client.post(
+            'api/v1/menu-items',
+            data=json.dumps({
+                'quantity': 30,
+                'meal_id': self.to_dict(meal)['meal']['id'],
+                'menu_id': self.to_dict(menu)['menu']['id'],
+            }),
+            headers=self.admin_headers)
+        return self.to_dict(res)['menu_item']
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+
+class TestRequestTracing(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.app.config['TRACING'] = True
+        tracing.init_app(self.app)
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def test_traces_request_stages(self):
+        res = self.client.get('api/v1/meals', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        exporter = self.app.extensions['tracing'][0]
+        trace = exporter.traces[-1]
+        self.assertEqual(trace.trace_id, res.headers['X-Trace-Id'])
+
+        names = [span.name for span in trace.spans]
+        for name in ['auth.user', 'resource', 'serialize', 'json.encode']:
+            self.assertIn(name, names)
+
+        # every span but the root has a parent in the same trace
+        span_ids = {span.span_id for span in trace.spans}
+        for span in trace.spans[1:]:
+            self.assertIn(span.parent_id, span_ids)
+
+        otlp = trace.to_otlp()
+        spans = otlp['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual(len(spans), len(trace.spans))
+
+    def test_returns_sampling_profile_for_signed_request(self):
+        headers = dict(self.admin_headers)
+        headers[sampling.HEADER] = sampling.make_token(
+            self.app, '/api/v1/meals')
+        res = self.client.get('api/v1/meals', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Profiled-Status'], '200')
+        self.assertEqual(res.mimetype, 'text/plain')
+
+    def test_ignores_profile_token_signed_for_another_path(self):
+        headers = dict(self.admin_headers)
+        headers[sampling.HEADER] = sampling.make_token(
+            self.app, '/api/v1/users')
+        res = self.client.get('api/v1/meals', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profiled-Status', res.headers)
+        self.assertIn(b'Successfully retrieved meals', res.data)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+
+class TestSlowQueryLog(BaseTest):
+    def setUp(self):
+        self.log_file = tempfile.mktemp(suffix='.log')
+        self.app = create_app(config_name='testing')
+        self.app.config.update({
+            'SLOW_QUERY_LOG': True,
+            'SLOW_QUERY_THRESHOLD': 0,
+            'SLOW_QUERY_FILE': self.log_file,
+        })
+        slow_queries.init_app(self.app)
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def test_records_slow_queries_with_plans(self):
+        self.app.extensions['slow_queries'].clear()
+        res = self.client.get('api/v1/meals', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.get('api/v1/slow-queries', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        records = self.to_dict(res)['slow_queries']
+        meals = [record for record in records
+                 if record['endpoint'] == 'meallistresource']
+        self.assertTrue(meals)
+        self.assertIn('FROM meals', meals[0]['statement'])
+        self.assertIsInstance(meals[0]['plan'], list)
+        self.assertTrue(os.path.getsize(self.log_file) > 0)
+
+    def test_users_cannot_see_slow_queries(self):
+        res = self.client.get('api/v1/slow-queries', headers=self.user_headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_can_clear_slow_queries(self):
+        res = self.client.delete(
+            'api/v1/slow-queries', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+
+
+class TestMemoryMonitor(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.app.config.update({
+            'MEMORY_MONITOR': True,
+            'MEMORY_GROWTH_THRESHOLD': 0,
+        })
+        memory.init_app(self.app)
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def test_tracks_memory_per_endpoint(self):
+        res = self.client.get('api/v1/meals', headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.get('api/v1/memory', headers=self.admin_headers)
+        self.assertEqual(res.status_code, 200)
+        stats = self.to_dict(res)['memory']
+        self.assertIn('meallistresource', stats['endpoints'])
+        self.assertEqual(stats['endpoints']['meallistresource']['requests'], 1)
+        self.assertTrue(stats['rss'] > 0)
+
+    def test_recycles_worker_once_over_the_ceiling(self):
+        self.app.extensions['memory_monitor'].ceiling = 1
+        with mock.patch('app.profiling.memory.recycle') as recycle:
+            for _ in range(2):
+                res = self.client.get(
+                    'api/v1/meals', headers=self.user_headers)
+                res.close()
+        self.assertEqual(recycle.call_count, 1)
+
+    def test_reports_top_allocation_sites(self):
+        monitor = self.app.extensions['memory_monitor']
+        leak = [bytearray(1024) for _ in range(100)]
+        self.assertTrue(len(monitor.report()) > 0)
+        del leak
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+        tracemalloc.stop()
+
+
+class TestTrafficCapture(BaseTest):
+    def setUp(self):
+        self.capture_file = tempfile.mktemp(suffix='.ndjson')
+        self.app = create_app(config_name='testing')
+        self.app.config['TRAFFIC_CAPTURE_FILE'] = self.capture_file
+        capture.init_app(self.app)
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+
+    def records(self):
+        with open(self.capture_file) as log:
+            return [json.loads(line) for line in log]
+
+    def test_records_request_shapes(self):
+        res = self.client.get(
+            '/api/v1/orders/5?fields=quantity&time=today&search=ugali',
+            headers=self.admin_headers)
+        res.close()
+        self.assertEqual(res.status_code, 404)
+        record = self.records()[-1]
+        self.assertEqual(record['m'], 'GET')
+        self.assertEqual(record['p'], '/api/v1/orders/5')
+        self.assertEqual(record['r'], '/api/v1/orders/<id>')
+        self.assertEqual(parse.parse_qsl(record['q']), [
+            ('fields', 'quantity'), ('time', 'today'), ('search', '***')])
+        self.assertTrue(record['a'])
+        self.assertEqual(record['c'], 404)
+        self.assertIn('d', record)
+
+    def test_records_body_schemas_only(self):
+        res = self.client.post('/api/v1/auth/login?token=abc', data=json.dumps(
+            {'email': 'user@mail.com', 'password': 'secret'}),
+            headers={'Content-Type': 'application/json'})
+        res.close()
+        self.assertEqual(res.status_code, 200)
+        record = self.records()[-1]
+        self.assertNotIn('secret', json.dumps(record))
+        self.assertNotIn('user@mail.com', json.dumps(record))
+        self.assertNotIn('abc', record['q'])
+        self.assertNotIn('b', record)
+        self.assertEqual(record['s'], {'email': 'string',
+                                       'password': 'string'})
+        self.assertFalse(record['a'])
+
+        body = replay.synthesize(record['s'], 'secret')
+        self.assertEqual(body['password'], 'secret')
+        self.assertTrue(body['email'].endswith('@example.com'))
+        self.assertEqual(capture.schema({'items': [{'quantity': 2}] * 3}),
+                         {'items': [{'quantity': 'number'}] * 3})
+
+    def test_scrubs_passwords_from_recorded_bodies(self):
+        self.app.wsgi_app.bodies = True
+        res = self.client.post('/api/v1/auth/login', data=json.dumps(
+            {'email': 'user@mail.com', 'password': 'secret'}),
+            headers={'Content-Type': 'application/json'})
+        res.close()
+        record = self.records()[-1]
+        self.assertNotIn('secret', json.dumps(record))
+        self.assertEqual(record['b'], {'email': 'user@mail.com',
+                                       'password': '***'})
+        self.assertEqual(replay.unscrub(record['b'], 'secret')['password'],
+                         'secret')
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+        if os.path.exists(self.capture_file):
+            os.remove(self.capture_file)
@@ -0,0 +1,82 @@
+import json
+from app import create_app, db
+from app.generator import Generator
+from app.models import Order
+from app.profiling.plans import record_plans
+from .base import BaseTest
+
+# tables growing with the users and their orders, never scanned whole
+LARGE_TABLES = ['orders', 'notifications', 'menu_items', 'users',
+                'blacklist', 'password_resets', 'order_intakes',
+                'reservations', 'idempotency_keys']
+
+
+class TestQueryPlans(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('query plans are checked on PostgreSQL')
+            db.create_all()
+            Generator(users=20, admins=2, meals=10, menus=3,
+                      items_per_menu=4, days=5, orders=500, batch_size=100,
+                      progress=None).run()
+            self.setUpAuth()
+            self.order_id = Order.query.first().id
+
+    def assertNoSequentialScans(self, method, url, headers=None, data=None):
+        """Fails when a query of the request is planned with a sequential
+        scan on a large table"""
+        with record_plans() as recorder:
+            res = getattr(self.client, method)(
+                url, data=data, headers=headers or self.user_headers)
+        self.assertLess(res.status_code, 500)
+        self.assertTrue(recorder.plans)
+        scans = recorder.sequential_scans(LARGE_TABLES)
+        if scans:
+            self.fail('{} {} scans {}'.format(method.upper(), url, '\n'.join(
+                '{}: {}'.format(table, statement)
+                for table, statement in scans)))
+
+    def test_user_orders(self):
+        self.assertNoSequentialScans('get', 'api/v1/orders')
+
+    def test_admin_orders(self):
+        self.assertNoSequentialScans(
+            'get', 'api/v1/orders', headers=self.admin_headers)
+
+    def test_order(self):
+        self.assertNoSequentialScans(
+            'get', 'api/v1/orders/{}'.format(self.order_id),
+            headers=self.admin_headers)
+
+    def test_notifications(self):
+        self.assertNoSequentialScans('get', 'api/v1/notifications')
+
+    def test_menu_items(self):
+        self.assertNoSequentialScans('get', 'api/v1/menu-items')
+
+    def test_menus(self):
+        self.assertNoSequentialScans('get', 'api/v1/menus')
+
+    def test_reservations(self):
+        self.assertNoSequentialScans('get', 'api/v1/reservations')
+
+    def test_current_user(self):
+        self.assertNoSequentialScans('get', 'api/v1/auth')
+
+    def test_email_verification(self):
+        self.assertNoSequentialScans(
+            'post', 'api/v1/auth/verify-email',
+            data=json.dumps({'token': 'unknown'}))
+
+    def test_password_reset(self):
+        self.assertNoSequentialScans(
+            'put', 'api/v1/auth/password-reset',
+            data=json.dumps({'token': 'unknown', 'password': 'secret',
+                             'password_confirmation': 'secret'}))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
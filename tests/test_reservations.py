@@ -0,0 +1,196 @@
+import json
+from datetime import datetime, timedelta
+from app import create_app, db, reservations
+from app.models import Reservation, MenuItem
+from .base import BaseTest
+
+
+class TestReservations(BaseTest):
+    def setUp(self):
+        self.app = create_app(config_name='testing')
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            self.setUpAuth()
+        self.other, self.other_headers = self.authUser(
+            email='other@mail.com')
+
+    def test_held_quantity_is_not_available_to_others(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        self.hold(menu_item_id, 90)
+
+        res = self.client.get(
+            'api/v1/menu-items/{}'.format(menu_item_id),
+            headers=self.other_headers)
+        menu_item = self.to_dict(res)['menu_item']
+        self.assertEqual((menu_item['quantity'], menu_item['available']),
+                         (100, 10))
+
+        res = self.client.post(
+            'api/v1/orders',
+            data=json.dumps({
+                'quantity': 20,
+                'user_id': self.other['id'],
+                'menu_item_id': menu_item_id
+            }),
+            headers=self.other_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.to_dict(res)['errors'], {
+            'quantity': ['Only 10 meal(s) are available.']})
+
+    def test_order_takes_the_users_holds(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        self.hold(menu_item_id, 90)
+
+        res = self.client.post(
+            'api/v1/orders',
+            data=json.dumps({
+                'quantity': 95,
+                'user_id': self.user['id'],
+                'menu_item_id': menu_item_id
+            }),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 201)
+
+        with self.app.app_context():
+            menu_item = MenuItem.query.get(menu_item_id)
+            self.assertEqual((menu_item.quantity, menu_item.reserved), (5, 0))
+            self.assertEqual(Reservation.query.count(), 0)
+
+    def test_order_counts_the_users_holds_once(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        self.hold(menu_item_id, 90)
+
+        res = self.client.post(
+            'api/v1/orders',
+            data=json.dumps({
+                'quantity': 150,
+                'user_id': self.user['id'],
+                'menu_item_id': menu_item_id
+            }),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'Only 100 meal(s) are available', res.data)
+
+        res = self.client.post(
+            'api/v1/orders/checkout',
+            data=json.dumps({'items': [
+                {'menu_item_id': menu_item_id, 'quantity': 150}]}),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 400)
+
+        # the holds are kept
+        with self.app.app_context():
+            menu_item = MenuItem.query.get(menu_item_id)
+            self.assertEqual((menu_item.quantity, menu_item.reserved),
+                             (100, 90))
+
+    def test_checkout_takes_the_users_holds(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        self.hold(menu_item_id, 60)
+
+        res = self.client.post(
+            'api/v1/orders/checkout',
+            data=json.dumps({'items': [
+                {'menu_item_id': menu_item_id, 'quantity': 30}]}),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 201)
+
+        with self.app.app_context():
+            menu_item = MenuItem.query.get(menu_item_id)
+            self.assertEqual(menu_item.available(), 70)
+            self.assertEqual(Reservation.query.count(), 0)
+
+    def test_cart_is_held_all_or_nothing(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        other_id = self.create_menu_item(
+            name='beef', menu='Dinner')['menu_item']['id']
+        res = self.client.post(
+            'api/v1/reservations',
+            data=json.dumps({'items': [
+                {'menu_item_id': menu_item_id, 'quantity': 2},
+                {'menu_item_id': other_id, 'quantity': 101},
+            ]}),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.to_dict(res)['errors'], {
+            'items.1.quantity': ['Only 100 meal(s) are available.']})
+
+        with self.app.app_context():
+            self.assertEqual(MenuItem.query.get(menu_item_id).reserved, 0)
+            self.assertEqual(Reservation.query.count(), 0)
+
+    def test_expired_holds_are_swept(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        self.hold(menu_item_id, 40)
+        self.hold(menu_item_id, 20, headers=self.other_headers)
+
+        with self.app.app_context():
+            self.assertEqual(reservations.expire(), 0)
+            self.assertEqual(
+                reservations.expire(datetime.now() + timedelta(days=1)), 2)
+            self.assertEqual(MenuItem.query.get(menu_item_id).available(),
+                             100)
+
+    def test_can_release_own_hold_only(self):
+        menu_item_id = self.create_menu_item()['menu_item']['id']
+        reservation = self.hold(menu_item_id, 40)[0]
+
+        res = self.client.delete(
+            'api/v1/reservations/{}'.format(reservation['id']),
+            headers=self.other_headers)
+        self.assertEqual(res.status_code, 401)
+
+        res = self.client.delete(
+            'api/v1/reservations/{}'.format(reservation['id']),
+            headers=self.user_headers)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(MenuItem.query.get(menu_item_id).reserved, 0)
+
+    def hold(self, menu_item_id, quantity, headers=None):
+        res = self.client.post(
+            'api/v1/reservations',
+            data=json.dumps({'items': [
+                {'menu_item_id': menu_item_id, 'quantity': quantity}]}),
+            headers=headers or self.user_headers)
+        self.assertEqual(res.status_code, 201)
+        return self.to_dict(res)['reservations']
+
+    def create_menu_item(self, name='ugali', menu='Lunch'):
+        # create a meal
+        res = self.client.post(
+            'api/v1/meals',
+            data=json.dumps({
+                'name': name,
+                'cost': 30,
+            }),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        meal_id = self.to_dict(res)['meal']['id']
+
+        # now create a menu
+        res = self.client.post(
+            'api/v1/menus',
+            data=json.dumps({
+                'name': menu
+            }),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        menu_id = self.to_dict(res)['menu']['id']
+
+        # finally create a menu item
+        res = self.client.post(
+            'api/v1/menu-items',
+            data=json.dumps({
+                'quantity': 100,
+                'menu_id': menu_id,
+                'meal_id': meal_id
+            }),
+            headers=self.admin_headers)
+        self.assertEqual(res.status_code, 201)
+        return self.to_dict(res)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
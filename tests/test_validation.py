@@ -70,6 +70,18 @@ class TestValidator(unittest.TestCase):
         V.set_request({'field': '1234 hi there'})
         self.assertTrue(V.passes())
 
+    def test_array(self):
+        V = self.V
+        V.set_rules({'field': 'array'})
+
+        V.set_request({'field': 'abc'})
+        self.assertTrue(V.fails())
+        err_str = str(V.errors())
+        self.assertIn('array', err_str)
+
+        V.set_request({'field': [1, 2]})
+        self.assertTrue(V.passes())
+
     def test_before(self):
         V = self.V
         V.set_rules({'field': 'before:2008-01-10'})